@@ -102,6 +102,25 @@ async def get_request_id(x_request_id: Optional[str] = Header(None)) -> Optional
     return x_request_id
 
 
+async def get_idempotency_key(idempotency_key: Optional[str] = Header(None)) -> Optional[str]:
+    """
+    Obtiene la cabecera Idempotency-Key
+    
+    Repetir una petición con la misma clave devuelve el job creado la primera vez;
+    usarla con una petición distinta devuelve 422.
+    """
+    if idempotency_key is None:
+        return None
+    
+    idempotency_key = idempotency_key.strip()
+    if not idempotency_key or len(idempotency_key) > 255:
+        raise HTTPException(
+            status_code=400,
+            detail="Idempotency-Key debe tener entre 1 y 255 caracteres"
+        )
+    return idempotency_key
+
+
 # Validaciones de parámetros
 def validate_database_name(database: str) -> str:
     """Valida el nombre de la base de datos"""
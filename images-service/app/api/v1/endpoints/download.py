@@ -2,20 +2,20 @@
 Endpoints para gestión de descargas
 """
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Response
 from uuid import uuid4
-import httpx
 
 from app.core import logger
+from app.core.exceptions import IdempotencyKeyMismatchException
 from app.models.schemas import (
     JobCreateRequest, JobResponse, BatchDownloadRequest,
     SuccessResponse, ErrorResponse
 )
 from app.models.domain import Job, JobType, JobStatus
 from app.services.database.mongo_repository import MongoRepository
-from app.workers.tasks import process_download_job
+from app.workers.scheduler import job_scheduler
 from app.api.v1.dependencies import (
-    verify_api_key, get_db, validate_database_name,
+    verify_api_key, get_db, get_idempotency_key, validate_database_name,
     validate_collection_name, validate_document_id
 )
 
@@ -23,11 +23,36 @@ from app.api.v1.dependencies import (
 router = APIRouter(prefix="/download", tags=["download"])
 
 
+async def _create_and_submit(db: MongoRepository, job: Job, response: Response) -> Job:
+    """
+    Guarda el job y lo encola según su prioridad
+    
+    Si ya hay un job equivalente (misma Idempotency-Key, mismo objetivo aún
+    activo o la colección entera descargándose) se devuelve ese y no se crea
+    ni encola nada; la cabecera X-Job-Deduplicated lo indica al cliente.
+    Reutilizar una Idempotency-Key con otra petición devuelve 422.
+    """
+    try:
+        job, created = await db.create_or_attach_job(job)
+    except IdempotencyKeyMismatchException as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    
+    if created:
+        # Los bulk esperan a que haya hueco
+        await job_scheduler.submit(job)
+    else:
+        response.headers["X-Job-Deduplicated"] = "true"
+    
+    return job
+
+
 @router.post("/from-api-url", response_model=JobResponse)
 async def download_from_api_url(
     api_url: str,
+    response: Response,
     collection_name: Optional[str] = None,
     background_tasks: BackgroundTasks = None,
+    idempotency_key: Optional[str] = Depends(get_idempotency_key),
     api_key: str = Depends(verify_api_key),
     db: MongoRepository = Depends(get_db)
 ):
@@ -49,77 +74,44 @@ async def download_from_api_url(
             if not collection_name or collection_name == "api":
                 collection_name = "external-api-data"
         
+        if not api_url.startswith(("http://", "https://")):
+            raise HTTPException(status_code=400, detail="api_url debe ser una URL http(s)")
+        
         logger.info(
             "Iniciando descarga desde API externa",
             api_url=api_url,
             collection_name=collection_name
         )
         
-        # Obtener datos de la API externa
-        async with httpx.AsyncClient() as client:
-            response = await client.get(api_url)
-            response.raise_for_status()
-            data = response.json()
-        
-        # Extraer documentos (puede venir como 'documents', 'data', o directamente como array)
-        documents = []
-        if isinstance(data, list):
-            documents = data
-        elif isinstance(data, dict):
-            documents = data.get('documents', data.get('data', []))
-            if not documents and 'documents' not in data and 'data' not in data:
-                # Si no hay campo documents o data, asumir que es un solo documento
-                documents = [data]
-        
-        if not documents:
-            raise HTTPException(
-                status_code=400,
-                detail="No se encontraron documentos en la respuesta de la API"
-            )
-        
-        # Guardar documentos temporalmente en MongoDB
-        temp_collection = f"temp_{collection_name}_{uuid4().hex[:8]}"
-        
-        # Insertar documentos en colección temporal
-        for doc in documents:
-            await db._ensure_connected()
-            col = await db.get_collection("serpy_db", temp_collection)
-            await col.insert_one(doc)
-        
-        # Crear job para procesar la colección temporal
+        # El worker lee la API en streaming y descarga cada documento según llega,
+        # sin cargar la respuesta en memoria ni copiarla a una colección temporal
         job = Job(
             id=str(uuid4()),
-            type=JobType.DOWNLOAD_COLLECTION,
+            type=JobType.DOWNLOAD_API_URL,
             status=JobStatus.PENDING,
             database="serpy_db",
-            collection=temp_collection,
+            collection=collection_name,
+            idempotency_key=idempotency_key,
             metadata={
                 "source": "external_api",
                 "api_url": api_url,
-                "original_collection": collection_name,
-                "total_documents": len(documents),
-                "cleanup_collection": True  # Marcar para limpiar después
+                "original_collection": collection_name
             }
         )
         
-        # Guardar en base de datos
-        job = await db.create_job(job)
-        
-        # Encolar para procesamiento
-        process_download_job.delay(job.id)
+        # Guardar y encolar (o unirse a un job equivalente en curso)
+        job = await _create_and_submit(db, job, response)
         
         logger.info(
             "Job de descarga desde API creado",
             job_id=job.id,
-            api_url=api_url,
-            documents=len(documents)
+            api_url=api_url
         )
         
         return JobResponse(**job.to_dict())
         
-    except httpx.HTTPError as e:
-        logger.error("Error obteniendo datos de la API", api_url=api_url, error=str(e))
-        raise HTTPException(status_code=400, detail=f"Error accediendo a la API: {str(e)}")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error("Error creando job de descarga desde API", error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
@@ -130,6 +122,8 @@ async def download_collection(
     database: str,
     collection: str,
     background_tasks: BackgroundTasks,
+    response: Response,
+    idempotency_key: Optional[str] = Depends(get_idempotency_key),
     api_key: str = Depends(verify_api_key),
     db: MongoRepository = Depends(get_db)
 ):
@@ -163,14 +157,12 @@ async def download_collection(
             status=JobStatus.PENDING,
             database=database,
             collection=collection,
+            idempotency_key=idempotency_key,
             metadata={"source": "api", "total_documents": count}
         )
         
-        # Guardar en base de datos
-        job = await db.create_job(job)
-        
-        # Encolar para procesamiento
-        process_download_job.delay(job.id)
+        # Guardar y encolar (o unirse a un job equivalente en curso)
+        job = await _create_and_submit(db, job, response)
         
         logger.info(
             "Job de descarga de colección creado",
@@ -195,6 +187,8 @@ async def download_document(
     collection: str,
     document_id: str,
     background_tasks: BackgroundTasks,
+    response: Response,
+    idempotency_key: Optional[str] = Depends(get_idempotency_key),
     api_key: str = Depends(verify_api_key),
     db: MongoRepository = Depends(get_db)
 ):
@@ -226,14 +220,12 @@ async def download_document(
             database=database,
             collection=collection,
             document_id=document_id,
+            idempotency_key=idempotency_key,
             metadata={"source": "api"}
         )
         
-        # Guardar en base de datos
-        job = await db.create_job(job)
-        
-        # Encolar para procesamiento
-        process_download_job.delay(job.id)
+        # Guardar y encolar (o unirse a un job equivalente en curso)
+        job = await _create_and_submit(db, job, response)
         
         logger.info(
             "Job de descarga de documento creado",
@@ -256,6 +248,8 @@ async def download_document(
 async def download_batch(
     request: BatchDownloadRequest,
     background_tasks: BackgroundTasks,
+    response: Response,
+    idempotency_key: Optional[str] = Depends(get_idempotency_key),
     api_key: str = Depends(verify_api_key),
     db: MongoRepository = Depends(get_db)
 ):
@@ -293,6 +287,8 @@ async def download_batch(
             database=database,
             collection=collection,
             filter_query=request.filter,
+            priority=request.priority,
+            idempotency_key=idempotency_key,
             metadata={
                 "source": "api",
                 "limit": request.limit,
@@ -302,11 +298,8 @@ async def download_batch(
             }
         )
         
-        # Guardar en base de datos
-        job = await db.create_job(job)
-        
-        # Encolar para procesamiento
-        process_download_job.delay(job.id)
+        # Guardar y encolar (o unirse a un job equivalente en curso)
+        job = await _create_and_submit(db, job, response)
         
         logger.info(
             "Job de descarga batch creado",
@@ -1,43 +1,222 @@
 """
 Endpoint simplificado para descargar imágenes sin MongoDB
 """
-from typing import Optional
+from typing import Optional, Dict, Any, AsyncIterator, List
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from uuid import uuid4
-import httpx
-import asyncio
 from pathlib import Path
+import asyncio
+import contextlib
 import json
 from datetime import datetime
 
-from app.core import logger, settings
+from app.core import logger, settings, RateLimitedLog
+from app.core.exceptions import DownloadException
 from app.api.v1.dependencies import verify_api_key
+from app.services.download import ImageDownloader, shared_http_client
+from app.services.download.api_source import stream_api_documents
+from app.services.download.url_canonicalizer import unique_image_urls
+from app.services.storage import get_storage_service
+from app.services.storage.base import StorageService
 
 router = APIRouter(prefix="/download", tags=["download"])
 
+# Un host caído genera un aviso por imagen: se limitan por intervalo
+download_warnings = RateLimitedLog()
+
+
+def _image_urls(doc: Dict[str, Any]) -> List[Any]:
+    """Obtiene la lista de imágenes de un documento"""
+    imagenes = doc.get('imagenes', [])
+    if not imagenes:
+        for field in ['images', 'fotos', 'photos', 'galeria']:
+            if field in doc and isinstance(doc[field], list):
+                return doc[field]
+    return imagenes
+
+
+def _image_extension(url: str) -> str:
+    """Extensión del archivo según la URL"""
+    if '.png' in url.lower():
+        return '.png'
+    if '.webp' in url.lower():
+        return '.webp'
+    return '.jpg'
+
 
-async def download_image(session, url, save_path):
-    """Descarga una imagen"""
+async def download_image(
+    downloader: ImageDownloader,
+    storage: StorageService,
+    url: str,
+    save_path: Path
+) -> bool:
+    """Descarga una imagen y la guarda sin bloquear el event loop"""
     try:
-        response = await session.get(url, timeout=30.0)
-        response.raise_for_status()
-        
-        # Guardar imagen
-        save_path.parent.mkdir(parents=True, exist_ok=True)
-        save_path.write_bytes(response.content)
-        
-        logger.info(f"Imagen descargada: {save_path.name}")
+        content, _ = await downloader.download_image(url, save_path.name)
+        await storage.save_file(save_path, content)
         return True
     except Exception as e:
-        logger.error(f"Error descargando {url}: {e}")
+        download_warnings.warning("Error descargando imagen", url=url, error=str(e))
         return False
 
 
+async def download_document(
+    downloader: ImageDownloader,
+    storage: StorageService,
+    doc: Dict[str, Any],
+    doc_dir: Path,
+    base_metadata: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Descarga las imágenes de un documento y guarda su metadata.json
+    
+    Las descargas de todos los documentos comparten el semáforo global y los
+    límites por host del ImageDownloader.
+    """
+    imagenes = _image_urls(doc)
+    urls = [
+        (i, url) for i, url in enumerate(imagenes)
+        if isinstance(url, str) and url.startswith('http')
+    ]
+    if settings.image_url_canonicalize:
+        # Una descarga por imagen aunque aparezca en varios tamaños o con otra query
+        urls = list(enumerate(unique_image_urls(url for _, url in urls)))
+    
+    results = await asyncio.gather(*[
+        download_image(downloader, storage, url, doc_dir / "original" / f"img_{i+1:03d}{_image_extension(url)}")
+        for i, url in urls
+    ])
+    downloaded = sum(results)
+    
+    if imagenes:
+        metadata = {
+            **base_metadata,
+            "total_images": len(imagenes),
+            "downloaded": downloaded,
+            "timestamp": datetime.now().isoformat()
+        }
+        content = json.dumps(metadata, separators=(",", ":"), ensure_ascii=False)
+        await storage.save_file(doc_dir / "metadata.json", content.encode("utf-8"))
+    
+    return {"total_images": len(imagenes), "downloaded": downloaded}
+
+
+async def run_download(
+    documents: AsyncIterator[Dict[str, Any]],
+    api_url: str,
+    database_name: str,
+    collection_name: str,
+    job_id: str
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Descarga los documentos concurrentemente y produce un evento por documento
+    
+    Se procesan a la vez como mucho SIMPLE_DOWNLOAD_CONCURRENT_DOCUMENTS
+    documentos; el último evento ("completed") contiene el resumen.
+    """
+    storage = get_storage_service()
+    collection_path = settings.storage_path / database_name / collection_name
+    events: asyncio.Queue = asyncio.Queue()
+    document_slots = asyncio.Semaphore(settings.simple_download_concurrent_documents)
+    summary = {"documents_processed": 0, "total_images": 0, "images_downloaded": 0}
+    
+    async def process(downloader: ImageDownloader, doc: Dict[str, Any]) -> None:
+        try:
+            # Extraer ID y nombre
+            doc_id = doc.get('_id', doc.get('id', str(uuid4())))
+            nombre = doc.get('nombre_alojamiento', doc.get('titulo_h1', 'sin-nombre'))
+            doc_dir = collection_path / f"{doc_id}-{settings.sanitize_filename(nombre)}"
+            
+            result = await download_document(
+                downloader,
+                storage,
+                doc,
+                doc_dir,
+                {"document_id": str(doc_id), "nombre": nombre, "source_url": api_url, "job_id": job_id}
+            )
+            if not result["total_images"]:
+                logger.warning("No se encontraron imágenes en documento", document_id=str(doc_id))
+            
+            await events.put({"event": "document", "document_id": str(doc_id), **result})
+            
+        except Exception as e:
+            await events.put({"event": "document", "document_id": str(doc.get('_id', doc.get('id'))), "error": str(e)})
+            
+        finally:
+            document_slots.release()
+    
+    async def produce() -> None:
+        async with ImageDownloader(client=shared_http_client.get()) as downloader:
+            tasks = set()
+            try:
+                async for doc in documents:
+                    await document_slots.acquire()
+                    task = asyncio.create_task(process(downloader, doc))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                
+                await asyncio.gather(*tasks)
+                
+            except Exception as e:
+                await events.put({"event": "error", "error": str(e)})
+                
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await events.put(None)
+    
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            event = await events.get()
+            if event is None:
+                break
+            if event["event"] == "document":
+                summary["documents_processed"] += 1
+                summary["total_images"] += event.get("total_images", 0)
+                summary["images_downloaded"] += event.get("downloaded", 0)
+            yield event
+            
+    finally:
+        # Si el cliente se desconecta se abandonan las descargas pendientes
+        producer.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await producer
+    
+    logger.info(
+        "Descarga completada",
+        job_id=job_id,
+        documents=summary["documents_processed"],
+        total_images=summary["total_images"],
+        downloaded=summary["images_downloaded"]
+    )
+    
+    yield {
+        "event": "completed",
+        "id": job_id,
+        "status": "completed",
+        "api_url": api_url,
+        "database": database_name,
+        "collection": collection_name,
+        **summary,
+        "storage_path": str(collection_path)
+    }
+
+
+async def _prepend(first: Dict[str, Any], rest: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    """Vuelve a unir el primer documento (ya leído) con el resto del stream"""
+    yield first
+    async for doc in rest:
+        yield doc
+
+
 class DownloadRequest(BaseModel):
     api_url: str
     database_name: Optional[str] = None
     collection_name: Optional[str] = None
+    stream: bool = False  # Devuelve el progreso como NDJSON en lugar de esperar al final
 
 @router.post("/from-api-url-simple")
 async def download_from_api_url_simple(
@@ -52,6 +231,7 @@ async def download_from_api_url_simple(
         api_url: URL de la API que contiene los documentos con imágenes
         database_name: Nombre opcional para la base de datos (por defecto 'serpy_db')
         collection_name: Nombre opcional para la colección
+        stream: Si es True, responde con un evento NDJSON por documento descargado
         
     Returns:
         Resultado de la descarga
@@ -79,112 +259,41 @@ async def download_from_api_url_simple(
             collection_name=collection_name
         )
         
-        # Obtener datos de la API externa
-        async with httpx.AsyncClient() as client:
-            response = await client.get(api_url)
-            response.raise_for_status()
-            data = response.json()
-        
-        # Extraer documentos
-        documents = []
-        if isinstance(data, list):
-            documents = data
-        elif isinstance(data, dict):
-            documents = data.get('documents', data.get('data', []))
-            if not documents and 'documents' not in data and 'data' not in data:
-                documents = [data]
-        
-        if not documents:
+        # Leer el primer documento antes de responder: un error de la API o una
+        # respuesta vacía siguen devolviendo 400
+        documents = stream_api_documents(shared_http_client.get(), api_url)
+        try:
+            first = await documents.__anext__()
+        except StopAsyncIteration:
             raise HTTPException(
                 status_code=400,
                 detail="No se encontraron documentos en la respuesta de la API"
             )
         
-        # Procesar documentos y descargar imágenes
-        total_images = 0
-        downloaded = 0
         job_id = str(uuid4())
+        events = run_download(_prepend(first, documents), api_url, database_name, collection_name, job_id)
         
-        async with httpx.AsyncClient() as session:
-            for doc in documents:
-                # Extraer ID y nombre
-                doc_id = doc.get('_id', doc.get('id', str(uuid4())))
-                nombre = doc.get('nombre_alojamiento', doc.get('titulo_h1', 'sin-nombre'))
-                
-                # Sanitizar nombre
-                nombre_safe = settings.sanitize_filename(nombre)
-                
-                # Crear directorio
-                doc_dir = settings.storage_path / database_name / collection_name / f"{doc_id}-{nombre_safe}" / "original"
-                doc_dir.mkdir(parents=True, exist_ok=True)
-                
-                # Buscar imágenes
-                imagenes = doc.get('imagenes', [])
-                if not imagenes:
-                    for field in ['images', 'fotos', 'photos', 'galeria']:
-                        if field in doc and isinstance(doc[field], list):
-                            imagenes = doc[field]
-                            break
-                
-                if not imagenes:
-                    logger.warning(f"No se encontraron imágenes en documento {doc_id}")
-                    continue
-                
-                total_images += len(imagenes)
-                
-                # Descargar imágenes
-                tasks = []
-                for i, img_url in enumerate(imagenes):
-                    if isinstance(img_url, str) and img_url.startswith('http'):
-                        ext = '.jpg'
-                        if '.png' in img_url.lower():
-                            ext = '.png'
-                        elif '.webp' in img_url.lower():
-                            ext = '.webp'
-                        
-                        save_path = doc_dir / f"img_{i+1:03d}{ext}"
-                        tasks.append(download_image(session, img_url, save_path))
-                
-                if tasks:
-                    results = await asyncio.gather(*tasks)
-                    downloaded += sum(results)
-                
-                # Guardar metadata
-                metadata = {
-                    "document_id": str(doc_id),
-                    "nombre": nombre,
-                    "total_images": len(imagenes),
-                    "downloaded": sum(results) if tasks else 0,
-                    "timestamp": datetime.now().isoformat(),
-                    "source_url": api_url,
-                    "job_id": job_id
-                }
-                
-                metadata_path = doc_dir.parent / "metadata.json"
-                metadata_path.write_text(json.dumps(metadata, indent=2, ensure_ascii=False))
+        if request.stream:
+            # Un evento JSON por línea a medida que termina cada documento
+            async def ndjson() -> AsyncIterator[bytes]:
+                async for event in events:
+                    yield (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+            
+            return StreamingResponse(ndjson(), media_type="application/x-ndjson")
         
-        logger.info(
-            "Descarga completada",
-            job_id=job_id,
-            total_images=total_images,
-            downloaded=downloaded
-        )
+        async with contextlib.aclosing(events):
+            async for event in events:
+                if event["event"] == "error":
+                    raise HTTPException(status_code=502, detail=event["error"])
         
-        return {
-            "id": job_id,
-            "status": "completed",
-            "api_url": api_url,
-            "database": database_name,
-            "collection": collection_name,
-            "documents_processed": len(documents),
-            "total_images": total_images,
-            "images_downloaded": downloaded,
-            "storage_path": str(settings.storage_path / database_name / collection_name)
-        }
+        event.pop("event")
+        return event
         
-    except httpx.HTTPError as e:
+    except HTTPException:
+        raise
+    except DownloadException as e:
         logger.error("Error obteniendo datos de la API", api_url=api_url, error=str(e))
-        raise HTTPException(status_code=400, detail=f"Error accediendo a la API: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error("Error en descarga directa", error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
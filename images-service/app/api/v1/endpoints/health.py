@@ -3,14 +3,17 @@ Endpoints de health check y métricas
 """
 from fastapi import APIRouter, Depends
 from fastapi.responses import PlainTextResponse
-from prometheus_client import Counter, Histogram, Gauge, generate_latest
+from prometheus_client import Counter, Histogram, Gauge
 import psutil
 import time
 
 from app.core import settings, logger
+from app.core.metrics import (
+    collect_metrics, http_requests, http_request_duration, http_requests_in_progress
+)
 from app.models.schemas import HealthResponse
 from app.services.database import mongo_repository
-from app.services.storage import LocalStorageService
+from app.services.storage import get_storage_service
 from app.api.v1.dependencies import optional_api_key
 
 
@@ -32,14 +35,22 @@ download_duration = Histogram(
 active_jobs = Gauge(
     'active_jobs',
     'Number of active download jobs',
-    ['type', 'status']
+    ['type', 'status'],
+    multiprocess_mode='livemax'
 )
 
 storage_usage = Gauge(
     'storage_usage_bytes',
-    'Storage space used for images'
+    'Storage space used for images',
+    multiprocess_mode='livemax'
 )
 
+# Momento (monotonic) del último recálculo de cada grupo de métricas
+_metrics_updated_at = {"jobs": 0.0, "storage": 0.0}
+
+# La primera llamada a cpu_percent sin intervalo siempre devuelve 0.0: se inicializa aquí
+psutil.cpu_percent(interval=None)
+
 
 @router.get("/health", response_model=HealthResponse)
 async def health_check(api_key: str = Depends(optional_api_key)):
@@ -86,7 +97,7 @@ async def health_check(api_key: str = Depends(optional_api_key)):
     
     # Verificar almacenamiento
     try:
-        storage = LocalStorageService()
+        storage = get_storage_service()
         storage_stats = await storage.get_storage_stats()
         health_status["storage"] = storage_stats
     except Exception as e:
@@ -97,7 +108,8 @@ async def health_check(api_key: str = Depends(optional_api_key)):
     # Información del sistema
     try:
         health_status["system"] = {
-            "cpu_percent": psutil.cpu_percent(interval=1),
+            # Uso desde la llamada anterior, sin bloquear el event loop
+            "cpu_percent": psutil.cpu_percent(interval=None),
             "memory_percent": psutil.virtual_memory().percent,
             "disk_percent": psutil.disk_usage('/').percent
         }
@@ -122,8 +134,8 @@ async def metrics(api_key: str = Depends(optional_api_key)):
         # Actualizar métricas de almacenamiento
         await update_storage_metrics()
         
-        # Generar métricas
-        metrics_data = generate_latest()
+        # Generar métricas (incluye las de los workers en modo multiproceso)
+        metrics_data = collect_metrics()
         
         return PlainTextResponse(
             content=metrics_data.decode('utf-8'),
@@ -138,18 +150,27 @@ async def metrics(api_key: str = Depends(optional_api_key)):
         )
 
 
+def _metrics_fresh(group: str) -> bool:
+    """Indica si un grupo de métricas se recalculó hace menos de METRICS_CACHE_TTL"""
+    return time.monotonic() - _metrics_updated_at[group] < settings.metrics_cache_ttl
+
+
 async def update_job_metrics():
-    """Actualiza métricas de jobs"""
+    """Actualiza métricas de jobs (una agregación, como mucho una vez por TTL)"""
+    if _metrics_fresh("jobs"):
+        return
+    # También tras un error: no reintentar (ni esperar a MongoDB) en cada scrape
+    _metrics_updated_at["jobs"] = time.monotonic()
+    
     try:
-        # Obtener estadísticas de jobs por tipo y estado
         from app.models.domain import JobType, JobStatus
         
+        counts = await mongo_repository.count_jobs_by_type_and_status()
+        
+        # Todas las combinaciones, para que un estado que se vacía vuelva a 0
         for job_type in JobType:
             for status in JobStatus:
-                count = await mongo_repository._jobs_collection.count_documents({
-                    "type": job_type.value,
-                    "status": status.value
-                })
+                count = counts.get((job_type.value, status.value), 0)
                 active_jobs.labels(type=job_type.value, status=status.value).set(count)
                 
     except Exception as e:
@@ -158,8 +179,12 @@ async def update_job_metrics():
 
 async def update_storage_metrics():
     """Actualiza métricas de almacenamiento"""
+    if _metrics_fresh("storage"):
+        return
+    _metrics_updated_at["storage"] = time.monotonic()
+    
     try:
-        storage = LocalStorageService()
+        storage = get_storage_service()
         stats = await storage.get_storage_stats()
         
         if "used_space_gb" in stats:
@@ -171,20 +196,43 @@ async def update_storage_metrics():
         logger.error("Error actualizando métricas de almacenamiento", error=str(e))
 
 
-# Middleware para actualizar métricas de requests
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-
-class MetricsMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        start_time = time.time()
-        
-        # Procesar request
-        response = await call_next(request)
+class MetricsMiddleware:
+    """
+    Middleware ASGI que registra cada petición HTTP en Prometheus
+    
+    Se implementa como ASGI puro (no BaseHTTPMiddleware) para no envolver el
+    cuerpo de las respuestas: la duración cubre hasta el último chunk enviado,
+    también en respuestas en streaming y ficheros.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
         
-        # Actualizar métricas
-        duration = time.time() - start_time
+        method = scope["method"]
+        status_code = 500
+        start_time = time.perf_counter()
         
-        # Aquí podrías añadir más métricas de requests
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
         
-        return response
+        http_requests_in_progress.labels(method=method).inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start_time
+            http_requests_in_progress.labels(method=method).dec()
+            
+            # Plantilla de la ruta (/images/{database}/...) para acotar la cardinalidad
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            
+            http_requests.labels(method=method, route=route_path, status=str(status_code)).inc()
+            http_request_duration.labels(method=method, route=route_path).observe(duration)
@@ -117,6 +117,9 @@ async def cancel_job(
     """
     Cancela un job en ejecución
     
+    El worker que lo procesa detecta la cancelación en un máximo de
+    JOB_CANCEL_CHECK_INTERVAL segundos y aborta las descargas en curso.
+    
     Args:
         job_id: ID del job
         request: Datos de cancelación
@@ -128,24 +131,17 @@ async def cancel_job(
         # Validar ID
         job_id = validate_document_id(job_id)
         
-        # Obtener job
-        job = await db.get_job(job_id)
+        # Cancelar solo si sigue PENDING o RUNNING (un único update atómico)
+        job = await db.cancel_job(job_id, request.reason if request else None)
         
-        # Verificar que se puede cancelar
-        if job.is_finished:
+        if job is None:
+            # No existe (404) o ya había terminado
+            job = await db.get_job(job_id)
             raise HTTPException(
                 status_code=400,
                 detail=f"El job ya está en estado {job.status.value}"
             )
         
-        # Cancelar job
-        job.cancel()
-        if request and request.reason:
-            job.add_error(f"Cancelado: {request.reason}", "UserCancellation")
-        
-        # Actualizar en base de datos
-        await db.update_job(job)
-        
         logger.info("Job cancelado", job_id=job_id, reason=request.reason if request else None)
         
         return SuccessResponse(
@@ -183,16 +179,7 @@ async def get_job_errors(
         job = await db.get_job(job_id)
         
         # Convertir errores a diccionarios
-        errors = []
-        for error in job.errors:
-            errors.append({
-                "timestamp": error.timestamp.isoformat(),
-                "message": error.message,
-                "error_type": error.error_type,
-                "details": error.details
-            })
-        
-        return errors
+        return [error.to_dict() for error in job.errors]
         
     except HTTPException:
         raise
@@ -240,6 +227,7 @@ async def retry_job(
             collection=original_job.collection,
             document_id=original_job.document_id,
             filter_query=original_job.filter_query,
+            priority=original_job.priority,
             metadata={
                 **original_job.metadata,
                 "retry_of": original_job.id,
@@ -247,12 +235,13 @@ async def retry_job(
             }
         )
         
-        # Guardar nuevo job
-        new_job = await db.create_job(new_job)
+        # Guardar nuevo job (si ya hay uno equivalente en curso se devuelve ese)
+        new_job, created = await db.create_or_attach_job(new_job)
         
-        # Encolar para procesamiento
-        from app.workers.tasks import process_download_job
-        process_download_job.delay(new_job.id)
+        # Encolar según su prioridad
+        if created:
+            from app.workers.scheduler import job_scheduler
+            await job_scheduler.submit(new_job)
         
         logger.info(
             "Job reintentado",
@@ -1,15 +1,46 @@
 """
 Endpoint para servir imágenes descargadas
 """
-from fastapi import APIRouter, HTTPException, Path
-from fastapi.responses import FileResponse, RedirectResponse
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Path, Query, Request
+from fastapi.responses import Response, RedirectResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pathlib import Path as PathLib
+import stat
 import os
 
 from app.core import settings, logger
+from app.api.v1.file_responses import (
+    file_response, is_content_addressed, is_not_modified, not_modified_response, cache_control
+)
+from app.services.processing import derivative_cache
+from app.services.processing.image_processor import FORMAT_MIME_TYPES, is_format_supported
+from app.services.storage import manifest_index, get_storage_service
 
 router = APIRouter(prefix="/images", tags=["serve"])
 
+# Tipo MIME según la extensión
+MIME_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+    ".avif": "image/avif",
+    ".svg": "image/svg+xml",
+    ".ico": "image/x-icon"
+}
+
+# Formato de salida por defecto de las variantes según la extensión del original
+VARIANT_SOURCE_FORMATS = {
+    ".jpg": "jpeg",
+    ".jpeg": "jpeg",
+    ".png": "png",
+    ".gif": "png",
+    ".webp": "webp",
+    ".avif": "avif",
+}
+
 
 # IMPORTANTE: El orden importa - primero la ruta más específica (con /)
 @router.get("/{database}/{collection}/{document_id}/", name="list_document_images_with_slash")
@@ -17,52 +48,44 @@ router = APIRouter(prefix="/images", tags=["serve"])
 async def list_document_images(
     database: str = Path(..., description="Nombre de la base de datos"),
     collection: str = Path(..., description="Nombre de la colección"),
-    document_id: str = Path(..., description="ID del documento")
+    document_id: str = Path(..., description="ID del documento"),
+    limit: Optional[int] = Query(None, ge=1, description="Imágenes por página"),
+    offset: int = Query(0, ge=0, description="Posición de la primera imagen")
 ):
     """
     Lista todas las imágenes disponibles para un documento específico (ej: un hotel).
     
+    Las imágenes salen del índice de almacenamiento (manifest), paginadas con
+    ?limit=&offset=.
+    
     URL ejemplo:
     https://images.serpsrewrite.com/api/v1/images/serpy_db/hotel-booking/6840bc4e949575a0325d921b-vincci-seleccin-la-plantacin-del-sur/
     """
-    doc_path = settings.storage_path / database / collection / document_id
+    limit = _page_size(limit)
+    total, entries = await manifest_index.list_document(database, collection, document_id, limit, offset)
     
-    if not doc_path.exists():
+    if total == 0 and not _exists_locally(settings.storage_path / database / collection / document_id):
         raise HTTPException(
             status_code=404,
             detail=f"No se encontraron imágenes para el documento {document_id}"
         )
     
-    images = []
-    
-    # Función recursiva para buscar imágenes
-    def find_images(path, base_path=""):
-        for item in path.iterdir():
-            if item.is_file() and item.suffix.lower() in ['.jpg', '.jpeg', '.png', '.gif', '.webp']:
-                relative_path = f"{base_path}/{item.name}" if base_path else item.name
-                full_url = f"https://images.serpsrewrite.com/api/v1/images/{database}/{collection}/{document_id}/{relative_path}"
-                size_bytes = item.stat().st_size
-                size_kb = round(size_bytes / 1024, 2)
-                images.append({
-                    "filename": relative_path,
-                    "size": f"{size_kb} KB",
-                    "url": full_url
-                })
-            elif item.is_dir():
-                subdir_name = item.name
-                find_images(item, f"{base_path}/{subdir_name}" if base_path else subdir_name)
-    
-    # Buscar todas las imágenes
-    find_images(doc_path)
-    
-    # Ordenar por nombre de archivo
-    images.sort(key=lambda x: x['filename'])
+    images = [
+        {
+            "filename": entry["filename"],
+            "size": f"{round(entry['size'] / 1024, 2)} KB",
+            "url": f"https://images.serpsrewrite.com/api/v1/images/{database}/{collection}/{document_id}/{entry['filename']}"
+        }
+        for entry in entries
+    ]
     
     return {
         "database": database,
         "collection": collection,
         "document_id": document_id,
-        "total_images": len(images),
+        "total_images": total,
+        "offset": offset,
+        "limit": limit,
         "images": images,
         "base_url": f"https://images.serpsrewrite.com/api/v1/images/{database}/{collection}/{document_id}/"
     }
@@ -70,87 +93,215 @@ async def list_document_images(
 
 @router.get("/{database}/{collection}/{document_id}/{filename:path}")
 async def serve_image(
+    request: Request,
     database: str = Path(..., description="Nombre de la base de datos"),
     collection: str = Path(..., description="Nombre de la colección"),
     document_id: str = Path(..., description="ID del documento"),
-    filename: str = Path(..., description="Nombre del archivo de imagen (puede incluir subdirectorios)")
+    filename: str = Path(..., description="Nombre del archivo de imagen (puede incluir subdirectorios)"),
+    w: Optional[int] = Query(None, ge=1, description="Ancho máximo de la variante"),
+    h: Optional[int] = Query(None, ge=1, description="Alto máximo de la variante"),
+    fmt: Optional[str] = Query(None, description="Formato de salida (jpeg, webp, avif, png)"),
+    q: Optional[int] = Query(None, ge=1, le=100, description="Calidad de codificación")
 ):
     """
     Sirve una imagen descargada por su ruta.
     
     La URL sería algo como:
     https://images.serpsrewrite.com/api/v1/images/serpy_db/hotel-booking/6840bc4e949575a0325d921b-vincci-seleccion-la-plantacion-del-sur/original/img_001.jpg
+    
+    Soporta ETag/If-None-Match (304), Range (206) y, con ACCEL_REDIRECT_PREFIX,
+    delega el envío a nginx mediante X-Accel-Redirect.
+    
+    Con ?w=&h=&fmt=&q= se sirve una variante redimensionada/recodificada que se
+    genera la primera vez y se guarda en una caché LRU en disco, por ejemplo:
+    .../original/img_001.jpg?w=640&fmt=webp&q=75
     """
-    # Construir la ruta completa
-    image_path = settings.storage_path / database / collection / document_id / filename
-    
-    # Verificar que el archivo existe
-    if not image_path.exists():
-        logger.warning(
-            "Imagen no encontrada",
-            path=str(image_path),
-            database=database,
-            collection=collection,
-            document_id=document_id,
-            filename=filename
-        )
+    relative_path = PathLib(database, collection, document_id, filename)
+    if ".." in relative_path.parts:
+        raise HTTPException(status_code=400, detail="Ruta no válida")
+    
+    if settings.storage_type == "s3":
+        if any(param is not None for param in (w, h, fmt, q)):
+            raise HTTPException(
+                status_code=400,
+                detail="Las variantes al vuelo solo están disponibles con STORAGE_TYPE=local"
+            )
+        return await _serve_from_object_storage(request, relative_path, filename)
+    
+    image_path = settings.storage_path / relative_path
+    
+    # Un único stat: existencia, tipo, tamaño y mtime (ETag)
+    try:
+        image_stat = os.stat(image_path)
+    except (FileNotFoundError, NotADirectoryError):
+        logger.debug("Imagen no encontrada", path=str(image_path))
         raise HTTPException(
             status_code=404,
             detail=f"Imagen no encontrada: {filename}"
         )
     
     # Verificar que es un archivo (no un directorio)
-    if not image_path.is_file():
+    if not stat.S_ISREG(image_stat.st_mode):
         raise HTTPException(
             status_code=400,
             detail="La ruta no corresponde a un archivo"
         )
     
-    # Determinar el tipo MIME basado en la extensión
-    mime_types = {
-        ".jpg": "image/jpeg",
-        ".jpeg": "image/jpeg",
-        ".png": "image/png",
-        ".gif": "image/gif",
-        ".webp": "image/webp",
-        ".svg": "image/svg+xml",
-        ".ico": "image/x-icon"
-    }
+    # Variante al vuelo
+    if any(param is not None for param in (w, h, fmt, q)):
+        return await _serve_variant(request, image_path, image_stat, w, h, fmt, q)
     
-    ext = image_path.suffix.lower()
-    media_type = mime_types.get(ext, "application/octet-stream")
+    media_type = MIME_TYPES.get(image_path.suffix.lower(), "application/octet-stream")
     
-    logger.info(
-        "Sirviendo imagen",
-        path=str(image_path),
-        size=image_path.stat().st_size,
-        media_type=media_type
+    accel_path = None
+    if settings.accel_redirect_prefix:
+        accel_path = settings.accel_redirect_prefix.rstrip("/") + "/" + relative_path.as_posix()
+    
+    return file_response(
+        request,
+        str(image_path),
+        image_stat,
+        media_type,
+        immutable=is_content_addressed(filename),
+        accel_path=accel_path
     )
+
+
+async def _serve_from_object_storage(request: Request, relative_path: PathLib, filename: str) -> Response:
+    """
+    Sirve una imagen almacenada en S3
     
-    # Devolver la imagen
-    return FileResponse(
-        path=str(image_path),
-        media_type=media_type,
-        headers={
-            "Cache-Control": "public, max-age=86400",  # Cache por 1 día
-            "X-Content-Type-Options": "nosniff"
-        }
+    Con S3_SERVE_MODE=redirect responde con una redirección a una URL
+    prefirmada (el cliente descarga directamente del bucket); con stream la
+    imagen pasa en streaming por el servicio.
+    """
+    storage = get_storage_service()
+    
+    if settings.s3_serve_mode == "redirect":
+        return RedirectResponse(
+            storage.presigned_url(relative_path),
+            status_code=307,
+            headers={"Cache-Control": f"private, max-age={settings.s3_presign_expiration // 2}"}
+        )
+    
+    status_code, headers, body = await storage.stream_object(relative_path, request.headers)
+    
+    if status_code == 404:
+        raise HTTPException(status_code=404, detail=f"Imagen no encontrada: {filename}")
+    if body is None:
+        # 304 o 416 resueltos por el bucket
+        return Response(status_code=status_code, headers=headers)
+    
+    headers["Cache-Control"] = cache_control(is_content_addressed(filename))
+    headers["X-Content-Type-Options"] = "nosniff"
+    
+    return StreamingResponse(
+        body,
+        status_code=status_code,
+        headers=headers,
+        media_type=MIME_TYPES.get(relative_path.suffix.lower(), "application/octet-stream")
+    )
+
+
+async def _serve_variant(
+    request: Request,
+    image_path: PathLib,
+    image_stat: os.stat_result,
+    width: Optional[int],
+    height: Optional[int],
+    fmt: Optional[str],
+    quality: Optional[int]
+) -> Response:
+    """Sirve (generándola si hace falta) una variante de la imagen desde la caché"""
+    source_format = VARIANT_SOURCE_FORMATS.get(image_path.suffix.lower())
+    if source_format is None:
+        raise HTTPException(status_code=400, detail="El tipo de imagen no admite variantes")
+    
+    fmt = (fmt or source_format).lower()
+    if fmt == "jpg":
+        fmt = "jpeg"
+    if fmt not in FORMAT_MIME_TYPES or not is_format_supported(fmt):
+        raise HTTPException(status_code=400, detail=f"Formato no soportado: {fmt}")
+    
+    max_dimension = settings.resize_max_dimension
+    if (width and width > max_dimension) or (height and height > max_dimension):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Las dimensiones máximas permitidas son {max_dimension}px"
+        )
+    
+    if quality is None:
+        quality = {
+            "jpeg": settings.jpeg_quality,
+            "webp": settings.webp_quality,
+            "avif": settings.avif_quality
+        }.get(fmt, 85)
+    
+    # ETag estable derivado de la clave de caché (el mtime del archivo en caché
+    # cambia con cada hit); permite responder 304 sin tocar la caché
+    key = derivative_cache.build_key(image_path, image_stat, (width, height, fmt, quality))
+    etag = f'"{key[:32]}"'
+    if is_not_modified(request, image_stat, etag):
+        return not_modified_response(image_stat, etag)
+    
+    for attempt in range(2):
+        variant_path, hit = await derivative_cache.get_or_create(
+            image_path,
+            image_stat,
+            width,
+            height,
+            fmt,
+            quality
+        )
+        # Sin await entre get_or_create y pin: la expulsión no puede colarse
+        derivative_cache.pin(key)
+        try:
+            variant_stat = os.stat(variant_path)
+            break
+        except FileNotFoundError:
+            # Expulsada por otro proceso que comparte la caché: se regenera una vez
+            derivative_cache.unpin(key)
+            derivative_cache.discard(key)
+    else:
+        logger.warning("Variante expulsada mientras se servía", path=str(image_path))
+        raise HTTPException(status_code=503, detail="Variante no disponible, reintentar")
+    
+    accel_path = None
+    if settings.accel_redirect_cache_prefix:
+        relative = variant_path.relative_to(derivative_cache.cache_path).as_posix()
+        accel_path = settings.accel_redirect_cache_prefix.rstrip("/") + "/" + relative
+    
+    response = file_response(
+        request,
+        str(variant_path),
+        variant_stat,
+        FORMAT_MIME_TYPES[fmt],
+        accel_path=accel_path,
+        extra_headers={"X-Cache": "HIT" if hit else "MISS"},
+        etag=etag
     )
+    # Se libera cuando termina el envío (con X-Accel-Redirect, al delegarlo a nginx)
+    response.background = BackgroundTask(derivative_cache.unpin, key)
+    return response
 
 
 @router.get("/{database}/{collection}")
 async def list_collection_images(
     database: str = Path(..., description="Nombre de la base de datos"),
-    collection: str = Path(..., description="Nombre de la colección")
+    collection: str = Path(..., description="Nombre de la colección"),
+    limit: Optional[int] = Query(None, ge=1, description="Documentos por página"),
+    offset: int = Query(0, ge=0, description="Posición del primer documento")
 ):
     """
     Lista todas las imágenes disponibles para una colección.
     
-    Devuelve una estructura con los documentos y sus imágenes.
+    Devuelve una estructura con los documentos y sus imágenes, paginada por
+    documentos con ?limit=&offset=.
     """
-    collection_path = settings.storage_path / database / collection
+    limit = _page_size(limit)
+    total, documents = await manifest_index.list_collection(database, collection, limit, offset)
     
-    if not collection_path.exists():
+    if total == 0 and not _exists_locally(settings.storage_path / database / collection):
         raise HTTPException(
             status_code=404,
             detail=f"No se encontraron imágenes para {database}/{collection}"
@@ -162,37 +313,22 @@ async def list_collection_images(
         "documents": {}
     }
     
-    # Recorrer los directorios de documentos
-    for doc_dir in collection_path.iterdir():
-        if doc_dir.is_dir():
-            doc_id = doc_dir.name
-            images = []
-            
-            # Función recursiva para buscar imágenes en subdirectorios
-            def find_images(path, base_path=""):
-                for item in path.iterdir():
-                    if item.is_file() and item.suffix.lower() in ['.jpg', '.jpeg', '.png', '.gif', '.webp']:
-                        relative_path = f"{base_path}/{item.name}" if base_path else item.name
-                        images.append({
-                            "filename": relative_path,
-                            "size": item.stat().st_size,
-                            "url": f"/api/v1/images/{database}/{collection}/{doc_id}/{relative_path}"
-                        })
-                    elif item.is_dir():
-                        # Buscar en subdirectorios (como 'original')
-                        subdir_name = item.name
-                        find_images(item, f"{base_path}/{subdir_name}" if base_path else subdir_name)
-            
-            # Buscar imágenes recursivamente
-            find_images(doc_dir)
-            
-            if images:
-                result["documents"][doc_id] = {
-                    "total_images": len(images),
-                    "images": images
+    for doc_id, entries in documents.items():
+        result["documents"][doc_id] = {
+            "total_images": len(entries),
+            "images": [
+                {
+                    "filename": entry["filename"],
+                    "size": entry["size"],
+                    "url": f"/api/v1/images/{database}/{collection}/{doc_id}/{entry['filename']}"
                 }
+                for entry in entries
+            ]
+        }
     
-    result["total_documents"] = len(result["documents"])
+    result["total_documents"] = total
+    result["offset"] = offset
+    result["limit"] = limit
     
     return result
 
@@ -206,34 +342,26 @@ async def list_all_images():
         "databases": {}
     }
     
-    # Verificar que el directorio de almacenamiento existe
-    if not settings.storage_path.exists():
-        return result
-    
-    # Recorrer bases de datos
-    for db_dir in settings.storage_path.iterdir():
-        if db_dir.is_dir():
-            db_name = db_dir.name
-            collections = []
-            
-            # Recorrer colecciones
-            for coll_dir in db_dir.iterdir():
-                if coll_dir.is_dir():
-                    # Contar documentos
-                    doc_count = sum(1 for d in coll_dir.iterdir() if d.is_dir())
-                    if doc_count > 0:
-                        collections.append({
-                            "name": coll_dir.name,
-                            "documents": doc_count,
-                            "url": f"/api/v1/images/{db_name}/{coll_dir.name}"
-                        })
-            
-            if collections:
-                result["databases"][db_name] = {
-                    "collections": collections,
-                    "total_collections": len(collections)
-                }
+    for entry in await manifest_index.list_collections():
+        db_name = entry["database"]
+        database = result["databases"].setdefault(db_name, {"collections": [], "total_collections": 0})
+        database["collections"].append({
+            "name": entry["collection"],
+            "documents": entry["documents"],
+            "url": f"/api/v1/images/{db_name}/{entry['collection']}"
+        })
+        database["total_collections"] += 1
     
     result["total_databases"] = len(result["databases"])
     
     return result
+
+
+def _page_size(limit: Optional[int]) -> int:
+    """Tamaño de página efectivo para los listados"""
+    return min(limit or settings.listing_page_size, settings.listing_max_page_size)
+
+
+def _exists_locally(path: PathLib) -> bool:
+    """Existencia de un directorio en disco (con S3 manda el índice)"""
+    return settings.storage_type == "local" and path.exists()
@@ -0,0 +1,245 @@
+"""
+Respuestas HTTP para servir archivos de imagen desde disco
+
+Camino rápido para /images: trabaja con un único stat del archivo, calcula
+un ETag fuerte a partir de inode/mtime/size, resuelve peticiones
+condicionales (304) y rangos (206) y, si está configurado, delega el envío a
+nginx con X-Accel-Redirect para que use sendfile.
+"""
+from typing import Optional, Tuple, Dict
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+from starlette.types import Scope, Receive, Send
+from urllib.parse import quote
+import aiofiles
+import os
+import re
+
+from app.core import settings
+
+
+# Nombres con un hash (md5, sha1, sha256...) en el nombre: su contenido no cambia nunca
+CONTENT_ADDRESSED_PATTERN = re.compile(r"(?:^|[._-])[0-9a-f]{16,}(?:$|[._-])")
+
+
+def build_etag(stat_result: os.stat_result) -> str:
+    """ETag fuerte a partir de inode, mtime (ns) y tamaño"""
+    return f'"{stat_result.st_ino:x}-{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def is_content_addressed(filename: str) -> bool:
+    """Verifica si el nombre del archivo incluye un hash de su contenido"""
+    stem = os.path.splitext(os.path.basename(filename))[0].lower()
+    return bool(CONTENT_ADDRESSED_PATTERN.search(stem))
+
+
+def cache_control(immutable: bool) -> str:
+    """Cabecera Cache-Control según si el recurso es inmutable"""
+    if immutable:
+        return f"public, max-age={settings.serve_immutable_max_age}, immutable"
+    return f"public, max-age={settings.serve_max_age}"
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """Comparación débil de If-None-Match contra el ETag actual"""
+    if header.strip() == "*":
+        return True
+    
+    candidates = [tag.strip() for tag in header.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def is_not_modified(request: Request, stat_result: os.stat_result, etag: str) -> bool:
+    """
+    Evalúa If-None-Match / If-Modified-Since
+    
+    If-None-Match tiene prioridad; If-Modified-Since solo se usa si no viene.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(stat_result.st_mtime) <= since
+    
+    return False
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Interpreta una cabecera Range de un único rango
+    
+    Returns:
+        (inicio, fin) inclusivos, o None si la cabecera no es válida o pide
+        varios rangos (en ambos casos se responde con el archivo completo)
+    
+    Raises:
+        ValueError: Si el rango es correcto pero no satisfacible (416)
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    
+    start_text, sep, end_text = spec.strip().partition("-")
+    start_text, end_text = start_text.strip(), end_text.strip()
+    if not sep or not all(part == "" or part.isdigit() for part in (start_text, end_text)):
+        return None
+    
+    if start_text == "":
+        # Sufijo: últimos N bytes
+        if end_text == "":
+            return None
+        length = int(end_text)
+        if length == 0 or size == 0:
+            raise ValueError("Rango no satisfacible")
+        return max(size - length, 0), size - 1
+    
+    start = int(start_text)
+    end = int(end_text) if end_text else size - 1
+    if end < start:
+        return None
+    if start >= size:
+        raise ValueError("Rango fuera del archivo")
+    
+    return start, min(end, size - 1)
+
+
+class FileRangeResponse(Response):
+    """Respuesta 206 con un rango de bytes de un archivo"""
+    
+    chunk_size = 64 * 1024
+    
+    def __init__(
+        self,
+        path: str,
+        start: int,
+        end: int,
+        total_size: int,
+        headers: Dict[str, str],
+        media_type: str
+    ):
+        super().__init__(status_code=206, headers=headers, media_type=media_type)
+        self.path = path
+        self.start = start
+        self.end = end
+        self.headers["content-range"] = f"bytes {start}-{end}/{total_size}"
+        self.headers["content-length"] = str(end - start + 1)
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        
+        try:
+            if scope.get("method", "GET").upper() == "HEAD":
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+            else:
+                await self._send_range(send)
+        finally:
+            if self.background is not None:
+                await self.background()
+    
+    async def _send_range(self, send: Send) -> None:
+        remaining = self.end - self.start + 1
+        async with aiofiles.open(self.path, "rb") as f:
+            await f.seek(self.start)
+            while remaining > 0:
+                chunk = await f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        
+        if remaining > 0:
+            # El archivo se truncó durante el envío: cerrar la respuesta igualmente
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def _base_headers(
+    stat_result: os.stat_result,
+    etag: str,
+    immutable: bool,
+    extra_headers: Optional[Dict[str, str]]
+) -> Dict[str, str]:
+    """Cabeceras comunes de validación y caché"""
+    return {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": cache_control(immutable),
+        "X-Content-Type-Options": "nosniff",
+        **(extra_headers or {})
+    }
+
+
+def not_modified_response(
+    stat_result: os.stat_result,
+    etag: Optional[str] = None,
+    immutable: bool = False,
+    extra_headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """Respuesta 304 con las cabeceras de validación"""
+    return Response(
+        status_code=304,
+        headers=_base_headers(stat_result, etag or build_etag(stat_result), immutable, extra_headers)
+    )
+
+
+def file_response(
+    request: Request,
+    path: str,
+    stat_result: os.stat_result,
+    media_type: str,
+    immutable: bool = False,
+    accel_path: Optional[str] = None,
+    extra_headers: Optional[Dict[str, str]] = None,
+    etag: Optional[str] = None
+) -> Response:
+    """
+    Construye la respuesta para servir un archivo ya comprobado con stat
+    
+    Args:
+        request: Petición (cabeceras condicionales y Range)
+        path: Ruta del archivo en disco
+        stat_result: Resultado del stat del archivo (no se vuelve a consultar)
+        media_type: Tipo MIME
+        immutable: Si el recurso puede cachearse como inmutable
+        accel_path: URI interna de nginx; si se indica se delega el envío con X-Accel-Redirect
+        extra_headers: Cabeceras adicionales
+        etag: ETag a usar en lugar del derivado de stat_result
+    
+    Returns:
+        Respuesta 200, 206, 304, 416 o delegada a nginx
+    """
+    etag = etag or build_etag(stat_result)
+    
+    if is_not_modified(request, stat_result, etag):
+        return not_modified_response(stat_result, etag, immutable, extra_headers)
+    
+    headers = _base_headers(stat_result, etag, immutable, extra_headers)
+    headers["Accept-Ranges"] = "bytes"
+    
+    if accel_path is not None:
+        # nginx resuelve Range y envía el archivo con sendfile
+        headers["X-Accel-Redirect"] = quote(accel_path)
+        return Response(media_type=media_type, headers=headers)
+    
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() in (etag, headers["Last-Modified"])):
+        try:
+            byte_range = parse_range(range_header, stat_result.st_size)
+        except ValueError:
+            return Response(
+                status_code=416,
+                headers={"Content-Range": f"bytes */{stat_result.st_size}", "ETag": etag}
+            )
+        
+        if byte_range is not None:
+            start, end = byte_range
+            return FileRangeResponse(path, start, end, stat_result.st_size, headers, media_type)
+    
+    return FileResponse(path=path, media_type=media_type, headers=headers, stat_result=stat_result)
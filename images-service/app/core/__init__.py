@@ -9,7 +9,7 @@ root_dir = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(root_dir))
 
 from config.settings import settings
-from .logging import logger, setup_logging
+from .logging import logger, setup_logging, LogSummary, RateLimitedLog
 from .exceptions import *
 
-__all__ = ["settings", "logger", "setup_logging"]
+__all__ = ["settings", "logger", "setup_logging", "LogSummary", "RateLimitedLog"]
@@ -116,6 +116,31 @@ class JobException(ImagesServiceException):
         super().__init__(message, error_code="JOB_ERROR", **kwargs)
 
 
+class JobCancelledException(JobException):
+    """Excepción lanzada cuando un job se cancela mientras se está procesando"""
+    
+    def __init__(self, message: str = "Job cancelado", job_id: Optional[str] = None, **kwargs):
+        kwargs["status_code"] = 409
+        super().__init__(message, job_id=job_id, **kwargs)
+        self.error_code = "JOB_CANCELLED"
+
+
+class IdempotencyKeyMismatchException(JobException):
+    """La Idempotency-Key ya se usó con una petición distinta"""
+    
+    def __init__(self, idempotency_key: str, job_id: Optional[str] = None, **kwargs):
+        details = kwargs.get("details", {})
+        details["idempotency_key"] = idempotency_key
+        kwargs["details"] = details
+        kwargs["status_code"] = 422
+        super().__init__(
+            "La Idempotency-Key ya se usó con una petición distinta",
+            job_id=job_id,
+            **kwargs
+        )
+        self.error_code = "IDEMPOTENCY_KEY_MISMATCH"
+
+
 class RateLimitException(ImagesServiceException):
     """Excepción para límites de tasa excedidos"""
     
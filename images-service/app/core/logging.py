@@ -1,27 +1,144 @@
 """
 Sistema de logging estructurado para el microservicio
+
+La escritura de los logs se hace en un hilo aparte (QueueHandler +
+QueueListener): el event loop solo formatea el evento y lo deja en una cola.
+Para las rutas calientes (una línea por imagen o por petición) hay
+LogSummary, que agrega los eventos y escribe un resumen periódico, y
+RateLimitedLog, que limita los avisos repetidos por intervalo.
 """
+from logging.handlers import QueueHandler, QueueListener
 import structlog
 import logging
+import atexit
+import random
+import queue
+import time
 import sys
-from typing import Any, Dict
+import os
+from typing import Any, Dict, Optional
 from pathlib import Path
 
+from config.settings import settings
+
+
+# Hilo que escribe los logs encolados (uno por proceso)
+_listener: Optional[QueueListener] = None
+_handlers: list = []
+
+# Resúmenes activos (se escriben los pendientes al terminar el proceso)
+_summaries: list = []
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler que nunca bloquea: si la cola está llena descarta el registro
+    
+    Los descartes se cuentan y se informan en el siguiente registro que entra.
+    """
+    
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+    
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            warning = logging.LogRecord(
+                record.name, logging.WARNING, __file__, 0,
+                f"{dropped} registros de log descartados (cola llena)", None, None
+            )
+            try:
+                self.queue.put_nowait(warning)
+            except queue.Full:
+                self.dropped += dropped
+
+
+def _start_listener() -> None:
+    """(Re)crea la cola y el hilo escritor con los handlers configurados"""
+    global _listener
+    
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, QueueHandler):
+            root.removeHandler(handler)
+    
+    log_queue: queue.Queue = queue.Queue(maxsize=settings.log_queue_size)
+    root.addHandler(DroppingQueueHandler(log_queue))
+    _listener = QueueListener(log_queue, *_handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener() -> None:
+    """Vacía la cola y detiene el hilo escritor"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _restart_listener_after_fork() -> None:
+    """El hilo escritor no sobrevive a un fork: el proceso hijo crea el suyo"""
+    global _listener
+    if _listener is not None:
+        _listener = None
+        _start_listener()
+
+
+def flush_log_summaries() -> None:
+    """Escribe los resúmenes pendientes de todos los LogSummary"""
+    for summary in _summaries:
+        summary.flush()
+
+
+os.register_at_fork(after_in_child=_restart_listener_after_fork)
+# atexit ejecuta en orden inverso: primero los resúmenes y luego se vacía la cola
+atexit.register(_stop_listener)
+atexit.register(flush_log_summaries)
+
 
 def setup_logging(log_level: str = "INFO", log_file: Path = None) -> None:
     """
     Configura el sistema de logging estructurado
     
+    Se puede llamar varias veces (p. ej. en el worker y en cada proceso hijo):
+    reemplaza la configuración anterior.
+    
     Args:
         log_level: Nivel de logging (DEBUG, INFO, WARNING, ERROR)
         log_file: Archivo opcional para guardar logs
     """
-    # Configurar el nivel de logging
-    logging.basicConfig(
-        format="%(message)s",
-        stream=sys.stdout,
-        level=getattr(logging, log_level.upper()),
-    )
+    global _handlers
+    
+    _stop_listener()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(getattr(logging, log_level.upper()))
+    
+    # Handlers que escriben de verdad (en el hilo del listener si hay cola)
+    formatter = logging.Formatter("%(message)s")
+    _handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        _handlers.append(logging.FileHandler(log_file))
+    for handler in _handlers:
+        handler.setFormatter(formatter)
+    
+    if settings.log_queue_size > 0:
+        _start_listener()
+    else:
+        for handler in _handlers:
+            root.addHandler(handler)
+    
+    # Librerías muy verbosas en DEBUG (cada petición a S3 genera decenas de líneas)
+    for noisy_logger in ("botocore", "boto3", "s3transfer", "urllib3"):
+        logging.getLogger(noisy_logger).setLevel(logging.WARNING)
     
     # Procesadores para structlog
     processors = [
@@ -63,6 +180,113 @@ def get_logger(name: str = None) -> structlog.BoundLogger:
     return structlog.get_logger(name)
 
 
+class LogSummary:
+    """
+    Agrega los eventos de una ruta caliente y escribe un resumen periódico
+    
+    En lugar de una línea por imagen o por petición, record() acumula el
+    número de eventos, la suma de los campos numéricos y sus máximos, y cada
+    LOG_SUMMARY_INTERVAL segundos escribe una sola línea con el resumen.
+    
+    - En DEBUG cada evento se escribe además individualmente.
+    - Con LOG_SAMPLE_RATE > 0 se escribe una muestra de los eventos en INFO.
+    """
+    
+    def __init__(self, event: str, interval: float = None, sample_rate: float = None):
+        self.event = event
+        self.interval = settings.log_summary_interval if interval is None else interval
+        self.sample_rate = settings.log_sample_rate if sample_rate is None else sample_rate
+        self._reset()
+        _summaries.append(self)
+    
+    def _reset(self) -> None:
+        self._started = time.monotonic()
+        self._count = 0
+        self._totals: Dict[str, float] = {}
+        self._maximums: Dict[str, float] = {}
+        self._counters: Dict[str, int] = {}
+    
+    def record(self, count_by: str = None, **fields) -> None:
+        """
+        Registra un evento
+        
+        Args:
+            count_by: Campo cuyo valor se cuenta por separado (p. ej. el status)
+            **fields: Campos del evento; los numéricos se suman y se guarda su máximo
+        """
+        self._count += 1
+        for key, value in fields.items():
+            if key != count_by and isinstance(value, (int, float)) and not isinstance(value, bool):
+                self._totals[key] = self._totals.get(key, 0) + value
+                if value > self._maximums.get(key, value - 1):
+                    self._maximums[key] = value
+        if count_by is not None:
+            counter = f"{count_by}_{fields.get(count_by)}"
+            self._counters[counter] = self._counters.get(counter, 0) + 1
+        
+        if logger.is_enabled_for(logging.DEBUG):
+            logger.debug(self.event, **fields)
+        elif self.sample_rate and random.random() < self.sample_rate:
+            logger.info(self.event, sampled=True, **fields)
+        
+        if time.monotonic() - self._started >= self.interval:
+            self.flush()
+    
+    def flush(self) -> None:
+        """Escribe el resumen acumulado (si hay eventos) y empieza otro intervalo"""
+        if self._count:
+            logger.info(
+                f"{self.event} (resumen)",
+                count=self._count,
+                interval=round(time.monotonic() - self._started, 1),
+                **{f"total_{key}": round(value, 3) for key, value in self._totals.items()},
+                **{f"max_{key}": round(value, 3) for key, value in self._maximums.items()},
+                **self._counters
+            )
+        self._reset()
+
+
+class RateLimitedLog:
+    """
+    Limita cuántas veces se escribe un mismo mensaje por intervalo
+    
+    Sirve para avisos que pueden repetirse miles de veces seguidas (p. ej. un
+    host devolviendo 429 a todas las descargas): se escriben los primeros
+    LOG_RATE_LIMIT de cada intervalo y el resto solo se cuentan; el número de
+    omitidos aparece en la primera línea del intervalo siguiente.
+    """
+    
+    def __init__(self, limit: int = None, interval: float = None):
+        self.limit = settings.log_rate_limit if limit is None else limit
+        self.interval = settings.log_summary_interval if interval is None else interval
+        # mensaje -> [inicio del intervalo, escritos, omitidos]
+        self._windows: Dict[str, list] = {}
+    
+    def _allow(self, message: str) -> Optional[int]:
+        """Devuelve los omitidos a informar si el mensaje se puede escribir, o None"""
+        now = time.monotonic()
+        window = self._windows.get(message)
+        if window is None or now - window[0] >= self.interval:
+            suppressed = window[2] if window else 0
+            self._windows[message] = [now, 1, 0]
+            return suppressed
+        if window[1] < self.limit:
+            window[1] += 1
+            return 0
+        window[2] += 1
+        return None
+    
+    def warning(self, msg: str, **kwargs) -> None:
+        suppressed = self._allow(msg)
+        if suppressed is not None:
+            logger.warning(msg, **kwargs, **({"suppressed": suppressed} if suppressed else {}))
+    
+    def error(self, msg: str, **kwargs) -> None:
+        suppressed = self._allow(msg)
+        if suppressed is not None:
+            logger.error(msg, **kwargs, **({"suppressed": suppressed} if suppressed else {}))
+
+
 class LoggerAdapter:
     """Adaptador para añadir contexto consistente a los logs"""
     
@@ -101,6 +325,10 @@ class LoggerAdapter:
         
         return ContextManager(self, kwargs)
     
+    def is_enabled_for(self, level: int) -> bool:
+        """Indica si un nivel se escribe (para evitar preparar eventos que se descartan)"""
+        return logging.getLogger("images-service").isEnabledFor(level)
+    
     # Métodos de logging
     def debug(self, msg: str, **kwargs):
         self.logger.debug(msg, **kwargs)
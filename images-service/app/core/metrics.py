@@ -0,0 +1,127 @@
+"""
+Métricas de Prometheus compartidas entre la API y los workers de Celery
+
+Las descargas ocurren en los procesos de Celery pero /metrics lo sirve la API.
+Con PROMETHEUS_MULTIPROC_DIR definido (entrypoint.sh lo exporta para todos los
+programas de supervisor) cada proceso escribe sus métricas en ese directorio y
+/metrics agrega todas; sin él solo se exponen las del proceso de la API.
+"""
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest
+from prometheus_client import multiprocess
+import os
+
+
+def is_multiprocess() -> bool:
+    """Indica si las métricas se agregan entre procesos"""
+    return bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def collect_metrics() -> bytes:
+    """Genera la exposición de métricas (agregando procesos si procede)"""
+    if is_multiprocess():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def mark_process_dead(pid: int = None) -> None:
+    """Descarta los gauges "live" de un proceso que termina"""
+    if is_multiprocess():
+        multiprocess.mark_process_dead(pid or os.getpid())
+
+
+# Limitador adaptativo por host (ImageDownloader)
+host_concurrency_limit = Gauge(
+    'download_host_concurrency_limit',
+    'Current adaptive concurrency limit per host',
+    ['host'],
+    multiprocess_mode='livesum'
+)
+
+host_in_flight = Gauge(
+    'download_host_in_flight',
+    'Downloads currently in flight per host',
+    ['host'],
+    multiprocess_mode='livesum'
+)
+
+host_throttled = Counter(
+    'download_host_throttled_total',
+    'Responses that reduced the per-host limit (429, 5xx, timeouts)',
+    ['host', 'reason']
+)
+
+
+# Tiempos por fase de cada descarga (app/services/download/timing.py)
+download_phase_duration = Histogram(
+    'download_phase_seconds',
+    'Duration of each download phase per host (pool, connect, tls, ttfb, transfer)',
+    ['host', 'phase'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+
+# Planificación de jobs (app/workers/scheduler.py)
+job_queue_wait = Histogram(
+    'job_queue_wait_seconds',
+    'Time from job creation until a worker starts it',
+    ['priority', 'type'],
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200, 21600)
+)
+
+
+# Recolector de basura del almacenamiento (app/services/storage/garbage_collector.py)
+storage_gc_removed = Counter(
+    'storage_gc_removed_total',
+    'Files and directories removed by the storage garbage collector',
+    ['kind']
+)
+
+storage_gc_reclaimed_bytes = Counter(
+    'storage_gc_reclaimed_bytes_total',
+    'Bytes reclaimed by the storage garbage collector'
+)
+
+
+# Entrega de webhooks (app/workers/webhooks.py)
+webhook_deliveries = Counter(
+    'webhook_deliveries_total',
+    'Webhook events by delivery attempt result (delivered, retry, failed)',
+    ['result']
+)
+
+webhook_delivery_latency = Histogram(
+    'webhook_delivery_latency_seconds',
+    'Time from event creation until the endpoint accepted it (including retries)',
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600, 21600)
+)
+
+webhook_request_duration = Histogram(
+    'webhook_request_duration_seconds',
+    'Duration of each webhook POST',
+    ['outcome'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+
+# Peticiones HTTP de la API (MetricsMiddleware)
+http_requests = Counter(
+    'http_requests_total',
+    'HTTP requests handled by the API',
+    ['method', 'route', 'status']
+)
+
+http_request_duration = Histogram(
+    'http_request_duration_seconds',
+    'Time until the response body has been sent',
+    ['method', 'route'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+http_requests_in_progress = Gauge(
+    'http_requests_in_progress',
+    'HTTP requests currently being handled',
+    ['method'],
+    multiprocess_mode='livesum'
+)
@@ -16,6 +16,7 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+import asyncio
 import time
 import sys
 from pathlib import Path
@@ -24,15 +25,22 @@ from pathlib import Path
 root_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(root_dir))
 
-from app.core import settings, logger, setup_logging
+from app.core import settings, logger, setup_logging, LogSummary
 from app.core.exceptions import ImagesServiceException
 from app.api.v1 import api_router
+from app.api.v1.endpoints.health import MetricsMiddleware
 from app.services.database import mongo_repository
+from app.services.storage import manifest_index, get_storage_service
 
 
 # Configurar logging
 setup_logging(log_level="INFO" if settings.is_production else "DEBUG")
 
+# Las peticiones de imágenes (miles por minuto) se resumen por intervalo en
+# lugar de escribir una línea por petición
+IMAGE_ROUTES_PREFIX = f"{settings.api_prefix}/images/"
+image_requests_log = LogSummary("Peticiones de imágenes")
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -41,6 +49,7 @@ async def lifespan(app: FastAPI):
     
     Maneja la inicialización y cierre de recursos:
     - Conexión a MongoDB al iniciar
+    - Construcción del índice de imágenes si está vacío
     - Desconexión limpia al cerrar
     
     La aplicación puede funcionar sin MongoDB para descargas desde APIs externas.
@@ -60,10 +69,25 @@ async def lifespan(app: FastAPI):
         logger.error("Error conectando a MongoDB", error=str(e))
         # No fallar el inicio si MongoDB no está disponible
     
+    # Indexar el almacenamiento existente la primera vez (en segundo plano)
+    index_task = None
+    try:
+        if await manifest_index.is_empty():
+            storage = get_storage_service()
+            index_task = asyncio.create_task(manifest_index.rebuild(scanner=storage.scan_index_entries))
+            logger.info("Índice de imágenes vacío, reconstruyendo en segundo plano")
+    except Exception as e:
+        logger.error("Error comprobando el índice de imágenes", error=str(e))
+    
     yield
     
     # Shutdown
     logger.info("Cerrando servicio de imágenes")
+    image_requests_log.flush()
+    
+    if index_task is not None and not index_task.done():
+        # La reconstrucción corre en un hilo y se completa aunque se cancele la tarea
+        index_task.cancel()
     
     # Desconectar de MongoDB
     try:
@@ -93,6 +117,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Métricas de Prometheus por petición (latencia, estado y ruta)
+app.add_middleware(MetricsMiddleware)
+
 
 # Middleware para logging de requests
 @app.middleware("http")
@@ -101,11 +128,14 @@ async def log_requests(request: Request, call_next):
     Middleware para logging detallado de todas las requests.
     
     Registra:
-    - Inicio de cada request con método y path
+    - Inicio de cada request con método y path (solo en DEBUG)
     - Duración de procesamiento
     - Estado de respuesta
     - Errores si ocurren
     
+    Las peticiones a /images no se escriben una a una: se agregan en un
+    resumen periódico (número, duración total y máxima, estados).
+    
     Añade headers de respuesta:
     - X-Request-ID: ID único de la request
     - X-Process-Time: Tiempo de procesamiento en segundos
@@ -116,7 +146,7 @@ async def log_requests(request: Request, call_next):
     request_id = request.headers.get("X-Request-ID", f"req_{int(time.time() * 1000)}")
     
     # Log de inicio
-    logger.info(
+    logger.debug(
         "Request iniciada",
         request_id=request_id,
         method=request.method,
@@ -130,14 +160,22 @@ async def log_requests(request: Request, call_next):
         
         # Log de fin
         duration = time.time() - start_time
-        logger.info(
-            "Request completada",
-            request_id=request_id,
-            method=request.method,
-            path=request.url.path,
-            status_code=response.status_code,
-            duration=round(duration, 3)
-        )
+        if request.url.path.startswith(IMAGE_ROUTES_PREFIX):
+            image_requests_log.record(
+                count_by="status_code",
+                path=request.url.path,
+                status_code=response.status_code,
+                duration=duration
+            )
+        else:
+            logger.info(
+                "Request completada",
+                request_id=request_id,
+                method=request.method,
+                path=request.url.path,
+                status_code=response.status_code,
+                duration=round(duration, 3)
+            )
         
         # Añadir headers
         response.headers["X-Request-ID"] = request_id
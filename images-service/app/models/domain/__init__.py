@@ -1,11 +1,14 @@
 """
 Modelos de dominio
 """
-from .job import Job, JobType, JobStatus, JobError
-from .image import ImageInfo, ProcessedImages, ImageMetadata, calculate_file_hash, calculate_bytes_hash
+from .job import Job, JobType, JobStatus, JobError, JobPriority
+from .image import (
+    ImageInfo, ProcessedImages, ImageMetadata, PROCESSED_CATEGORIES,
+    calculate_file_hash, calculate_bytes_hash
+)
 
 __all__ = [
-    "Job", "JobType", "JobStatus", "JobError",
-    "ImageInfo", "ProcessedImages", "ImageMetadata",
+    "Job", "JobType", "JobStatus", "JobError", "JobPriority",
+    "ImageInfo", "ProcessedImages", "ImageMetadata", "PROCESSED_CATEGORIES",
     "calculate_file_hash", "calculate_bytes_hash"
 ]
@@ -8,6 +8,10 @@ from pathlib import Path
 import hashlib
 
 
+# Categorías de imágenes procesadas: tamaños redimensionados y conversiones a tamaño completo
+PROCESSED_CATEGORIES = ("webp", "thumbnail", "optimized", "medium", "avif")
+
+
 @dataclass
 class ImageInfo:
     """Información de una imagen individual"""
@@ -20,6 +24,8 @@ class ImageInfo:
     hash: str
     downloaded_at: datetime
     error: Optional[str] = None
+    perceptual_hash: Optional[str] = None  # dHash de 64 bits en hexadecimal
+    duplicate_of: Optional[str] = None  # "documento/fichero" de la imagen casi idéntica que se conserva
     
     @property
     def size_mb(self) -> float:
@@ -46,8 +52,27 @@ class ImageInfo:
             "aspect_ratio": round(self.aspect_ratio, 2),
             "hash": self.hash,
             "downloaded_at": self.downloaded_at.isoformat(),
-            "error": self.error
+            "error": self.error,
+            "perceptual_hash": self.perceptual_hash,
+            "duplicate_of": self.duplicate_of
         }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ImageInfo":
+        """Crea desde un diccionario"""
+        return cls(
+            filename=data["filename"],
+            url=data["url"],
+            size_bytes=data["size_bytes"],
+            mime_type=data["mime_type"],
+            width=data["width"],
+            height=data["height"],
+            hash=data["hash"],
+            downloaded_at=datetime.fromisoformat(data["downloaded_at"]),
+            error=data.get("error"),
+            perceptual_hash=data.get("perceptual_hash"),
+            duplicate_of=data.get("duplicate_of")
+        )
 
 
 @dataclass
@@ -56,13 +81,19 @@ class ProcessedImages:
     webp: List[ImageInfo] = field(default_factory=list)
     thumbnail: List[ImageInfo] = field(default_factory=list)
     optimized: List[ImageInfo] = field(default_factory=list)
+    medium: List[ImageInfo] = field(default_factory=list)
+    avif: List[ImageInfo] = field(default_factory=list)
+    
+    @property
+    def total(self) -> int:
+        """Total de imágenes procesadas"""
+        return sum(len(getattr(self, category)) for category in PROCESSED_CATEGORIES)
     
     def to_dict(self) -> Dict[str, List[Dict[str, Any]]]:
         """Convierte a diccionario"""
         return {
-            "webp": [img.to_dict() for img in self.webp],
-            "thumbnail": [img.to_dict() for img in self.thumbnail],
-            "optimized": [img.to_dict() for img in self.optimized]
+            category: [img.to_dict() for img in getattr(self, category)]
+            for category in PROCESSED_CATEGORIES
         }
 
 
@@ -105,6 +136,11 @@ class ImageMetadata:
         """Número de descargas exitosas"""
         return sum(1 for img in self.original_images if not img.error)
     
+    @property
+    def near_duplicates(self) -> int:
+        """Imágenes marcadas como casi duplicadas de otra"""
+        return sum(1 for img in self.original_images if img.duplicate_of)
+    
     def add_original_image(self, image_info: ImageInfo):
         """Añade una imagen original"""
         self.original_images.append(image_info)
@@ -112,12 +148,10 @@ class ImageMetadata:
     
     def add_processed_image(self, image_info: ImageInfo, format_type: str):
         """Añade una imagen procesada"""
-        if format_type == "webp":
-            self.processed_images.webp.append(image_info)
-        elif format_type == "thumbnail":
-            self.processed_images.thumbnail.append(image_info)
-        elif format_type == "optimized":
-            self.processed_images.optimized.append(image_info)
+        if format_type not in PROCESSED_CATEGORIES:
+            # Un derivado sin categoría quedaría en disco sin registrar en la metadata
+            raise ValueError(f"Categoría de imagen procesada desconocida: {format_type}")
+        getattr(self.processed_images, format_type).append(image_info)
         self.updated_at = datetime.utcnow()
     
     def to_dict(self) -> Dict[str, Any]:
@@ -136,6 +170,7 @@ class ImageMetadata:
                 "total_images": self.total_images,
                 "successful_downloads": self.successful_downloads,
                 "failed_downloads": self.failed_downloads,
+                "near_duplicates": self.near_duplicates,
                 "total_size_bytes": self.total_size_bytes,
                 "total_size_mb": round(self.total_size_mb, 2)
             },
@@ -148,41 +183,17 @@ class ImageMetadata:
     def from_dict(cls, data: Dict[str, Any]) -> "ImageMetadata":
         """Crea desde un diccionario"""
         # Convertir imágenes originales
-        original_images = []
-        for img_data in data.get("images", {}).get("original", []):
-            img = ImageInfo(
-                filename=img_data["filename"],
-                url=img_data["url"],
-                size_bytes=img_data["size_bytes"],
-                mime_type=img_data["mime_type"],
-                width=img_data["width"],
-                height=img_data["height"],
-                hash=img_data["hash"],
-                downloaded_at=datetime.fromisoformat(img_data["downloaded_at"]),
-                error=img_data.get("error")
-            )
-            original_images.append(img)
+        original_images = [
+            ImageInfo.from_dict(img_data)
+            for img_data in data.get("images", {}).get("original", [])
+        ]
         
         # Convertir imágenes procesadas
         processed = ProcessedImages()
         processed_data = data.get("images", {}).get("processed", {})
         
-        for format_type in ["webp", "thumbnail", "optimized"]:
-            images = []
-            for img_data in processed_data.get(format_type, []):
-                img = ImageInfo(
-                    filename=img_data["filename"],
-                    url=img_data["url"],
-                    size_bytes=img_data["size_bytes"],
-                    mime_type=img_data["mime_type"],
-                    width=img_data["width"],
-                    height=img_data["height"],
-                    hash=img_data["hash"],
-                    downloaded_at=datetime.fromisoformat(img_data["downloaded_at"]),
-                    error=img_data.get("error")
-                )
-                images.append(img)
-            
+        for format_type in PROCESSED_CATEGORIES:
+            images = [ImageInfo.from_dict(img_data) for img_data in processed_data.get(format_type, [])]
             setattr(processed, format_type, images)
         
         return cls(
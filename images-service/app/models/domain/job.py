@@ -5,6 +5,8 @@ from datetime import datetime
 from typing import Optional, List, Dict, Any
 from enum import Enum
 from dataclasses import dataclass, field
+import hashlib
+import json
 
 
 class JobType(str, Enum):
@@ -12,9 +14,16 @@ class JobType(str, Enum):
     DOWNLOAD_COLLECTION = "download_collection"
     DOWNLOAD_DOCUMENT = "download_document"
     DOWNLOAD_BATCH = "download_batch"
+    DOWNLOAD_API_URL = "download_api_url"
     PROCESS = "process"
 
 
+class JobPriority(str, Enum):
+    """Clases de prioridad (cada una se procesa en su propia cola de Celery)"""
+    INTERACTIVE = "interactive"  # Documentos sueltos lanzados a mano: se encolan al momento
+    BULK = "bulk"  # Colecciones y batches: se reparten con colas justas por colección
+
+
 class JobStatus(str, Enum):
     """Estados posibles de un job"""
     PENDING = "pending"
@@ -24,6 +33,13 @@ class JobStatus(str, Enum):
     CANCELLED = "cancelled"
 
 
+# Metadata que cambia el resultado de un job y forma parte de su clave de deduplicación
+DEDUP_METADATA_KEYS = ("api_url", "limit", "skip")
+
+# Metadata que calcula el servidor (no viene en la petición) y queda fuera de su huella
+FINGERPRINT_IGNORED_METADATA = ("total_documents",)
+
+
 @dataclass
 class JobError:
     """Error ocurrido durante la ejecución de un job"""
@@ -31,6 +47,15 @@ class JobError:
     message: str
     error_type: str
     details: Dict[str, Any] = field(default_factory=dict)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Convierte el error a diccionario"""
+        return {
+            "timestamp": self.timestamp.isoformat(),
+            "message": self.message,
+            "error_type": self.error_type,
+            "details": self.details
+        }
 
 
 @dataclass
@@ -51,6 +76,18 @@ class Job:
     completed_at: Optional[datetime] = None
     metadata: Dict[str, Any] = field(default_factory=dict)
     errors: List[JobError] = field(default_factory=list)
+    priority: Optional[JobPriority] = None
+    queued_at: Optional[datetime] = None
+    dedup_key: Optional[str] = None
+    idempotency_key: Optional[str] = None
+    request_fingerprint: Optional[str] = None
+    
+    def __post_init__(self):
+        # Por defecto solo los jobs de un documento son interactivos
+        if self.priority is None:
+            self.priority = (
+                JobPriority.INTERACTIVE if self.type == JobType.DOWNLOAD_DOCUMENT else JobPriority.BULK
+            )
     
     @property
     def progress_percentage(self) -> float:
@@ -64,6 +101,52 @@ class Job:
         """Verifica si el job ha terminado"""
         return self.status in [JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED]
     
+    @property
+    def active_key(self) -> Optional[str]:
+        """
+        Clave en el índice de jobs activos (índice único en MongoDB)
+        
+        Solo existe mientras el job está PENDING o RUNNING, así un segundo job
+        con el mismo objetivo no puede crearse hasta que el primero termina.
+        """
+        return None if self.is_finished else self.dedup_key
+    
+    def compute_dedup_key(self) -> str:
+        """Clave del objetivo del job: tipo, colección, documento/filtro y límites"""
+        target = {
+            "type": self.type.value,
+            "database": self.database,
+            "collection": self.collection,
+            "document_id": self.document_id,
+            "filter_query": self.filter_query,
+            "metadata": {key: self.metadata.get(key) for key in DEDUP_METADATA_KEYS}
+        }
+        canonical = json.dumps(target, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha1(canonical.encode()).hexdigest()
+    
+    def compute_request_fingerprint(self) -> str:
+        """
+        Huella de la petición que creó el job (se guarda con su Idempotency-Key)
+        
+        A diferencia de compute_dedup_key incluye toda la metadata enviada y la
+        prioridad: reutilizar la clave con otra petición se detecta aunque el
+        objetivo sea el mismo.
+        """
+        request = {
+            "type": self.type.value,
+            "database": self.database,
+            "collection": self.collection,
+            "document_id": self.document_id,
+            "filter_query": self.filter_query,
+            "priority": self.priority.value,
+            "metadata": {
+                key: value for key, value in self.metadata.items()
+                if key not in FINGERPRINT_IGNORED_METADATA
+            }
+        }
+        canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha1(canonical.encode()).hexdigest()
+    
     @property
     def duration(self) -> Optional[float]:
         """Calcula la duración del job en segundos"""
@@ -73,7 +156,7 @@ class Job:
         end_time = self.completed_at or datetime.utcnow()
         return (end_time - self.started_at).total_seconds()
     
-    def add_error(self, message: str, error_type: str = "GenericError", details: Dict[str, Any] = None):
+    def add_error(self, message: str, error_type: str = "GenericError", details: Dict[str, Any] = None) -> JobError:
         """Añade un error al job"""
         error = JobError(
             timestamp=datetime.utcnow(),
@@ -83,6 +166,7 @@ class Job:
         )
         self.errors.append(error)
         self.failed_items += 1
+        return error
     
     def start(self):
         """Marca el job como iniciado"""
@@ -125,15 +209,13 @@ class Job:
             "completed_at": self.completed_at.isoformat() if self.completed_at else None,
             "duration": self.duration,
             "metadata": self.metadata,
-            "errors": [
-                {
-                    "timestamp": error.timestamp.isoformat(),
-                    "message": error.message,
-                    "error_type": error.error_type,
-                    "details": error.details
-                }
-                for error in self.errors
-            ]
+            "errors": [error.to_dict() for error in self.errors],
+            "priority": self.priority.value,
+            "queued_at": self.queued_at.isoformat() if self.queued_at else None,
+            "dedup_key": self.dedup_key,
+            "active_key": self.active_key,
+            "idempotency_key": self.idempotency_key,
+            "request_fingerprint": self.request_fingerprint
         }
     
     @classmethod
@@ -147,6 +229,7 @@ class Job:
         created_at = datetime.fromisoformat(data["created_at"]) if isinstance(data["created_at"], str) else data["created_at"]
         started_at = datetime.fromisoformat(data["started_at"]) if data.get("started_at") else None
         completed_at = datetime.fromisoformat(data["completed_at"]) if data.get("completed_at") else None
+        queued_at = datetime.fromisoformat(data["queued_at"]) if data.get("queued_at") else None
         
         # Convertir errores
         errors = []
@@ -174,5 +257,10 @@ class Job:
             started_at=started_at,
             completed_at=completed_at,
             metadata=data.get("metadata", {}),
-            errors=errors
+            errors=errors,
+            priority=JobPriority(data["priority"]) if data.get("priority") else None,
+            queued_at=queued_at,
+            dedup_key=data.get("dedup_key"),
+            idempotency_key=data.get("idempotency_key"),
+            request_fingerprint=data.get("request_fingerprint")
         )
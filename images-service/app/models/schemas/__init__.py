@@ -8,7 +8,7 @@ from .job import (
 from .common import (
     HealthResponse, MetricsResponse, ErrorResponse, 
     SuccessResponse, PaginationParams, WebhookPayload,
-    ImageDownloadStats
+    WebhookBatchPayload, ImageDownloadStats
 )
 
 __all__ = [
@@ -18,5 +18,5 @@ __all__ = [
     # Common schemas
     "HealthResponse", "MetricsResponse", "ErrorResponse",
     "SuccessResponse", "PaginationParams", "WebhookPayload",
-    "ImageDownloadStats"
+    "WebhookBatchPayload", "ImageDownloadStats"
 ]
@@ -109,6 +109,7 @@ class PaginationParams(BaseModel):
 
 class WebhookPayload(BaseModel):
     """Schema para payload de webhook"""
+    delivery_id: Optional[str] = Field(None, description="ID de la entrega (igual en todos los reintentos)")
     event: str = Field(..., description="Tipo de evento")
     job_id: str = Field(..., description="ID del job")
     status: str = Field(..., description="Estado del job")
@@ -132,6 +133,11 @@ class WebhookPayload(BaseModel):
         }
 
 
+class WebhookBatchPayload(BaseModel):
+    """Schema para varios eventos de webhook en una petición (WEBHOOK_BATCH_SIZE > 1)"""
+    events: List[WebhookPayload] = Field(..., description="Eventos en orden de creación")
+
+
 class ImageDownloadStats(BaseModel):
     """Schema para estadísticas de descarga"""
     total_images: int = Field(..., description="Total de imágenes")
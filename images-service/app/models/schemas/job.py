@@ -5,7 +5,7 @@ from datetime import datetime
 from typing import Optional, List, Dict, Any
 from pydantic import BaseModel, Field, validator
 
-from app.models.domain import JobType, JobStatus
+from app.models.domain import JobType, JobStatus, JobPriority
 
 
 class JobCreateRequest(BaseModel):
@@ -15,6 +15,7 @@ class JobCreateRequest(BaseModel):
     collection: str = Field(..., description="Colección MongoDB")
     document_id: Optional[str] = Field(None, description="ID del documento específico")
     filter_query: Optional[Dict[str, Any]] = Field(None, description="Filtro MongoDB para batch")
+    priority: Optional[JobPriority] = Field(None, description="interactive o bulk (por defecto según el tipo)")
     metadata: Optional[Dict[str, Any]] = Field(default_factory=dict, description="Metadata adicional")
     
     @validator("database", "collection")
@@ -64,6 +65,9 @@ class JobResponse(BaseModel):
     duration: Optional[float] = None
     metadata: Dict[str, Any] = Field(default_factory=dict)
     errors: List[JobErrorResponse] = Field(default_factory=list)
+    priority: Optional[JobPriority] = None
+    queued_at: Optional[datetime] = None
+    idempotency_key: Optional[str] = None
     
     class Config:
         populate_by_name = True
@@ -126,6 +130,7 @@ class BatchDownloadRequest(BaseModel):
     filter: Dict[str, Any] = Field(..., description="Filtro MongoDB")
     limit: Optional[int] = Field(None, description="Límite de documentos", ge=1)
     skip: Optional[int] = Field(None, description="Documentos a saltar", ge=0)
+    priority: Optional[JobPriority] = Field(None, description="interactive o bulk (por defecto bulk)")
     metadata: Optional[Dict[str, Any]] = Field(default_factory=dict)
     
     class Config:
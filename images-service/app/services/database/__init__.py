@@ -2,5 +2,7 @@
 Servicios de base de datos
 """
 from .mongo_repository import mongo_repository
+from .job_progress import JobProgressTracker
+from .document_updates import DocumentUpdateBuffer
 
-__all__ = ["mongo_repository"]
+__all__ = ["mongo_repository", "JobProgressTracker", "DocumentUpdateBuffer"]
@@ -0,0 +1,94 @@
+"""
+Buffer de actualizaciones de documentos escritas con bulk_write
+"""
+from typing import Optional, Dict, Any, List, Tuple
+import asyncio
+import contextlib
+
+from app.core import logger, settings
+from .mongo_repository import MongoRepository, mongo_repository
+
+
+class DocumentUpdateBuffer:
+    """
+    Agrupa los $set de los documentos procesados por un job
+    
+    En lugar de un update_one por documento, las actualizaciones se acumulan y
+    se envían con un bulk_write de UpdateOne cada batch_size documentos o cada
+    flush_interval segundos (lo que ocurra antes). Si el mismo documento se
+    actualiza dos veces antes del flush solo viaja la versión combinada.
+    """
+    
+    def __init__(
+        self,
+        database: str,
+        collection: str,
+        repository: Optional[MongoRepository] = None,
+        batch_size: int = None,
+        flush_interval: float = None
+    ):
+        self.database = database
+        self.collection = collection
+        self.db = repository or mongo_repository
+        self.batch_size = batch_size or settings.document_update_batch_size
+        self.flush_interval = flush_interval or settings.document_update_flush_interval
+        
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.round_trips = 0
+    
+    def start(self) -> None:
+        """Arranca el flush periódico en segundo plano"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+    
+    async def stop(self) -> None:
+        """Detiene el flush periódico (no realiza un flush final)"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._flush_task
+            self._flush_task = None
+    
+    async def add(self, document_id: str, update_data: Dict[str, Any]) -> None:
+        """Encola la actualización de un documento y hace flush si el lote está lleno"""
+        self._pending.setdefault(document_id, {}).update(update_data)
+        
+        if len(self._pending) >= self.batch_size:
+            await self.flush()
+    
+    async def flush(self) -> None:
+        """Envía a MongoDB las actualizaciones acumuladas"""
+        async with self._lock:
+            if not self._pending:
+                return
+            
+            updates: List[Tuple[str, Dict[str, Any]]] = list(self._pending.items())
+            self._pending = {}
+            
+            try:
+                await self.db.bulk_update_documents(self.database, self.collection, updates)
+            except Exception:
+                # Reencolar sin pisar lo que haya llegado durante el flush
+                for document_id, update_data in updates:
+                    self._pending[document_id] = {**update_data, **self._pending.get(document_id, {})}
+                raise
+            
+            self.written += len(updates)
+            self.round_trips += 1
+    
+    async def _flush_loop(self) -> None:
+        """Bucle de flush periódico"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(
+                    "Error guardando actualizaciones de documentos",
+                    database=self.database,
+                    collection=self.collection,
+                    error=str(e)
+                )
@@ -0,0 +1,148 @@
+"""
+Seguimiento del progreso de jobs con updates incrementales agrupados
+"""
+from typing import Optional, Dict, Any
+from collections import deque
+import asyncio
+import contextlib
+
+from app.core import logger, settings
+from app.models.domain import Job, JobStatus
+from .mongo_repository import MongoRepository, mongo_repository
+
+
+# Campos que solo escribe el flush final
+FINAL_FIELDS = ("status", "completed_at", "duration", "active_key")
+
+
+class JobProgressTracker:
+    """
+    Acumula los cambios de progreso de un job y los escribe en MongoDB como deltas
+    
+    En lugar de reescribir el documento completo del job en cada error o lote,
+    los contadores se envían con $set/$inc y los errores con $push + $slice,
+    agrupados en un flush periódico. El coste de cada update es constante
+    independientemente del tamaño del job.
+    """
+    
+    def __init__(
+        self,
+        job: Job,
+        repository: Optional[MongoRepository] = None,
+        flush_interval: float = None,
+        max_errors: int = None
+    ):
+        self.job = job
+        self.db = repository or mongo_repository
+        self.flush_interval = flush_interval or settings.job_progress_flush_interval
+        self.max_errors = max_errors or settings.job_max_errors
+        
+        self._dirty = False
+        self._pending_failed = 0
+        self._pending_errors: deque = deque(maxlen=self.max_errors)
+        self._lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+    
+    def start(self) -> None:
+        """Arranca el flush periódico en segundo plano"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+    
+    async def stop(self) -> None:
+        """Detiene el flush periódico (no realiza un flush final)"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._flush_task
+            self._flush_task = None
+    
+    def touch(self) -> None:
+        """Marca que los contadores del job han cambiado"""
+        self._dirty = True
+    
+    def add_error(self, message: str, error_type: str = "GenericError", details: Dict[str, Any] = None) -> None:
+        """Registra un error en el job y lo deja pendiente de enviar"""
+        error = self.job.add_error(message, error_type, details)
+        
+        # Mantener acotada también la lista en memoria
+        if len(self.job.errors) > self.max_errors:
+            del self.job.errors[:-self.max_errors]
+        
+        self._pending_errors.append(error.to_dict())
+        self._pending_failed += 1
+    
+    async def flush(self, final: bool = False, extra_fields: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Envía a MongoDB los cambios acumulados
+        
+        Args:
+            final: Incluye el estado final del job (status, completed_at, duration)
+            extra_fields: Campos adicionales a escribir con $set (p. ej. "metadata.x")
+        
+        Returns:
+            False si el flush final no se aplicó porque el job se canceló desde
+            la API; en ese caso el job en memoria pasa a CANCELLED
+        """
+        async with self._lock:
+            if not (final or extra_fields or self._dirty or self._pending_failed or self._pending_errors):
+                return True
+            
+            set_fields = {
+                "total_items": self.job.total_items,
+                "processed_items": self.job.processed_items,
+                "progress_percentage": self.job.progress_percentage
+            }
+            if final:
+                # El estado solo se escribe al final y nunca sobre una cancelación hecha desde la API
+                set_fields.update({
+                    "status": self.job.status.value,
+                    "completed_at": self.job.completed_at.isoformat() if self.job.completed_at else None,
+                    "duration": self.job.duration,
+                    # Un job terminado deja libre su clave en el índice de jobs activos
+                    "active_key": self.job.active_key
+                })
+            if extra_fields:
+                set_fields.update(extra_fields)
+            
+            errors = list(self._pending_errors)
+            failed = self._pending_failed
+            self._pending_errors.clear()
+            self._pending_failed = 0
+            self._dirty = False
+            
+            try:
+                applied = await self.db.apply_job_delta(
+                    self.job.id,
+                    set_fields=set_fields,
+                    inc_fields={"failed_items": failed} if failed else None,
+                    errors=errors,
+                    max_errors=self.max_errors,
+                    status_filter={"$ne": JobStatus.CANCELLED.value} if final else None
+                )
+                if not applied:
+                    # Cancelado entre la última comprobación y este flush: se guarda
+                    # el progreso alcanzado sin tocar el estado que puso la API
+                    self.job.cancel()
+                    await self.db.apply_job_delta(
+                        self.job.id,
+                        set_fields={key: value for key, value in set_fields.items() if key not in FINAL_FIELDS},
+                        inc_fields={"failed_items": failed} if failed else None,
+                        errors=errors,
+                        max_errors=self.max_errors
+                    )
+                return applied
+            except Exception:
+                # Reencolar para el siguiente flush
+                self._pending_errors = deque(errors + list(self._pending_errors), maxlen=self.max_errors)
+                self._pending_failed += failed
+                self._dirty = True
+                raise
+    
+    async def _flush_loop(self) -> None:
+        """Bucle de flush periódico"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning("Error guardando progreso del job", job_id=self.job.id, error=str(e))
@@ -1,16 +1,17 @@
 """
 Repositorio MongoDB para el servicio de imágenes
 """
-from typing import Optional, List, Dict, Any, AsyncIterator
-from datetime import datetime
+from typing import Optional, List, Dict, Any, AsyncIterator, Tuple
+from datetime import datetime, timedelta
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase, AsyncIOMotorCollection
-from pymongo import ASCENDING, DESCENDING
+from pymongo import ASCENDING, DESCENDING, UpdateOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from bson import ObjectId
 import asyncio
 
 from app.core import logger, settings
-from app.core.exceptions import DatabaseException, NotFoundException
-from app.models.domain import Job, JobStatus
+from app.core.exceptions import DatabaseException, NotFoundException, IdempotencyKeyMismatchException
+from app.models.domain import Job, JobStatus, JobPriority, JobType, JobError
 
 
 class MongoRepository:
@@ -20,6 +21,7 @@ class MongoRepository:
         self._client: Optional[AsyncIOMotorClient] = None
         self._db: Optional[AsyncIOMotorDatabase] = None
         self._jobs_collection: Optional[AsyncIOMotorCollection] = None
+        self._webhooks_collection: Optional[AsyncIOMotorCollection] = None
         self._lock = asyncio.Lock()
     
     async def connect(self) -> None:
@@ -43,6 +45,7 @@ class MongoRepository:
                 
                 self._db = self._client[settings.mongodb_database]
                 self._jobs_collection = self._db["image_jobs"]
+                self._webhooks_collection = self._db["webhook_deliveries"]
                 
                 # Crear índices
                 await self._create_indexes()
@@ -61,6 +64,7 @@ class MongoRepository:
                 self._client = None
                 self._db = None
                 self._jobs_collection = None
+                self._webhooks_collection = None
                 logger.info("Desconectado de MongoDB")
     
     async def _create_indexes(self) -> None:
@@ -75,6 +79,34 @@ class MongoRepository:
                 ("collection", ASCENDING),
                 ("status", ASCENDING)
             ])
+            # Deduplicación: un único job activo por objetivo y un job por Idempotency-Key
+            await self._jobs_collection.create_index(
+                [("active_key", ASCENDING)],
+                unique=True,
+                partialFilterExpression={"active_key": {"$type": "string"}}
+            )
+            await self._jobs_collection.create_index(
+                [("idempotency_key", ASCENDING)],
+                unique=True,
+                partialFilterExpression={"idempotency_key": {"$type": "string"}}
+            )
+            # Sondeo del dispatcher cuando no hay change streams
+            await self._jobs_collection.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+            # Planificador: jobs pendientes/activos por prioridad en orden de llegada
+            await self._jobs_collection.create_index([
+                ("priority", ASCENDING),
+                ("status", ASCENDING),
+                ("created_at", ASCENDING)
+            ])
+            
+            # Entregas de webhooks: pendientes por fecha de reintento, reclamadas por
+            # token y borrado automático de las terminadas
+            await self._webhooks_collection.create_index([("status", ASCENDING), ("next_attempt_at", ASCENDING)])
+            await self._webhooks_collection.create_index([("claim", ASCENDING)], sparse=True)
+            await self._webhooks_collection.create_index(
+                [("finished_at", ASCENDING)],
+                expireAfterSeconds=settings.webhook_retention_days * 86400
+            )
             
             logger.info("Índices creados correctamente")
         except Exception as e:
@@ -87,31 +119,141 @@ class MongoRepository:
     
     # Operaciones con Jobs
     
+    @staticmethod
+    def _job_key(job_id: str) -> Any:
+        """
+        Valor de _id con el que buscar un job
+        
+        Los jobs nuevos se guardan con ObjectId; los creados antes con el uuid4
+        del endpoint conservan su _id de texto y se buscan tal cual.
+        """
+        return ObjectId(job_id) if ObjectId.is_valid(job_id) else job_id
+    
     async def create_job(self, job: Job) -> Job:
         """Crea un nuevo job"""
         await self._ensure_connected()
         
         try:
             job_dict = job.to_dict()
+            # Los IDs uuid4 de los endpoints se sustituyen por un ObjectId (ver _job_key)
+            job_dict["_id"] = ObjectId(job.id) if ObjectId.is_valid(job.id) else ObjectId()
             result = await self._jobs_collection.insert_one(job_dict)
             job.id = str(result.inserted_id)
             
             logger.info("Job creado", job_id=job.id, type=job.type.value)
             return job
             
+        except DuplicateKeyError as e:
+            logger.info("Job duplicado", type=job.type.value, error=str(e))
+            raise DatabaseException(f"Error creando job: {str(e)}") from e
         except Exception as e:
             logger.error("Error creando job", error=str(e))
             raise DatabaseException(f"Error creando job: {str(e)}")
     
+    async def create_or_attach_job(self, job: Job) -> Tuple[Job, bool]:
+        """
+        Crea un job salvo que ya exista uno equivalente
+        
+        - Misma Idempotency-Key: se devuelve el job de la primera petición. Si
+          la petición no es la misma (otra huella) se lanza
+          IdempotencyKeyMismatchException.
+        - Mismo objetivo (tipo, colección, documento/filtro) y aún PENDING o
+          RUNNING: se devuelve ese job. Lo garantiza el índice único sobre
+          active_key, también con varias instancias de la API a la vez.
+        - Documento de una colección que ya se está descargando entera: se
+          devuelve el job de la colección (JOB_COALESCE_DOCUMENTS).
+        
+        Returns:
+            (job, creado): creado es False si se devuelve un job existente
+        """
+        await self._ensure_connected()
+        
+        job.dedup_key = job.compute_dedup_key()
+        if job.idempotency_key:
+            job.request_fingerprint = job.compute_request_fingerprint()
+        
+        for _ in range(3):
+            existing = await self._find_equivalent_job(job)
+            if existing:
+                logger.info(
+                    "Petición unida a un job existente",
+                    job_id=existing.id,
+                    type=job.type.value,
+                    existing_type=existing.type.value,
+                    idempotency_key=job.idempotency_key
+                )
+                return existing, False
+            
+            try:
+                return await self.create_job(job), True
+            except DatabaseException as e:
+                if not isinstance(e.__cause__, DuplicateKeyError):
+                    raise
+                # Otra petición creó el job equivalente entre la búsqueda y el insert
+        
+        raise DatabaseException("No se pudo crear el job: conflicto persistente de deduplicación")
+    
+    async def _find_equivalent_job(self, job: Job) -> Optional[Job]:
+        """Busca un job al que unir la petición (ver create_or_attach_job)"""
+        if job.idempotency_key:
+            job_dict = await self._jobs_collection.find_one({"idempotency_key": job.idempotency_key})
+            if job_dict:
+                job_dict["_id"] = str(job_dict["_id"])
+                existing = Job.from_dict(job_dict)
+                # Los jobs anteriores a la huella se siguen devolviendo sin comprobarla
+                if existing.request_fingerprint and existing.request_fingerprint != job.request_fingerprint:
+                    raise IdempotencyKeyMismatchException(job.idempotency_key, job_id=existing.id)
+                return existing
+        
+        keys = [job.dedup_key]
+        if job.type == JobType.DOWNLOAD_DOCUMENT and settings.job_coalesce_documents:
+            collection_job = Job(
+                id="",
+                type=JobType.DOWNLOAD_COLLECTION,
+                status=JobStatus.PENDING,
+                database=job.database,
+                collection=job.collection
+            )
+            keys.append(collection_job.compute_dedup_key())
+        
+        for key in keys:
+            job_dict = await self._jobs_collection.find_one({"active_key": key})
+            if not job_dict:
+                continue
+            
+            raw_id = job_dict["_id"]
+            job_dict["_id"] = str(raw_id)
+            existing = Job.from_dict(job_dict)
+            if await self._release_stale_active_key(existing, raw_id):
+                continue
+            return existing
+        
+        return None
+    
+    async def _release_stale_active_key(self, job: Job, raw_id: Any) -> bool:
+        """
+        Libera la clave de un job RUNNING que superó JOB_MAX_RUNTIME
+        
+        Un worker muerto no llega a marcar su job como terminado; sin esto su
+        objetivo quedaría bloqueado para siempre.
+        """
+        running_since = datetime.utcnow() - timedelta(seconds=settings.job_max_runtime)
+        if job.status != JobStatus.RUNNING or not job.started_at or job.started_at >= running_since:
+            return False
+        
+        await self._jobs_collection.update_one(
+            {"_id": raw_id, "status": JobStatus.RUNNING.value, "active_key": job.active_key},
+            {"$set": {"active_key": None}}
+        )
+        logger.warning("Clave de job activo liberada: el job parece abandonado", job_id=job.id, started_at=job.started_at.isoformat())
+        return True
+    
     async def get_job(self, job_id: str) -> Job:
         """Obtiene un job por ID"""
         await self._ensure_connected()
         
         try:
-            if not ObjectId.is_valid(job_id):
-                raise NotFoundException("Job no encontrado", resource_type="job", resource_id=job_id)
-            
-            job_dict = await self._jobs_collection.find_one({"_id": ObjectId(job_id)})
+            job_dict = await self._jobs_collection.find_one({"_id": self._job_key(job_id)})
             
             if not job_dict:
                 raise NotFoundException("Job no encontrado", resource_type="job", resource_id=job_id)
@@ -134,7 +276,7 @@ class MongoRepository:
             job_dict.pop("_id", None)  # Eliminar _id del update
             
             result = await self._jobs_collection.update_one(
-                {"_id": ObjectId(job.id)},
+                {"_id": self._job_key(job.id)},
                 {"$set": job_dict}
             )
             
@@ -150,6 +292,109 @@ class MongoRepository:
             logger.error("Error actualizando job", job_id=job.id, error=str(e))
             raise DatabaseException(f"Error actualizando job: {str(e)}")
     
+    async def apply_job_delta(
+        self,
+        job_id: str,
+        set_fields: Optional[Dict[str, Any]] = None,
+        inc_fields: Optional[Dict[str, int]] = None,
+        errors: Optional[List[Dict[str, Any]]] = None,
+        max_errors: Optional[int] = None,
+        status_filter: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """
+        Aplica un update incremental a un job sin reescribir el documento completo
+        
+        Args:
+            job_id: ID del job
+            set_fields: Campos a sobrescribir ($set)
+            inc_fields: Contadores a incrementar ($inc)
+            errors: Errores nuevos a añadir a la lista ($push)
+            max_errors: Si se indica, la lista de errores se recorta a los últimos N ($slice)
+            status_filter: Condición sobre el estado (p. ej. {"$ne": "cancelled"});
+                si el job no la cumple no se aplica nada
+        
+        Returns:
+            False si el job no cumplía status_filter
+        """
+        await self._ensure_connected()
+        
+        update: Dict[str, Any] = {}
+        if set_fields:
+            update["$set"] = set_fields
+        if inc_fields:
+            update["$inc"] = inc_fields
+        if errors:
+            push: Dict[str, Any] = {"$each": errors}
+            if max_errors:
+                push["$slice"] = -max_errors
+            update["$push"] = {"errors": push}
+        
+        if not update:
+            return True
+        
+        query: Dict[str, Any] = {"_id": self._job_key(job_id)}
+        if status_filter is not None:
+            query["status"] = status_filter
+        
+        try:
+            result = await self._jobs_collection.update_one(query, update)
+            
+            if result.matched_count == 0:
+                if status_filter is not None:
+                    return False
+                raise NotFoundException("Job no encontrado", resource_type="job", resource_id=job_id)
+            
+            logger.debug("Delta de job aplicado", job_id=job_id, operators=list(update.keys()))
+            return True
+            
+        except NotFoundException:
+            raise
+        except Exception as e:
+            logger.error("Error aplicando delta del job", job_id=job_id, error=str(e))
+            raise DatabaseException(f"Error actualizando job: {str(e)}")
+    
+    async def get_job_status(self, job_id: str) -> Optional[JobStatus]:
+        """Obtiene solo el estado de un job (consulta ligera para sondeos)"""
+        await self._ensure_connected()
+        
+        try:
+            job_dict = await self._jobs_collection.find_one(
+                {"_id": self._job_key(job_id)},
+                projection={"status": 1}
+            )
+            
+            if not job_dict:
+                return None
+            
+            return JobStatus(job_dict["status"])
+            
+        except Exception as e:
+            logger.error("Error obteniendo estado del job", job_id=job_id, error=str(e))
+            raise DatabaseException(f"Error obteniendo estado del job: {str(e)}")
+    
+    async def count_jobs_by_type_and_status(self) -> Dict[Tuple[str, str], int]:
+        """
+        Cuenta los jobs por tipo y estado con una única agregación
+        
+        Returns:
+            Diccionario {(tipo, estado): número de jobs}
+        """
+        await self._ensure_connected()
+        
+        try:
+            cursor = self._jobs_collection.aggregate([
+                {"$group": {"_id": {"type": "$type", "status": "$status"}, "count": {"$sum": 1}}}
+            ])
+            
+            return {
+                (row["_id"].get("type"), row["_id"].get("status")): row["count"]
+                async for row in cursor
+            }
+            
+        except Exception as e:
+            logger.error("Error contando jobs", error=str(e))
+            raise DatabaseException(f"Error contando jobs: {str(e)}")
+    
     async def list_jobs(
         self,
         status: Optional[JobStatus] = None,
@@ -205,6 +450,301 @@ class MongoRepository:
         )
         return jobs
     
+    def _priority_filter(self, priority: JobPriority) -> Any:
+        """Filtro por prioridad (los jobs creados antes de existir el campo cuentan como bulk)"""
+        if priority == JobPriority.BULK:
+            return {"$in": [priority.value, None]}
+        return priority.value
+    
+    def _dispatchable_filter(self, stale_before: datetime) -> Dict[str, Any]:
+        """Jobs pendientes sin encolar (o encolados hace tanto que se dan por perdidos)"""
+        return {
+            "status": JobStatus.PENDING.value,
+            "$or": [
+                {"queued_at": None},
+                {"queued_at": {"$lt": stale_before.isoformat()}}
+            ]
+        }
+    
+    async def get_dispatchable_jobs(
+        self,
+        priority: JobPriority,
+        stale_before: datetime,
+        limit: int = 500
+    ) -> List[Job]:
+        """Obtiene jobs pendientes de encolar de una prioridad, por orden de llegada"""
+        await self._ensure_connected()
+        
+        try:
+            query = {"priority": self._priority_filter(priority), **self._dispatchable_filter(stale_before)}
+            cursor = self._jobs_collection.find(query).sort("created_at", ASCENDING).limit(limit)
+            
+            jobs = []
+            async for job_dict in cursor:
+                job_dict["_id"] = str(job_dict["_id"])
+                jobs.append(Job.from_dict(job_dict))
+            return jobs
+            
+        except Exception as e:
+            logger.error("Error obteniendo jobs pendientes de encolar", error=str(e))
+            raise DatabaseException(f"Error obteniendo jobs pendientes de encolar: {str(e)}")
+    
+    async def count_active_jobs_by_flow(
+        self,
+        priority: JobPriority,
+        stale_before: datetime,
+        running_since: datetime
+    ) -> Dict[Tuple[str, str], int]:
+        """
+        Cuenta los jobs encolados o en ejecución por (database, collection)
+        
+        Args:
+            stale_before: Los encolados antes de esta fecha se consideran perdidos
+            running_since: Los RUNNING iniciados antes se consideran muertos
+        """
+        await self._ensure_connected()
+        
+        try:
+            cursor = self._jobs_collection.aggregate([
+                {"$match": {
+                    "priority": self._priority_filter(priority),
+                    "$or": [
+                        {"status": JobStatus.PENDING.value, "queued_at": {"$gte": stale_before.isoformat()}},
+                        {"status": JobStatus.RUNNING.value, "started_at": {"$gte": running_since.isoformat()}}
+                    ]
+                }},
+                {"$group": {"_id": {"database": "$database", "collection": "$collection"}, "count": {"$sum": 1}}}
+            ])
+            
+            return {
+                (row["_id"].get("database"), row["_id"].get("collection")): row["count"]
+                async for row in cursor
+            }
+            
+        except Exception as e:
+            logger.error("Error contando jobs activos", error=str(e))
+            raise DatabaseException(f"Error contando jobs activos: {str(e)}")
+    
+    async def claim_job_for_queue(self, job_id: str, stale_before: datetime) -> bool:
+        """
+        Marca un job como encolado si nadie lo ha hecho antes (operación atómica)
+        
+        Con varios dispatchers a la vez solo uno obtiene el documento.
+        
+        Returns:
+            True si este proceso ha reclamado el job y debe enviarlo a Celery
+        """
+        await self._ensure_connected()
+        
+        try:
+            claimed = await self._jobs_collection.find_one_and_update(
+                {"_id": self._job_key(job_id), **self._dispatchable_filter(stale_before)},
+                {"$set": {"queued_at": datetime.utcnow().isoformat()}},
+                projection={"_id": 1}
+            )
+            return claimed is not None
+            
+        except Exception as e:
+            logger.error("Error reclamando job", job_id=job_id, error=str(e))
+            raise DatabaseException(f"Error reclamando job: {str(e)}")
+    
+    async def claim_job_for_processing(self, job_id: str) -> Optional[Job]:
+        """
+        Pasa un job de PENDING a RUNNING de forma atómica
+        
+        Si el mensaje de Celery llega dos veces (reencolado tras JOB_REQUEUE_AFTER,
+        redelivery de Redis...) solo el primer worker obtiene el job.
+        
+        Returns:
+            El job ya en RUNNING, o None si no estaba PENDING
+        """
+        await self._ensure_connected()
+        
+        try:
+            job_dict = await self._jobs_collection.find_one_and_update(
+                {"_id": self._job_key(job_id), "status": JobStatus.PENDING.value},
+                {"$set": {"status": JobStatus.RUNNING.value, "started_at": datetime.utcnow().isoformat()}},
+                return_document=ReturnDocument.AFTER
+            )
+            
+            if not job_dict:
+                return None
+            
+            job_dict["_id"] = str(job_dict["_id"])
+            return Job.from_dict(job_dict)
+            
+        except Exception as e:
+            logger.error("Error reclamando job para procesar", job_id=job_id, error=str(e))
+            raise DatabaseException(f"Error reclamando job para procesar: {str(e)}")
+    
+    def watch_jobs(self, pipeline: List[Dict[str, Any]], resume_after: Optional[Dict[str, Any]] = None):
+        """
+        Abre un change stream sobre image_jobs (requiere replica set)
+        
+        Returns:
+            Change stream de Motor, para usar con "async with"
+        """
+        return self._jobs_collection.watch(pipeline, resume_after=resume_after, max_await_time_ms=1000)
+    
+    async def release_job_claim(self, job_id: str) -> None:
+        """Deshace claim_job_for_queue cuando el envío a Celery falla"""
+        await self._ensure_connected()
+        
+        await self._jobs_collection.update_one(
+            {"_id": self._job_key(job_id), "status": JobStatus.PENDING.value},
+            {"$set": {"queued_at": None}}
+        )
+    
+    async def cancel_job(self, job_id: str, reason: Optional[str] = None) -> Optional[Job]:
+        """
+        Cancela un job PENDING o RUNNING con un único update atómico
+        
+        Solo toca el estado, completed_at y active_key (y añade el error de
+        cancelación): los contadores y errores que escribe el worker con deltas
+        no se pisan, y un job que acaba de terminar no pasa a CANCELLED.
+        
+        Returns:
+            El job ya cancelado, o None si no estaba PENDING ni RUNNING
+        """
+        await self._ensure_connected()
+        
+        update: Dict[str, Any] = {
+            "$set": {
+                "status": JobStatus.CANCELLED.value,
+                "completed_at": datetime.utcnow().isoformat(),
+                "active_key": None
+            }
+        }
+        if reason:
+            error = JobError(
+                timestamp=datetime.utcnow(),
+                message=f"Cancelado: {reason}",
+                error_type="UserCancellation"
+            )
+            update["$push"] = {"errors": {"$each": [error.to_dict()], "$slice": -settings.job_max_errors}}
+            update["$inc"] = {"failed_items": 1}
+        
+        try:
+            job_dict = await self._jobs_collection.find_one_and_update(
+                {
+                    "_id": self._job_key(job_id),
+                    "status": {"$in": [JobStatus.PENDING.value, JobStatus.RUNNING.value]}
+                },
+                update,
+                return_document=ReturnDocument.AFTER
+            )
+            
+            if not job_dict:
+                return None
+            
+            job_dict["_id"] = str(job_dict["_id"])
+            return Job.from_dict(job_dict)
+            
+        except Exception as e:
+            logger.error("Error cancelando job", job_id=job_id, error=str(e))
+            raise DatabaseException(f"Error cancelando job: {str(e)}")
+    
+    # Entregas de webhooks
+    
+    async def enqueue_webhook(self, url: str, payload: Dict[str, Any]) -> str:
+        """
+        Guarda un evento de webhook pendiente de entregar
+        
+        El envío lo hace app/workers/webhooks.py; el payload lleva el ID de la
+        entrega para que el receptor pueda descartar repeticiones.
+        
+        Returns:
+            ID de la entrega
+        """
+        await self._ensure_connected()
+        
+        delivery_id = ObjectId()
+        now = datetime.utcnow()
+        try:
+            await self._webhooks_collection.insert_one({
+                "_id": delivery_id,
+                "url": url,
+                "payload": {**payload, "delivery_id": str(delivery_id)},
+                "status": "pending",
+                "attempts": 0,
+                "created_at": now,
+                "next_attempt_at": now
+            })
+            return str(delivery_id)
+            
+        except Exception as e:
+            logger.error("Error guardando webhook", url=url, error=str(e))
+            raise DatabaseException(f"Error guardando webhook: {str(e)}")
+    
+    async def claim_webhook_deliveries(self, limit: int, lease_seconds: float) -> List[Dict[str, Any]]:
+        """
+        Reclama las entregas cuyo envío toca ya
+        
+        Incluye las que otro proceso dejó a medias (su reserva caducó). Con
+        varios procesos de entrega cada una la reclama solo uno.
+        
+        Returns:
+            Entregas reclamadas en orden de creación
+        """
+        await self._ensure_connected()
+        
+        now = datetime.utcnow()
+        due = {
+            "$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                {"status": "sending", "lease_until": {"$lte": now}}
+            ]
+        }
+        
+        try:
+            cursor = self._webhooks_collection.find(due, projection={"_id": 1}).sort("next_attempt_at", ASCENDING).limit(limit)
+            ids = [delivery["_id"] async for delivery in cursor]
+            if not ids:
+                return []
+            
+            token = ObjectId()
+            await self._webhooks_collection.update_many(
+                {"_id": {"$in": ids}, **due},
+                {"$set": {"status": "sending", "lease_until": now + timedelta(seconds=lease_seconds), "claim": token}}
+            )
+            cursor = self._webhooks_collection.find({"claim": token}).sort("created_at", ASCENDING)
+            return [delivery async for delivery in cursor]
+            
+        except Exception as e:
+            logger.error("Error reclamando webhooks", error=str(e))
+            raise DatabaseException(f"Error reclamando webhooks: {str(e)}")
+    
+    async def update_webhook_deliveries(self, updates: Dict[Any, Dict[str, Any]], claim: Any) -> int:
+        """
+        Guarda el resultado de varias entregas (campos a fijar por _id) en una escritura
+        
+        Solo se actualizan las que siguen reclamadas con `claim`: si la reserva
+        caducó y otro proceso las reclamó, su estado es del nuevo dueño.
+        
+        Returns:
+            Entregas actualizadas
+        """
+        if not updates:
+            return 0
+        
+        await self._ensure_connected()
+        
+        try:
+            result = await self._webhooks_collection.bulk_write(
+                [
+                    UpdateOne(
+                        {"_id": delivery_id, "claim": claim},
+                        {"$set": fields, "$unset": {"claim": "", "lease_until": ""}}
+                    )
+                    for delivery_id, fields in updates.items()
+                ],
+                ordered=False
+            )
+            return result.matched_count
+        except Exception as e:
+            logger.error("Error actualizando webhooks", count=len(updates), error=str(e))
+            raise DatabaseException(f"Error actualizando webhooks: {str(e)}")
+    
     # Operaciones con documentos de MongoDB
     
     async def get_collection(self, database: str, collection: str) -> AsyncIOMotorCollection:
@@ -256,6 +796,64 @@ class MongoRepository:
             logger.error("Error buscando documentos", database=database, collection=collection, error=str(e))
             raise DatabaseException(f"Error buscando documentos: {str(e)}")
     
+    async def collection_exists(self, database: str, collection: str) -> bool:
+        """Indica si la colección existe en MongoDB"""
+        await self._ensure_connected()
+        
+        try:
+            names = await self._client[database].list_collection_names(filter={"name": collection})
+            return bool(names)
+        except Exception as e:
+            logger.error("Error comprobando colección", database=database, collection=collection, error=str(e))
+            raise DatabaseException(f"Error comprobando colección: {str(e)}")
+    
+    async def existing_document_ids(self, database: str, collection: str, document_ids: List[str]) -> set:
+        """
+        Filtra los IDs que siguen existiendo en una colección
+        
+        Acepta IDs de ObjectId y de texto (documentos de APIs externas).
+        """
+        if not document_ids:
+            return set()
+        
+        candidates: List[Any] = list(document_ids)
+        candidates.extend(ObjectId(document_id) for document_id in document_ids if ObjectId.is_valid(document_id))
+        
+        try:
+            col = await self.get_collection(database, collection)
+            cursor = col.find({"_id": {"$in": candidates}}, projection={"_id": 1})
+            return {str(doc["_id"]) async for doc in cursor}
+        except Exception as e:
+            logger.error("Error comprobando documentos", database=database, collection=collection, error=str(e))
+            raise DatabaseException(f"Error comprobando documentos: {str(e)}")
+    
+    async def get_job_types(self, job_ids: List[str]) -> Dict[str, str]:
+        """Tipo de cada job (los que ya no existen no aparecen)"""
+        if not job_ids:
+            return {}
+        
+        await self._ensure_connected()
+        
+        candidates: List[Any] = list(job_ids)
+        candidates.extend(ObjectId(job_id) for job_id in job_ids if ObjectId.is_valid(job_id))
+        
+        cursor = self._jobs_collection.find({"_id": {"$in": candidates}}, projection={"type": 1})
+        return {str(job["_id"]): job["type"] async for job in cursor}
+    
+    async def has_active_jobs(self, database: str, collection: str) -> bool:
+        """Indica si hay jobs PENDING o RUNNING sobre una colección"""
+        await self._ensure_connected()
+        
+        job = await self._jobs_collection.find_one(
+            {
+                "database": database,
+                "collection": collection,
+                "status": {"$in": [JobStatus.PENDING.value, JobStatus.RUNNING.value]}
+            },
+            projection={"_id": 1}
+        )
+        return job is not None
+    
     async def get_document(self, database: str, collection: str, document_id: str) -> Dict[str, Any]:
         """Obtiene un documento por ID"""
         try:
@@ -307,6 +905,59 @@ class MongoRepository:
             logger.error("Error actualizando documento", database=database, collection=collection, document_id=document_id, error=str(e))
             raise DatabaseException(f"Error actualizando documento: {str(e)}")
     
+    async def bulk_update_documents(
+        self,
+        database: str,
+        collection: str,
+        updates: List[Tuple[str, Dict[str, Any]]]
+    ) -> int:
+        """
+        Aplica varios $set en un único bulk_write no ordenado
+        
+        Los IDs que no son ObjectId válidos no se pueden actualizar: se
+        omiten y se registran en el log.
+        
+        Args:
+            updates: Lista de (document_id, campos a actualizar)
+        
+        Returns:
+            Número de documentos modificados
+        """
+        if not updates:
+            return 0
+        
+        try:
+            col = await self.get_collection(database, collection)
+            now = datetime.utcnow()
+            
+            operations = []
+            skipped = []
+            for document_id, update_data in updates:
+                if not ObjectId.is_valid(document_id):
+                    skipped.append(document_id)
+                    continue
+                operations.append(
+                    UpdateOne({"_id": ObjectId(document_id)}, {"$set": {**update_data, "updated_at": now}})
+                )
+            
+            if skipped:
+                logger.warning(
+                    "Documentos con ID inválido omitidos en la actualización masiva",
+                    database=database,
+                    collection=collection,
+                    count=len(skipped),
+                    document_ids=skipped[:20]
+                )
+            if not operations:
+                return 0
+            
+            result = await col.bulk_write(operations, ordered=False)
+            return result.modified_count
+            
+        except Exception as e:
+            logger.error("Error en actualización masiva de documentos", database=database, collection=collection, count=len(updates), error=str(e))
+            raise DatabaseException(f"Error en actualización masiva de documentos: {str(e)}")
+    
     async def find_image_fields(self, document: Dict[str, Any]) -> List[str]:
         """Encuentra campos que contienen URLs de imágenes en un documento"""
         found_urls = []
@@ -321,7 +972,7 @@ class MongoRepository:
         
         # También buscar en otros campos comunes por si acaso
         alternative_fields = ["images", "photos", "gallery", "media", "image_urls", "pictures", "imagen"]
-
+        
         for field in alternative_fields:
             if field in document:
                 if isinstance(document[field], list):
@@ -331,6 +982,13 @@ class MongoRepository:
                 elif isinstance(document[field], str) and document[field].startswith(("http://", "https://")):
                     found_urls.append(document[field])
         
+        if settings.image_url_canonicalize:
+            # Import local: el paquete de descargas importa este módulo
+            from app.services.download.url_canonicalizer import unique_image_urls
+            
+            # Variantes de la misma imagen (tamaño, query, espejo del CDN) cuentan como una
+            return unique_image_urls(found_urls)
+        
         # Eliminar duplicados manteniendo el orden
         seen = set()
         unique_urls = []
@@ -3,5 +3,6 @@ Servicios de descarga
 """
 from .image_downloader import ImageDownloader
 from .download_service import DownloadService
+from .http_client import shared_http_client
 
-__all__ = ["ImageDownloader", "DownloadService"]
+__all__ = ["ImageDownloader", "DownloadService", "shared_http_client"]
@@ -0,0 +1,124 @@
+"""
+Lectura en streaming de documentos desde una API externa
+"""
+from typing import AsyncIterator, Dict, Any, Optional
+import ijson
+import httpx
+
+from app.core import logger
+from app.core.exceptions import DownloadException
+
+
+# Claves que pueden contener la lista de documentos (en orden de preferencia)
+DOCUMENT_KEYS = ("documents", "data")
+
+
+class _ChunkReader:
+    """Adapta un iterador de bytes al objeto con read() asíncrono que espera ijson"""
+    
+    def __init__(self, chunks: AsyncIterator[bytes]):
+        self._chunks = chunks
+        self.bytes_read = 0
+    
+    async def read(self, size: int = -1) -> bytes:
+        if size == 0:
+            # ijson llama a read(0) para distinguir bytes de texto
+            return b""
+        try:
+            chunk = await self._chunks.__anext__()
+        except StopAsyncIteration:
+            return b""
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+async def iter_json_documents(chunks: AsyncIterator[bytes]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Extrae los documentos de un JSON a medida que llegan los bytes
+    
+    Acepta los mismos formatos que la API externa devolvía antes:
+    una lista de documentos, un objeto con "documents" o "data", o un único
+    documento. Solo se mantiene en memoria el documento en curso.
+    """
+    reader = _ChunkReader(chunks)
+    
+    top_level: Optional[str] = None
+    source_prefix: Optional[str] = None
+    root = ijson.ObjectBuilder()
+    root_keys = set()
+    item: Optional[ijson.ObjectBuilder] = None
+    depth = 0
+    found = 0
+    
+    async for prefix, event, value in ijson.parse_async(reader, use_float=True):
+        if top_level is None:
+            top_level = event
+        
+        # Dentro de un documento: acumular hasta cerrar su objeto
+        if item is not None:
+            item.event(event, value)
+            if event in ("start_map", "start_array"):
+                depth += 1
+            elif event in ("end_map", "end_array"):
+                depth -= 1
+            
+            if depth == 0:
+                if isinstance(item.value, dict):
+                    found += 1
+                    yield item.value
+                else:
+                    logger.warning("Elemento ignorado: no es un documento", value=str(item.value)[:100])
+                item = None
+            continue
+        
+        # Inicio de un elemento de la lista de documentos
+        if top_level == "start_array" and prefix == "item":
+            is_item = True
+        elif top_level == "start_map" and prefix.endswith(".item"):
+            key = prefix[:-len(".item")]
+            if source_prefix is None and key in DOCUMENT_KEYS:
+                source_prefix = key
+            is_item = key == source_prefix
+        else:
+            is_item = False
+        
+        if is_item:
+            item = ijson.ObjectBuilder()
+            item.event(event, value)
+            depth = 1 if event in ("start_map", "start_array") else 0
+            if depth == 0:
+                # Elemento escalar
+                logger.warning("Elemento ignorado: no es un documento", value=str(value)[:100])
+                item = None
+            continue
+        
+        # Resto del objeto raíz (por si es un único documento)
+        if top_level == "start_map":
+            if prefix == "" and event == "map_key":
+                root_keys.add(value)
+            root.event(event, value)
+    
+    if top_level == "start_map" and not found and not root_keys.intersection(DOCUMENT_KEYS):
+        # Un único documento sin envoltorio
+        yield root.value
+    
+    logger.debug("Respuesta de API leída", bytes=reader.bytes_read, documents=found)
+
+
+async def stream_api_documents(client: httpx.AsyncClient, api_url: str) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Descarga la respuesta de una API externa y produce sus documentos uno a uno
+    
+    Raises:
+        DownloadException: Si la API no responde correctamente o el JSON es inválido
+    """
+    try:
+        async with client.stream("GET", api_url) as response:
+            response.raise_for_status()
+            async for document in iter_json_documents(response.aiter_bytes()):
+                yield document
+                
+    except httpx.HTTPError as e:
+        raise DownloadException(f"Error accediendo a la API: {str(e)}", url=api_url)
+    except ijson.JSONError as e:
+        raise DownloadException(f"Respuesta JSON inválida: {str(e)}", url=api_url)
@@ -1,34 +1,74 @@
 """
 Servicio principal de descarga que orquesta el proceso completo
 """
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Awaitable, TypeVar, Set, Tuple
 from pathlib import Path
 from datetime import datetime
+import asyncio
+import contextlib
+from bson import ObjectId
 
-from app.core import logger, settings
-from app.core.exceptions import DownloadException, StorageException
-from app.models.domain import Job, JobStatus, ImageMetadata, ImageInfo
+from app.core import logger, settings, LogSummary
+from app.core.exceptions import DownloadException, StorageException, JobCancelledException
+from app.models.domain import Job, JobType, JobStatus, ImageMetadata, ImageInfo
 from app.services.database.mongo_repository import mongo_repository
-from app.services.storage.local_storage import LocalStorageService
+from app.services.database.job_progress import JobProgressTracker
+from app.services.database.document_updates import DocumentUpdateBuffer
+from app.services.storage.factory import get_storage_service
 from app.services.storage.base import StorageService
 from .image_downloader import ImageDownloader
+from .http_client import shared_http_client
+from .api_source import stream_api_documents
+from .timing import PhaseTimings
+from .perceptual_hash import NearDuplicateIndex
+
+
+T = TypeVar("T")
+
+# Resumen periódico de imágenes guardadas (en lugar de una línea por imagen)
+saved_log = LogSummary("Imagen guardada")
 
 
 class DownloadService:
     """Servicio principal que orquesta la descarga de imágenes"""
     
     def __init__(self, storage_service: Optional[StorageService] = None):
-        self.storage = storage_service or LocalStorageService()
+        self.storage = storage_service or get_storage_service()
         self.db = mongo_repository
+        self._cancel_events: Dict[str, asyncio.Event] = {}
+        self._progress: Dict[str, JobProgressTracker] = {}
+        self._document_updates: Dict[str, DocumentUpdateBuffer] = {}
+        self._timings: Dict[str, PhaseTimings] = {}
+        self._near_duplicates: Dict[str, NearDuplicateIndex] = {}
     
     async def process_job(self, job: Job) -> None:
-        """Procesa un job de descarga"""
+        """
+        Procesa un job de descarga
+        
+        El job debe llegar ya en RUNNING (claim_job_for_processing): aquí no se
+        vuelve a escribir el documento completo, que pisaría una cancelación.
+        """
+        cancel_event = asyncio.Event()
+        self._cancel_events[job.id] = cancel_event
+        watcher = asyncio.create_task(self._watch_cancellation(job, cancel_event))
+        
+        progress = JobProgressTracker(job, self.db)
+        self._progress[job.id] = progress
+        
+        document_updates = DocumentUpdateBuffer(job.database, job.collection, self.db)
+        self._document_updates[job.id] = document_updates
+        
+        timings = PhaseTimings()
+        self._timings[job.id] = timings
+        
+        # Hashes perceptuales de las imágenes ya guardadas en este job (toda la colección)
+        self._near_duplicates[job.id] = NearDuplicateIndex(settings.near_duplicate_threshold)
+        
         try:
             logger.info("Iniciando procesamiento de job", job_id=job.id, type=job.type.value)
             
-            # Marcar job como iniciado
-            job.start()
-            await self.db.update_job(job)
+            progress.start()
+            document_updates.start()
             
             # Procesar según el tipo de job
             if job.type.value == "download_collection":
@@ -37,12 +77,25 @@ class DownloadService:
                 await self._process_document(job)
             elif job.type.value == "download_batch":
                 await self._process_batch(job)
+            elif job.type.value == "download_api_url":
+                await self._process_api_url(job)
             else:
                 raise ValueError(f"Tipo de job no soportado: {job.type}")
             
-            # Marcar job como completado
+            # Si ya se canceló no se escribe nada más que el progreso
+            await self._raise_if_cancelled(job, refresh=True)
+            
+            # Escribir las actualizaciones de documentos pendientes
+            await document_updates.stop()
+            await document_updates.flush()
+            
+            # Marcar job como completado (con el resumen de tiempos por host)
             job.complete()
-            await self.db.update_job(job)
+            job.metadata["download_timings"] = timings.summary()
+            await progress.stop()
+            # El estado final se escribe solo si el job sigue sin cancelar
+            if not await progress.flush(final=True, extra_fields={"metadata.download_timings": job.metadata["download_timings"]}):
+                raise JobCancelledException(job_id=job.id)
             
             # Limpiar colección temporal si es necesario
             if job.metadata.get("cleanup_collection"):
@@ -56,21 +109,119 @@ class DownloadService:
                 job_id=job.id,
                 processed=job.processed_items,
                 failed=job.failed_items,
-                duration=job.duration
+                duration=job.duration,
+                document_updates=document_updates.written,
+                document_update_batches=document_updates.round_trips,
+                download_timings=job.metadata["download_timings"]
+            )
+            
+        except JobCancelledException:
+            # El estado CANCELLED ya está en MongoDB; solo se guarda el progreso alcanzado
+            job.cancel()
+            await self._flush_document_updates(document_updates)
+            await progress.stop()
+            await progress.flush()
+            logger.info(
+                "Job cancelado durante el procesamiento",
+                job_id=job.id,
+                processed=job.processed_items,
+                total=job.total_items
             )
             
         except Exception as e:
             logger.error("Error procesando job", job_id=job.id, error=str(e))
-            job.fail(str(e))
-            await self.db.update_job(job)
-            raise
+            job.fail()
+            await self._flush_document_updates(document_updates)
+            progress.add_error(str(e), "JobFailure")
+            await progress.stop()
+            if await progress.flush(final=True):
+                raise
+            # Cancelado desde la API mientras fallaba: prevalece la cancelación
+            logger.info("Job cancelado antes de registrar el fallo", job_id=job.id)
+        
+        finally:
+            watcher.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await watcher
+            await progress.stop()
+            await document_updates.stop()
+            self._cancel_events.pop(job.id, None)
+            self._progress.pop(job.id, None)
+            self._document_updates.pop(job.id, None)
+            self._timings.pop(job.id, None)
+            self._near_duplicates.pop(job.id, None)
+    
+    async def _flush_document_updates(self, document_updates: DocumentUpdateBuffer) -> None:
+        """Guarda lo ya descargado aunque el job no termine bien"""
+        await document_updates.stop()
+        try:
+            await document_updates.flush()
+        except Exception as e:
+            logger.warning("Error guardando actualizaciones de documentos", error=str(e))
+    
+    async def _watch_cancellation(self, job: Job, cancel_event: asyncio.Event) -> None:
+        """Consulta periódicamente el estado del job y activa el evento si se cancela"""
+        while not cancel_event.is_set():
+            await asyncio.sleep(settings.job_cancel_check_interval)
+            
+            try:
+                status = await self.db.get_job_status(job.id)
+            except Exception as e:
+                logger.warning("Error comprobando cancelación del job", job_id=job.id, error=str(e))
+                continue
+            
+            if status == JobStatus.CANCELLED:
+                logger.info("Cancelación del job detectada", job_id=job.id)
+                cancel_event.set()
+    
+    async def _raise_if_cancelled(self, job: Job, refresh: bool = False) -> None:
+        """
+        Lanza JobCancelledException si el job ha sido cancelado
+        
+        Args:
+            job: Job en proceso
+            refresh: Si es True consulta MongoDB en lugar de esperar al sondeo periódico
+        """
+        cancel_event = self._cancel_events.get(job.id)
+        if cancel_event is None:
+            return
+        
+        if refresh and not cancel_event.is_set():
+            if await self.db.get_job_status(job.id) == JobStatus.CANCELLED:
+                cancel_event.set()
+        
+        if cancel_event.is_set():
+            raise JobCancelledException(job_id=job.id)
+    
+    async def _run_cancellable(self, job: Job, aw: Awaitable[T]) -> T:
+        """Ejecuta una corrutina abortándola en cuanto el job se cancele"""
+        cancel_event = self._cancel_events.get(job.id)
+        if cancel_event is None:
+            return await aw
+        
+        task = asyncio.ensure_future(aw)
+        waiter = asyncio.ensure_future(cancel_event.wait())
+        
+        try:
+            done, _ = await asyncio.wait({task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+        
+        if task in done:
+            return task.result()
+        
+        # Abortar descargas en curso para liberar el worker
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+        raise JobCancelledException(job_id=job.id)
     
     async def _process_collection(self, job: Job) -> None:
         """Procesa descarga de una colección completa"""
         # Contar documentos
         total_docs = await self.db.count_documents(job.database, job.collection)
         job.total_items = total_docs
-        await self.db.update_job(job)
+        self._progress[job.id].touch()
         
         logger.info(
             "Procesando colección",
@@ -84,14 +235,15 @@ class DownloadService:
         processed = 0
         
         async for doc in self.db.find_documents(job.database, job.collection):
+            await self._raise_if_cancelled(job)
             await self._process_document_images(job, doc)
             
             processed += 1
             job.processed_items = processed
+            self._progress[job.id].touch()
             
-            # Actualizar progreso cada X documentos
+            # Log de progreso cada X documentos (MongoDB se actualiza en el flush periódico)
             if processed % batch_size == 0:
-                await self.db.update_job(job)
                 logger.info(
                     "Progreso de descarga",
                     job_id=job.id,
@@ -109,13 +261,13 @@ class DownloadService:
         doc = await self.db.get_document(job.database, job.collection, job.document_id)
         
         job.total_items = 1
-        await self.db.update_job(job)
+        self._progress[job.id].touch()
         
         # Procesar imágenes del documento
         await self._process_document_images(job, doc)
         
         job.processed_items = 1
-        await self.db.update_job(job)
+        self._progress[job.id].touch()
     
     async def _process_batch(self, job: Job) -> None:
         """Procesa descarga batch con filtros custom"""
@@ -132,7 +284,7 @@ class DownloadService:
             effective_total = limit
 
         job.total_items = effective_total
-        await self.db.update_job(job)
+        self._progress[job.id].touch()
 
         logger.info(
             "Procesando batch",
@@ -153,13 +305,44 @@ class DownloadService:
             skip=skip or 0,
             limit=limit or 0,
         ):
+            await self._raise_if_cancelled(job)
             await self._process_document_images(job, doc)
 
             processed += 1
             job.processed_items = processed
+            self._progress[job.id].touch()
+    
+    async def _process_api_url(self, job: Job) -> None:
+        """
+        Procesa los documentos de una API externa según se van recibiendo
+        
+        La respuesta se parsea en streaming y cada documento pasa directamente al
+        pipeline de descarga, sin copiarlo antes a una colección temporal.
+        """
+        api_url = job.metadata["api_url"]
+        
+        logger.info(
+            "Procesando documentos de API externa",
+            api_url=api_url,
+            collection=job.collection
+        )
+        
+        processed = 0
+        async for doc in stream_api_documents(shared_http_client.get(), api_url):
+            await self._raise_if_cancelled(job)
+            
+            # Los documentos externos no siempre traen _id: se usa "id" o uno nuevo
+            doc["_id"] = str(doc.get("_id") or doc.get("id") or ObjectId())
+            await self._process_document_images(job, doc)
+            
+            # El total no se conoce hasta terminar de leer la respuesta
+            processed += 1
+            job.processed_items = processed
+            job.total_items = processed
+            self._progress[job.id].touch()
             
             if processed % 10 == 0:
-                await self.db.update_job(job)
+                logger.info("Progreso de descarga", job_id=job.id, processed=processed)
     
     async def _process_document_images(self, job: Job, document: Dict[str, Any]) -> None:
         """Procesa las imágenes de un documento"""
@@ -199,8 +382,8 @@ class DownloadService:
             # Crear directorio
             await self.storage.create_directory(storage_path / "original")
             
-            # Descargar imágenes
-            async with ImageDownloader() as downloader:
+            # Descargar imágenes reutilizando el pool de conexiones del proceso
+            async with ImageDownloader(client=shared_http_client.get(), timings=self._timings.get(job.id)) as downloader:
                 # Callback de progreso
                 async def progress_callback(current, total, url):
                     logger.debug(
@@ -211,18 +394,27 @@ class DownloadService:
                         url=url
                     )
                 
-                # Descargar batch
-                results = await downloader.download_batch(image_urls, progress_callback)
+                # Descargar batch (se aborta si el job se cancela)
+                results = await self._run_cancellable(
+                    job,
+                    downloader.download_batch(image_urls, progress_callback)
+                )
+                
+                # Marcar casi duplicados (en el documento y en el resto de la colección)
+                dropped = self._mark_near_duplicates(job, str(document["_id"]), results)
                 
                 # Procesar resultados
                 for i, (content, image_info) in enumerate(results):
+                    if content and image_info.filename in dropped:
+                        # Descartado por casi duplicado: ni se guarda ni figura en la metadata
+                        continue
+                    
                     if content:
                         # Guardar imagen
                         image_path = storage_path / "original" / image_info.filename
                         await self.storage.save_file(image_path, content)
                         
-                        logger.info(
-                            "Imagen guardada",
+                        saved_log.record(
                             path=str(image_path),
                             size_mb=image_info.size_mb,
                             dimensions=f"{image_info.width}x{image_info.height}"
@@ -237,45 +429,115 @@ class DownloadService:
                     "Descarga de documento completada",
                     document_id=document["_id"],
                     total_images=stats["total_downloads"],
-                    successful=stats["successful_downloads"],
+                    successful=metadata.successful_downloads,
                     failed=stats["failed_downloads"],
-                    total_size_mb=stats["total_size_mb"]
+                    near_duplicates=metadata.near_duplicates,
+                    dropped_duplicates=len(dropped),
+                    total_size_mb=round(metadata.total_size_mb, 2)
                 )
             
             # Guardar metadata
             await self.storage.save_metadata(metadata, storage_path)
             
-            # Actualizar documento en MongoDB con rutas locales
+            # Generar derivados responsive en la cola de procesamiento
+            if settings.enable_derivatives and metadata.successful_downloads > 0:
+                self._enqueue_derivatives(storage_path)
+            
+            # Los documentos de una API externa no existen en MongoDB
+            if job.type == JobType.DOWNLOAD_API_URL:
+                return
+            
+            # Actualizar documento en MongoDB con rutas locales (agrupado en bulk_write)
             update_data = {
                 "local_images_path": str(storage_path),
                 "images_metadata": {
                     "total": metadata.total_images,
                     "successful": metadata.successful_downloads,
                     "failed": metadata.failed_downloads,
+                    "near_duplicates": metadata.near_duplicates,
+                    "dropped_duplicates": len(dropped),
                     "size_mb": metadata.total_size_mb,
                     "processed_at": datetime.utcnow()
                 }
             }
             
-            await self.db.update_document(
-                job.database,
-                job.collection,
-                str(document["_id"]),
-                update_data
-            )
+            # Un ID inválido queda como error del documento (el bulk_write lo omitiría)
+            document_id = str(document["_id"])
+            if not ObjectId.is_valid(document_id):
+                raise ValueError("ID de documento inválido")
+            
+            await self._document_updates[job.id].add(document_id, update_data)
             
+        except JobCancelledException:
+            raise
         except Exception as e:
             logger.error(
                 "Error procesando imágenes del documento",
                 document_id=document.get("_id"),
                 error=str(e)
             )
-            job.add_error(
+            self._progress[job.id].add_error(
                 f"Error en documento {document.get('_id')}: {str(e)}",
                 "DocumentProcessingError",
                 {"document_id": str(document.get("_id"))}
             )
-            await self.db.update_job(job)
+    
+    def _mark_near_duplicates(
+        self,
+        job: Job,
+        document_id: str,
+        results: List[Tuple[Optional[bytes], ImageInfo]]
+    ) -> Set[str]:
+        """
+        Marca en duplicate_of las imágenes casi idénticas a otra (dHash)
+        
+        Se recorren de mayor a menor resolución, así de cada grupo se conserva
+        la más grande. Las repetidas dentro del documento se descartan si
+        NEAR_DUPLICATE_ACTION=drop; las que repiten una imagen de otro documento
+        de la colección solo se marcan (cada documento conserva su galería).
+        
+        Returns:
+            Nombres de fichero que no deben guardarse
+        """
+        if not settings.near_duplicate_detection:
+            return set()
+        
+        collection_index = self._near_duplicates.get(job.id)
+        document_index = NearDuplicateIndex(settings.near_duplicate_threshold)
+        
+        candidates = [image_info for content, image_info in results if content and image_info.perceptual_hash]
+        candidates.sort(key=lambda image_info: image_info.width * image_info.height, reverse=True)
+        
+        dropped = set()
+        for image_info in candidates:
+            reference = f"{document_id}/{image_info.filename}"
+            
+            original = document_index.find(image_info.perceptual_hash)
+            if original is not None:
+                image_info.duplicate_of = original
+                if settings.near_duplicate_action == "drop":
+                    dropped.add(image_info.filename)
+                continue
+            
+            document_index.add(image_info.perceptual_hash, reference)
+            
+            if collection_index is not None:
+                original = collection_index.find(image_info.perceptual_hash)
+                if original is not None:
+                    image_info.duplicate_of = original
+                else:
+                    collection_index.add(image_info.perceptual_hash, reference)
+        
+        return dropped
+    
+    def _enqueue_derivatives(self, storage_path: Path) -> None:
+        """Encola la generación de derivados de un documento en la cola processing"""
+        try:
+            # Import diferido para evitar dependencia circular con los workers
+            from app.workers.tasks import generate_document_derivatives
+            generate_document_derivatives.delay(str(storage_path))
+        except Exception as e:
+            logger.warning("Error encolando generación de derivados", path=str(storage_path), error=str(e))
     
     def _get_search_field(self, document: Dict[str, Any]) -> str:
         """Obtiene el campo de búsqueda del documento"""
@@ -0,0 +1,227 @@
+"""
+Limitador de concurrencia adaptativo (AIMD) por host
+"""
+from typing import Optional, Dict, Any, Deque
+from collections import deque
+from email.utils import parsedate_to_datetime
+import asyncio
+import time
+
+from app.core import logger, settings
+from app.core.metrics import host_concurrency_limit, host_in_flight, host_throttled
+
+
+# Resultados de una petición desde el punto de vista del limitador
+SUCCESS = "success"
+THROTTLED = "throttled"
+NEUTRAL = "neutral"
+
+# Códigos que indican que el host está saturado o limitándonos
+THROTTLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def classify_status(status_code: int) -> str:
+    """Clasifica un código HTTP para el limitador"""
+    if status_code in THROTTLE_STATUS_CODES:
+        return THROTTLED
+    if 200 <= status_code < 400:
+        return SUCCESS
+    # 404, 403...: no dicen nada sobre la capacidad del host
+    return NEUTRAL
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Interpreta la cabecera Retry-After (segundos o fecha HTTP)
+    
+    Returns:
+        Segundos a esperar (acotados por settings.max_retry_after) o None
+    """
+    if not value:
+        return None
+    
+    value = value.strip()
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    
+    return min(max(seconds, 0.0), settings.max_retry_after)
+
+
+class AdaptiveHostLimiter:
+    """
+    Limita las descargas simultáneas a un host con una política AIMD
+    
+    - Cada respuesta correcta suma increase/limit al límite (≈ +increase por
+      ventana completa de peticiones).
+    - Un 429, un 5xx o un timeout multiplica el límite por decrease_factor, como
+      mucho una vez por ventana: solo reducen las peticiones iniciadas después
+      de la última reducción, así una ráfaga de 429 no hunde el límite a 1.
+    - Retry-After bloquea el host hasta la hora indicada.
+    """
+    
+    def __init__(
+        self,
+        host: str,
+        initial_limit: float,
+        min_limit: float,
+        max_limit: float,
+        increase: float,
+        decrease_factor: float
+    ):
+        self.host = host
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.limit = min(max(initial_limit, min_limit), self.max_limit)
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._wake_handle: Optional[asyncio.TimerHandle] = None
+        self._loop = asyncio.get_running_loop()
+        
+        self._publish()
+    
+    def _can_start(self) -> bool:
+        """Hay hueco para una petición más"""
+        return time.monotonic() >= self.blocked_until and self.in_flight < int(self.limit)
+    
+    def _wake(self) -> None:
+        """Da paso a los que esperan mientras haya hueco"""
+        self._wake_handle = None
+        
+        while self._waiters and self._can_start():
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+        
+        # Host bloqueado por Retry-After: despertar cuando expire
+        delay = self.blocked_until - time.monotonic()
+        if self._waiters and delay > 0 and self._wake_handle is None:
+            self._wake_handle = self._loop.call_later(delay, self._wake)
+        
+        self._publish()
+    
+    async def acquire(self) -> float:
+        """
+        Espera un hueco para descargar del host
+        
+        Returns:
+            Instante (monotonic) en que empezó la petición, para release()
+        """
+        if not self._waiters and self._can_start():
+            self.in_flight += 1
+            self._publish()
+            return time.monotonic()
+        
+        waiter = self._loop.create_future()
+        self._waiters.append(waiter)
+        self._wake()
+        
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Se nos concedió el hueco justo al cancelar: devolverlo
+                self.in_flight -= 1
+                self._wake()
+            raise
+        
+        return time.monotonic()
+    
+    def release(self, started_at: float, outcome: str, retry_after: Optional[float] = None, reason: str = "") -> None:
+        """
+        Libera el hueco y ajusta el límite según el resultado
+        
+        Args:
+            started_at: Valor devuelto por acquire()
+            outcome: SUCCESS, THROTTLED o NEUTRAL
+            retry_after: Segundos de Retry-After, si el host lo indicó
+            reason: Motivo del throttling (para métricas), p. ej. "429" o "timeout"
+        """
+        self.in_flight -= 1
+        now = time.monotonic()
+        
+        if outcome == SUCCESS:
+            self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+            
+        elif outcome == THROTTLED:
+            host_throttled.labels(host=self.host, reason=reason or "unknown").inc()
+            
+            if started_at >= self._last_decrease:
+                previous = self.limit
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                self._last_decrease = now
+                logger.info(
+                    "Límite de host reducido",
+                    host=self.host,
+                    reason=reason,
+                    previous=round(previous, 2),
+                    limit=round(self.limit, 2)
+                )
+        
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+        
+        self._wake()
+    
+    def _publish(self) -> None:
+        """Actualiza las métricas del host"""
+        host_concurrency_limit.labels(host=self.host).set(int(self.limit))
+        host_in_flight.labels(host=self.host).set(self.in_flight)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Estado actual del limitador"""
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "blocked_for": round(max(self.blocked_until - time.monotonic(), 0.0), 2)
+        }
+
+
+class HostLimiterRegistry:
+    """
+    Limitadores por host compartidos por todas las descargas del proceso
+    
+    El estado aprendido sobre un host (su límite y su Retry-After) sobrevive
+    entre documentos y tareas del mismo worker.
+    """
+    
+    def __init__(self):
+        self._limiters: Dict[str, AdaptiveHostLimiter] = {}
+    
+    def get(self, host: str, max_limit: int = None) -> AdaptiveHostLimiter:
+        """Obtiene el limitador de un host, creándolo si no existe para el loop actual"""
+        limiter = self._limiters.get(host)
+        
+        if limiter is None or limiter._loop is not asyncio.get_running_loop():
+            # Los futures de un limitador creado en otro loop no sirven: se descarta
+            limiter = AdaptiveHostLimiter(
+                host,
+                initial_limit=settings.host_limit_initial,
+                min_limit=settings.host_limit_min,
+                max_limit=max_limit or settings.max_connections_per_host,
+                increase=settings.host_limit_increase,
+                decrease_factor=settings.host_limit_decrease_factor
+            )
+            self._limiters[host] = limiter
+        
+        return limiter
+    
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Estado de todos los hosts"""
+        return {host: limiter.get_stats() for host, limiter in self._limiters.items()}
+
+
+# Instancia global por proceso
+host_limiters = HostLimiterRegistry()
@@ -0,0 +1,70 @@
+"""
+Cliente HTTP compartido para la descarga de imágenes
+"""
+from typing import Optional
+import asyncio
+import httpx
+
+from app.core import logger, settings
+
+
+def create_download_client(timeout: int = None) -> httpx.AsyncClient:
+    """
+    Crea un cliente HTTP configurado para descargar imágenes
+    
+    Args:
+        timeout: Timeout en segundos (por defecto settings.download_timeout)
+    
+    Returns:
+        Cliente httpx con pool de conexiones keep-alive
+    """
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(timeout or settings.download_timeout),
+        limits=httpx.Limits(
+            max_keepalive_connections=20,
+            max_connections=100,
+            keepalive_expiry=30
+        ),
+        follow_redirects=True,
+        headers={
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+        }
+    )
+
+
+class SharedHttpClient:
+    """
+    Mantiene un único httpx.AsyncClient por proceso y event loop
+    
+    Permite que las tareas sucesivas de un worker reutilicen el pool de
+    conexiones (DNS, TCP y TLS ya establecidos) en lugar de abrir un cliente
+    nuevo por documento.
+    """
+    
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    def get(self) -> httpx.AsyncClient:
+        """Obtiene el cliente compartido, creándolo si no existe para el loop actual"""
+        loop = asyncio.get_running_loop()
+        
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            # Un cliente creado en otro loop no puede reutilizarse: se descarta
+            self._client = create_download_client()
+            self._loop = loop
+            logger.debug("Cliente HTTP compartido creado")
+        
+        return self._client
+    
+    async def aclose(self) -> None:
+        """Cierra el cliente compartido"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+            logger.debug("Cliente HTTP compartido cerrado")
+        self._client = None
+        self._loop = None
+
+
+# Instancia global por proceso
+shared_http_client = SharedHttpClient()
@@ -8,12 +8,28 @@ from pathlib import Path
 import httpx
 from PIL import Image
 import io
+import random
 import time
-from collections import defaultdict
 
-from app.core import logger, settings
+from app.core import settings, LogSummary, RateLimitedLog
 from app.core.exceptions import DownloadException
 from app.models.domain import ImageInfo, calculate_bytes_hash
+from .http_client import create_download_client
+from .timing import RequestTimer, PhaseTimings
+from .perceptual_hash import calculate_dhash
+from .host_limiter import (
+    AdaptiveHostLimiter, host_limiters, classify_status, parse_retry_after,
+    THROTTLED, NEUTRAL
+)
+
+
+# Códigos HTTP que merece la pena reintentar
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+# Una línea por imagen satura el log con miles de descargas por minuto:
+# las descargas se resumen por intervalo y los avisos repetidos se limitan
+download_log = LogSummary("Imagen descargada")
+download_warnings = RateLimitedLog()
 
 
 class ImageDownloader:
@@ -25,7 +41,9 @@ class ImageDownloader:
         max_connections_per_host: int = None,
         timeout: int = None,
         max_retries: int = None,
-        retry_delay: int = None
+        retry_delay: int = None,
+        client: Optional[httpx.AsyncClient] = None,
+        timings: Optional[PhaseTimings] = None
     ):
         self.max_concurrent_downloads = max_concurrent_downloads or settings.max_concurrent_downloads
         self.max_connections_per_host = max_connections_per_host or settings.max_connections_per_host
@@ -33,14 +51,16 @@ class ImageDownloader:
         self.max_retries = max_retries or settings.max_retries
         self.retry_delay = retry_delay or settings.retry_delay
         
-        # Semáforos para control de concurrencia
+        # Concurrencia global de esta instancia; la de cada host la gestiona un
+        # limitador adaptativo compartido por todo el proceso (host_limiters)
         self._global_semaphore = asyncio.Semaphore(self.max_concurrent_downloads)
-        self._host_semaphores: Dict[str, asyncio.Semaphore] = defaultdict(
-            lambda: asyncio.Semaphore(self.max_connections_per_host)
-        )
         
-        # Cliente HTTP
-        self._client: Optional[httpx.AsyncClient] = None
+        # Cliente HTTP (si se recibe uno externo, se reutiliza y no se cierra al salir)
+        self._client: Optional[httpx.AsyncClient] = client
+        self._owns_client = client is None
+        
+        # Tiempos por fase y host (se puede compartir entre instancias de un mismo job)
+        self.timings = timings or PhaseTimings()
         
         # Estadísticas
         self.stats = {
@@ -53,23 +73,13 @@ class ImageDownloader:
     
     async def __aenter__(self):
         """Inicializa el cliente HTTP"""
-        self._client = httpx.AsyncClient(
-            timeout=httpx.Timeout(self.timeout),
-            limits=httpx.Limits(
-                max_keepalive_connections=20,
-                max_connections=100,
-                keepalive_expiry=30
-            ),
-            follow_redirects=True,
-            headers={
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-            }
-        )
+        if self._owns_client:
+            self._client = create_download_client(self.timeout)
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        """Cierra el cliente HTTP"""
-        if self._client:
+        """Cierra el cliente HTTP si es propio"""
+        if self._client and self._owns_client:
             await self._client.aclose()
     
     def _get_host_from_url(self, url: str) -> str:
@@ -92,25 +102,54 @@ class ImageDownloader:
             raise DownloadException("Cliente HTTP no inicializado")
         
         host = self._get_host_from_url(url)
-        host_semaphore = self._host_semaphores[host]
+        limiter = host_limiters.get(host, self.max_connections_per_host)
         
-        # Control de concurrencia
+        return await self._download_with_retry(url, filename, limiter)
+    
+    async def _fetch(self, url: str, limiter: AdaptiveHostLimiter) -> Tuple[httpx.Response, Optional[float]]:
+        """
+        Realiza una petición ocupando un hueco global y otro del host
+        
+        Returns:
+            Tupla (respuesta, segundos de Retry-After o None)
+        """
         async with self._global_semaphore:
-            async with host_semaphore:
-                return await self._download_with_retry(url, filename)
+            started_at = await limiter.acquire()
+            outcome, reason, retry_after = NEUTRAL, "", None
+            
+            try:
+                timer = RequestTimer()
+                response = await self._client.get(url, extensions={"trace": timer.trace})
+                self.timings.record(limiter.host, url, response.status_code, timer)
+                outcome = classify_status(response.status_code)
+                reason = str(response.status_code)
+                retry_after = parse_retry_after(response.headers.get("retry-after"))
+                return response, retry_after
+                
+            except httpx.TimeoutException:
+                outcome, reason = THROTTLED, "timeout"
+                raise
+                
+            finally:
+                limiter.release(started_at, outcome, retry_after, reason)
     
-    async def _download_with_retry(self, url: str, filename: str = None) -> Tuple[bytes, ImageInfo]:
+    async def _download_with_retry(
+        self,
+        url: str,
+        filename: str,
+        limiter: AdaptiveHostLimiter
+    ) -> Tuple[bytes, ImageInfo]:
         """Descarga con reintentos"""
         last_error = None
         
         for attempt in range(self.max_retries):
+            retry_after = None
+            
             try:
                 start_time = time.time()
                 
-                logger.debug("Descargando imagen", url=url, attempt=attempt + 1)
-                
-                # Realizar descarga
-                response = await self._client.get(url)
+                # Realizar descarga (los huecos se liberan antes de esperar un reintento)
+                response, retry_after = await self._fetch(url, limiter)
                 response.raise_for_status()
                 
                 # Obtener contenido
@@ -126,51 +165,38 @@ class ImageDownloader:
                 self.stats["total_bytes"] += len(content)
                 self.stats["total_time"] += download_time
                 
-                logger.info(
-                    "Imagen descargada exitosamente",
-                    url=url,
-                    size_mb=round(len(content) / (1024 * 1024), 2),
-                    time=round(download_time, 2)
-                )
+                download_log.record(url=url, bytes=len(content), time=download_time, attempts=attempt + 1)
                 
                 return content, image_info
                 
             except httpx.HTTPStatusError as e:
                 last_error = f"Error HTTP {e.response.status_code}: {e.response.text[:200]}"
-                logger.warning("Error HTTP descargando imagen", url=url, status=e.response.status_code)
+                download_warnings.warning("Error HTTP descargando imagen", url=url, status=e.response.status_code)
                 
+                # Un 404/403 no se arregla reintentando
+                if e.response.status_code not in RETRYABLE_STATUS_CODES:
+                    break
+                    
             except httpx.TimeoutException:
                 last_error = f"Timeout después de {self.timeout} segundos"
-                logger.warning("Timeout descargando imagen", url=url)
+                download_warnings.warning("Timeout descargando imagen", url=url)
                 
             except Exception as e:
                 last_error = str(e)
-                logger.warning("Error descargando imagen", url=url, error=str(e))
+                download_warnings.warning("Error descargando imagen", url=url, error=str(e))
             
-            # Esperar antes de reintentar (backoff exponencial)
-            if attempt < self.max_retries - 1:
+            # Esperar antes de reintentar: con Retry-After el limitador ya mantiene
+            # el host bloqueado; si no, backoff exponencial con jitter
+            if attempt < self.max_retries - 1 and retry_after is None:
                 delay = self.retry_delay * (2 ** attempt)
-                await asyncio.sleep(delay)
+                await asyncio.sleep(delay * random.uniform(0.5, 1.5))
         
         # Si llegamos aquí, todos los reintentos fallaron
         self.stats["total_downloads"] += 1
         self.stats["failed_downloads"] += 1
         
-        error_msg = f"Fallo después de {self.max_retries} intentos: {last_error}"
-        logger.error("Descarga fallida definitivamente", url=url, error=error_msg)
-        
-        # Devolver ImageInfo con error
-        image_info = ImageInfo(
-            filename=filename or self._get_filename_from_url(url),
-            url=url,
-            size_bytes=0,
-            mime_type="unknown",
-            width=0,
-            height=0,
-            hash="",
-            downloaded_at=datetime.utcnow(),
-            error=error_msg
-        )
+        error_msg = f"Fallo después de {attempt + 1} intentos: {last_error}"
+        download_warnings.error("Descarga fallida definitivamente", url=url, error=error_msg)
         
         raise DownloadException(error_msg, url=url)
     
@@ -187,6 +213,11 @@ class ImageDownloader:
             # Calcular hash
             content_hash = calculate_bytes_hash(content)
             
+            # Hash perceptual para detectar casi duplicados (decodifica: fuera del loop)
+            perceptual_hash = None
+            if settings.near_duplicate_detection:
+                perceptual_hash = await asyncio.to_thread(calculate_dhash, content)
+            
             # Generar nombre de archivo si no se proporciona
             if not filename:
                 filename = self._get_filename_from_url(url)
@@ -203,7 +234,8 @@ class ImageDownloader:
                 width=width,
                 height=height,
                 hash=content_hash,
-                downloaded_at=datetime.utcnow()
+                downloaded_at=datetime.utcnow(),
+                perceptual_hash=perceptual_hash
             )
             
         except Exception as e:
@@ -324,6 +356,8 @@ class ImageDownloader:
             stats["average_size_mb"] = 0
             stats["average_time"] = 0
         
+        stats["hosts"] = host_limiters.get_stats()
+        stats["phases"] = self.timings.summary()
         stats["total_size_mb"] = round(stats["total_bytes"] / (1024 * 1024), 2)
         stats["success_rate"] = round(
             (stats["successful_downloads"] / stats["total_downloads"] * 100) 
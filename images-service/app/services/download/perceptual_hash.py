@@ -0,0 +1,136 @@
+"""
+Hash perceptual (dHash) y búsqueda de imágenes casi duplicadas
+"""
+from typing import Optional, List, Tuple, Dict, Any
+from PIL import Image
+import io
+
+from app.core import logger
+
+
+# dHash de 8x8 = 64 bits (16 caracteres hexadecimales)
+HASH_SIZE = 8
+
+
+def calculate_dhash(content: bytes, hash_size: int = HASH_SIZE) -> Optional[str]:
+    """
+    Calcula el dHash de una imagen
+    
+    Reduce la imagen a (hash_size + 1) x hash_size en grises y compara cada
+    píxel con su vecino derecho. El resultado es estable ante cambios de
+    resolución, recompresión y pequeños recortes, y la distancia de Hamming
+    entre dos hashes mide lo distintas que son las imágenes.
+    
+    Es trabajo de CPU: llamar con asyncio.to_thread desde código asíncrono.
+    
+    Returns:
+        Hash en hexadecimal, o None si la imagen no se puede decodificar
+    """
+    try:
+        img = Image.open(io.BytesIO(content))
+        # JPEG: decodificar directamente a escala reducida (mucho más rápido)
+        img.draft("L", (hash_size * 8, hash_size * 8))
+        small = img.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+        pixels = list(small.getdata())
+    except Exception as e:
+        logger.debug("No se pudo calcular el hash perceptual", error=str(e))
+        return None
+    
+    bits = 0
+    width = hash_size + 1
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * width + col]
+            right = pixels[row * width + col + 1]
+            bits = (bits << 1) | int(left > right)
+    
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Número de bits distintos entre dos hashes"""
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """
+    Árbol BK sobre la distancia de Hamming
+    
+    Permite buscar hashes a distancia <= d sin comparar con todos: por la
+    desigualdad triangular solo se visitan los hijos a distancia
+    [dist - d, dist + d] de cada nodo.
+    """
+    
+    def __init__(self):
+        # Nodo: (hash, valor, hijos por distancia)
+        self._root: Optional[Tuple[int, Any, Dict[int, tuple]]] = None
+        self._size = 0
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    def add(self, hash_value: int, value: Any) -> None:
+        """Añade un hash con su valor asociado"""
+        self._size += 1
+        if self._root is None:
+            self._root = (hash_value, value, {})
+            return
+        
+        node = self._root
+        while True:
+            distance = hamming_distance(hash_value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (hash_value, value, {})
+                return
+            node = child
+    
+    def find(self, hash_value: int, max_distance: int) -> List[Tuple[int, Any]]:
+        """
+        Busca los valores cuyo hash está a distancia <= max_distance
+        
+        Returns:
+            Lista de (distancia, valor) ordenada por distancia
+        """
+        if self._root is None:
+            return []
+        
+        found = []
+        pending = [self._root]
+        while pending:
+            node_hash, value, children = pending.pop()
+            distance = hamming_distance(hash_value, node_hash)
+            if distance <= max_distance:
+                found.append((distance, value))
+            
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    pending.append(child)
+        
+        found.sort(key=lambda item: item[0])
+        return found
+
+
+class NearDuplicateIndex:
+    """
+    Índice de hashes perceptuales de las imágenes ya vistas (p. ej. de un job)
+    
+    Cada entrada guarda una referencia "documento/fichero" para indicar de qué
+    imagen es casi duplicada una nueva.
+    """
+    
+    def __init__(self, max_distance: int):
+        self.max_distance = max_distance
+        self._tree = BKTree()
+    
+    def __len__(self) -> int:
+        return len(self._tree)
+    
+    def find(self, perceptual_hash: str) -> Optional[Any]:
+        """Referencia de la imagen más parecida dentro del umbral, o None"""
+        matches = self._tree.find(int(perceptual_hash, 16), self.max_distance)
+        return matches[0][1] if matches else None
+    
+    def add(self, perceptual_hash: str, reference: Any) -> None:
+        """Registra una imagen"""
+        self._tree.add(int(perceptual_hash, 16), reference)
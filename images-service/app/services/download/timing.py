@@ -0,0 +1,123 @@
+"""
+Tiempos por fase de cada descarga (conexión, TLS, primer byte, transferencia)
+"""
+from typing import Optional, Dict, Any, List
+from collections import defaultdict
+import random
+import time
+
+from app.core import logger, settings
+from app.core.metrics import download_phase_duration
+
+
+# Fases medidas. "connect" incluye la resolución DNS: httpcore la hace dentro de
+# connect_tcp y no emite un evento propio para ella.
+PHASES = ("pool", "connect", "tls", "ttfb", "transfer")
+
+
+class RequestTimer:
+    """
+    Cronometra una petición a partir de los eventos de traza de httpcore
+    
+    Se pasa como extensions={"trace": timer.trace} a la petición de httpx.
+    - pool: espera hasta obtener conexión (incluye la cola del pool)
+    - connect: DNS + TCP (solo en conexiones nuevas)
+    - tls: handshake TLS (solo en conexiones nuevas https)
+    - ttfb: desde enviar las cabeceras hasta recibir las de la respuesta
+    - transfer: lectura del cuerpo
+    """
+    
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self._first_event: Optional[float] = None
+        self._marks: Dict[str, float] = {}
+    
+    async def trace(self, event_name: str, info: Dict[str, Any]) -> None:
+        # "connection.connect_tcp.started" -> "connect_tcp.started" (igual en http11 y http2)
+        _, _, name = event_name.partition(".")
+        now = time.perf_counter()
+        if self._first_event is None:
+            self._first_event = now
+        # Con redirecciones prevalecen los tiempos del último salto
+        self._marks[name] = now
+    
+    def _span(self, start: str, end: str) -> Optional[float]:
+        if start in self._marks and end in self._marks:
+            return self._marks[end] - self._marks[start]
+        return None
+    
+    @property
+    def connection_reused(self) -> bool:
+        """La petición reutilizó una conexión keep-alive del pool"""
+        return "connect_tcp.started" not in self._marks
+    
+    def phases(self) -> Dict[str, float]:
+        """Duración de cada fase observada, en segundos"""
+        phases = {
+            "pool": self._first_event - self.started_at if self._first_event is not None else None,
+            "connect": self._span("connect_tcp.started", "connect_tcp.complete"),
+            "tls": self._span("start_tls.started", "start_tls.complete"),
+            "ttfb": self._span("send_request_headers.started", "receive_response_headers.complete"),
+            "transfer": self._span("receive_response_body.started", "receive_response_body.complete")
+        }
+        return {phase: duration for phase, duration in phases.items() if duration is not None}
+
+
+class PhaseTimings:
+    """
+    Acumula los tiempos por fase de muchas peticiones, agrupados por host
+    
+    Publica cada petición en el histograma download_phase_seconds y guarda
+    sumas por host para el resumen del job.
+    """
+    
+    def __init__(self):
+        self._hosts: Dict[str, Dict[str, Any]] = defaultdict(
+            lambda: {"requests": 0, "reused": 0, "sums": defaultdict(float), "counts": defaultdict(int)}
+        )
+    
+    def record(self, host: str, url: str, status_code: int, timer: RequestTimer) -> None:
+        """Registra los tiempos de una petición terminada"""
+        phases = timer.phases()
+        
+        for phase, duration in phases.items():
+            download_phase_duration.labels(host=host, phase=phase).observe(duration)
+        
+        stats = self._hosts[host]
+        stats["requests"] += 1
+        stats["reused"] += int(timer.connection_reused)
+        for phase, duration in phases.items():
+            stats["sums"][phase] += duration
+            stats["counts"][phase] += 1
+        
+        # Traza completa solo de una muestra de peticiones
+        if random.random() < settings.download_trace_sample_rate:
+            logger.info(
+                "Traza de descarga",
+                url=url,
+                host=host,
+                status=status_code,
+                reused=timer.connection_reused,
+                **{f"{phase}_ms": round(duration * 1000, 1) for phase, duration in phases.items()}
+            )
+    
+    def summary(self) -> List[Dict[str, Any]]:
+        """
+        Media de cada fase por host, en milisegundos
+        
+        Se devuelve una lista (no un dict por host) porque los hosts contienen
+        puntos y se guarda en MongoDB.
+        """
+        return [
+            {
+                "host": host,
+                "requests": stats["requests"],
+                "reused_connections": stats["reused"],
+                **{
+                    f"avg_{phase}_ms": round(stats["sums"][phase] / stats["counts"][phase] * 1000, 1)
+                    for phase in PHASES
+                    if stats["counts"][phase]
+                }
+            }
+            for host, stats in sorted(self._hosts.items())
+        ]
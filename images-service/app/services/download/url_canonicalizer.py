@@ -0,0 +1,236 @@
+"""
+Canonicalización de URLs de imágenes
+
+La misma imagen aparece con distintas URLs: otro tamaño en la ruta
+(max1024x768, max500, square60 en el CDN de Booking), parámetros de
+seguimiento o espejos del mismo CDN. Antes de deduplicar y de descargar:
+
+- canonical_key() identifica la imagen (igual para todas sus variantes)
+- canonicalize_url() limpia la URL y, si se pide, la cambia por la mayor
+  versión disponible (sin peticiones extra: la regla del CDN conoce el token)
+- unique_image_urls() deduplica una lista quedándose con la mayor variante
+"""
+from typing import Optional, List, Iterable, Tuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, unquote_plus
+import re
+
+from app.core import settings
+
+
+# Parámetros que no cambian la imagen en ningún host (campañas y analítica).
+# Otros como "ref" seleccionan contenido en muchos hosts (?ref=<rama>): solo
+# los quitan las reglas de los CDN que los conocen (BstaticRule solo deja "k")
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "msclkid", "yclid", "mc_cid", "mc_eid", "_ga", "_gl"}
+TRACKING_PREFIXES = ("utm_",)
+
+
+class CDNRule:
+    """
+    Regla de un CDN: qué hosts cubre y cómo se expresa el tamaño en la URL
+    
+    La regla base (hosts sin regla propia) no conoce el formato de las URLs:
+    solo quita los parámetros de seguimiento y conserva el resto de la query
+    byte a byte y en su orden (las URLs firmadas dejarían de valer si no).
+    """
+    
+    def matches(self, host: str) -> bool:
+        return False
+    
+    def canonical_host(self, host: str) -> str:
+        """Host común a todos los espejos (solo para la clave)"""
+        return host
+    
+    def size(self, path: str) -> Optional[Tuple[str, int]]:
+        """Token de tamaño de la ruta y su número de píxeles, o None"""
+        return None
+    
+    def with_size(self, path: str, token: str) -> str:
+        """Ruta con otro token de tamaño"""
+        return path
+    
+    def largest_size(self) -> Optional[str]:
+        """Token de la mayor versión disponible, o None si no se conoce"""
+        return None
+    
+    def keep_param(self, name: str) -> bool:
+        """Indica si un parámetro de la query forma parte de la imagen"""
+        return name not in TRACKING_PARAMS and not name.startswith(TRACKING_PREFIXES)
+    
+    def clean_query(self, query: str) -> str:
+        """Query de la URL limpia: sin seguimiento, el resto sin tocar"""
+        return "&".join(
+            part for part in query.split("&")
+            if part and self.keep_param(unquote_plus(part.split("=", 1)[0]))
+        )
+    
+    def key_query(self, query: str) -> str:
+        """Parte de la query que identifica la imagen"""
+        return self.clean_query(query)
+
+
+class BstaticRule(CDNRule):
+    """
+    CDN de Booking (cf.bstatic.com y espejos q-/r-/t-cf.bstatic.com)
+    
+    Ejemplo: /xdata/images/hotel/max1024x768/123456.jpg?k=abc&o=&hp=1
+    El tamaño es un segmento de la ruta (maxWxH, maxW, squareN, WxH); "k" es
+    la firma de la imagen (la misma para todos los tamaños) y el resto de la
+    query no afecta al contenido.
+    """
+    
+    SIZE_SEGMENT = re.compile(r"^(max|square)?(\d{2,4})(?:x(\d{2,4}))?$")
+    MIRROR_HOST = re.compile(r"^[a-z]-cf\.bstatic\.com$")
+    
+    def matches(self, host: str) -> bool:
+        return host == "bstatic.com" or host.endswith(".bstatic.com")
+    
+    def canonical_host(self, host: str) -> str:
+        return "cf.bstatic.com" if self.MIRROR_HOST.match(host) else host
+    
+    def _size_segment(self, path: str) -> Optional[Tuple[int, re.Match]]:
+        segments = path.split("/")
+        # El token va justo antes del nombre del archivo
+        if len(segments) >= 3:
+            match = self.SIZE_SEGMENT.match(segments[-2])
+            if match:
+                return len(segments) - 2, match
+        return None
+    
+    def size(self, path: str) -> Optional[Tuple[str, int]]:
+        found = self._size_segment(path)
+        if found is None:
+            return None
+        _, match = found
+        width = int(match.group(2))
+        height = int(match.group(3)) if match.group(3) else width
+        return match.group(0), width * height
+    
+    def with_size(self, path: str, token: str) -> str:
+        found = self._size_segment(path)
+        if found is None:
+            return path
+        index, _ = found
+        segments = path.split("/")
+        segments[index] = token
+        return "/".join(segments)
+    
+    def largest_size(self) -> Optional[str]:
+        return settings.image_url_bstatic_rendition
+    
+    def keep_param(self, name: str) -> bool:
+        return name == "k"
+    
+    def clean_query(self, query: str) -> str:
+        return urlencode(sorted(
+            (name, value) for name, value in parse_qsl(query, keep_blank_values=True) if self.keep_param(name)
+        ))
+    
+    def key_query(self, query: str) -> str:
+        # La misma imagen aparece con y sin "k" (URLs copiadas sin query):
+        # la ruta ya la identifica
+        return ""
+
+
+CDN_RULES: List[CDNRule] = [BstaticRule()]
+DEFAULT_RULE = CDNRule()
+
+
+def _rule_for(host: str) -> CDNRule:
+    for rule in CDN_RULES:
+        if rule.matches(host):
+            return rule
+    return DEFAULT_RULE
+
+
+def _split(url: str):
+    """Partes de la URL y host en minúsculas (None si no es una URL http válida)"""
+    try:
+        parts = urlsplit(url.strip())
+        parts.port  # Lanza ValueError si el puerto no es válido
+    except ValueError:
+        return None
+    if parts.scheme.lower() not in ("http", "https") or not parts.hostname:
+        return None
+    return parts, parts.hostname.lower()
+
+
+def _netloc(parts, host: str) -> str:
+    """Host en minúsculas sin el puerto por defecto"""
+    port = parts.port
+    default_port = 443 if parts.scheme.lower() == "https" else 80
+    return host if port in (None, default_port) else f"{host}:{port}"
+
+
+def canonicalize_url(url: str, upgrade: bool = None) -> str:
+    """
+    URL limpia de una imagen (la que se descarga)
+    
+    Quita el fragmento y los parámetros de seguimiento y normaliza esquema y
+    host; el resto de la query solo se reescribe si la regla del CDN la
+    conoce. Con upgrade (por defecto IMAGE_URL_UPGRADE) cambia el tamaño por
+    la mayor versión que conoce la regla del CDN.
+    
+    Las URLs que no son http(s) se devuelven tal cual.
+    """
+    split = _split(url)
+    if split is None:
+        return url
+    parts, host = split
+    rule = _rule_for(host)
+    
+    if upgrade is None:
+        upgrade = settings.image_url_upgrade
+    
+    path = parts.path
+    if upgrade and rule.largest_size() and rule.size(path):
+        path = rule.with_size(path, rule.largest_size())
+    
+    return urlunsplit((parts.scheme.lower(), _netloc(parts, host), path, rule.clean_query(parts.query), ""))
+
+
+def canonical_key(url: str) -> str:
+    """
+    Identidad de la imagen: igual para todas sus variantes de tamaño,
+    espejos del CDN y parámetros que no cambian el contenido
+    """
+    split = _split(url)
+    if split is None:
+        return url
+    parts, host = split
+    rule = _rule_for(host)
+    
+    path = parts.path
+    if rule.size(path):
+        path = rule.with_size(path, "{size}")
+    
+    return urlunsplit(("", _netloc(parts, rule.canonical_host(host)), path, rule.key_query(parts.query), ""))
+
+
+def rendition_size(url: str) -> int:
+    """Píxeles de la variante según el token de tamaño (0 si no se conoce)"""
+    split = _split(url)
+    if split is None:
+        return 0
+    parts, host = split
+    size = _rule_for(host).size(parts.path)
+    return size[1] if size else 0
+
+
+def unique_image_urls(urls: Iterable[str], upgrade: bool = None) -> List[str]:
+    """
+    Deduplica URLs de imágenes por canonical_key
+    
+    Conserva el orden de la primera aparición de cada imagen y, entre sus
+    variantes, la de mayor tamaño (o la mayor disponible con upgrade).
+    
+    Returns:
+        URLs canonicalizadas sin repetidos
+    """
+    best = {}
+    for url in urls:
+        key = canonical_key(url)
+        current = best.get(key)
+        if current is None or rendition_size(url) > rendition_size(current):
+            best[key] = url
+    
+    return [canonicalize_url(url, upgrade) for url in best.values()]
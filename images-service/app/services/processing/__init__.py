@@ -0,0 +1,10 @@
+"""
+Servicios de procesamiento de imágenes
+"""
+from .processing_service import ProcessingService, get_process_pool, shutdown_process_pool
+from .derivative_cache import DerivativeCache, derivative_cache
+
+__all__ = [
+    "ProcessingService", "get_process_pool", "shutdown_process_pool",
+    "DerivativeCache", "derivative_cache"
+]
@@ -0,0 +1,248 @@
+"""
+Caché en disco de variantes generadas al vuelo, acotada por tamaño con política LRU
+"""
+from typing import Optional, Dict, Any, Tuple
+from collections import OrderedDict
+from pathlib import Path
+import asyncio
+import hashlib
+import time
+import os
+
+from app.core import logger, settings
+from app.core.exceptions import ProcessingException
+from .image_processor import render_variant, FORMAT_EXTENSIONS
+from .processing_service import get_process_pool
+
+
+# Tope de un pin: si una respuesta se corta sin llegar a unpin, la variante
+# vuelve a poder expulsarse pasado este tiempo
+PIN_TTL_SECONDS = 300
+
+
+class DerivativeCache:
+    """
+    Caché LRU en disco para variantes (w, h, fmt, q) de las imágenes almacenadas
+    
+    - La clave incluye la ruta, el mtime y el tamaño del original, así que un
+      original modificado genera una clave nueva y la variante antigua acaba
+      expulsada por LRU.
+    - El índice LRU vive en memoria y se reconstruye al arrancar a partir del
+      mtime de los archivos (los hits actualizan el mtime).
+    - Peticiones simultáneas de la misma variante comparten una única
+      codificación (coalescing).
+    - Las variantes que se están sirviendo se fijan (pin/unpin) y la
+      expulsión se las salta hasta que termina la respuesta.
+    """
+    
+    def __init__(self, cache_path: Path = None, max_bytes: int = None):
+        self.cache_path = cache_path or settings.derivative_cache_path
+        self.max_bytes = max_bytes or settings.derivative_cache_max_mb * 1024 * 1024
+        
+        self._entries: "OrderedDict[str, Tuple[Path, int]]" = OrderedDict()
+        self._total_bytes = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._pinned: Dict[str, list] = {}  # clave -> [respuestas en curso, caducidad]
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+    
+    @staticmethod
+    def build_key(source: Path, source_stat: os.stat_result, params: Tuple[Any, ...]) -> str:
+        """Construye la clave de caché para un original y unos parámetros"""
+        raw = f"{source}|{source_stat.st_mtime_ns}|{source_stat.st_size}|" + "|".join(str(p) for p in params)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    def _path_for(self, key: str, fmt: str) -> Path:
+        """Ruta del archivo en caché (particionada por los dos primeros caracteres)"""
+        return self.cache_path / key[:2] / f"{key}{FORMAT_EXTENSIONS.get(fmt, '.' + fmt)}"
+    
+    def _scan(self) -> list:
+        """Recorre la caché existente (se ejecuta en un hilo)"""
+        found = []
+        if not self.cache_path.exists():
+            return found
+        
+        for entry in self.cache_path.rglob("*"):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(".tmp"):
+                # Restos de codificaciones interrumpidas
+                entry.unlink(missing_ok=True)
+                continue
+            stat = entry.stat()
+            found.append((stat.st_mtime, entry.stem, entry, stat.st_size))
+        
+        found.sort()
+        return found
+    
+    async def _ensure_loaded(self) -> None:
+        """Carga el índice LRU desde disco la primera vez"""
+        if self._loaded:
+            return
+        
+        async with self._load_lock:
+            if self._loaded:
+                return
+            
+            self.cache_path.mkdir(parents=True, exist_ok=True)
+            for _, key, path, size in await asyncio.to_thread(self._scan):
+                self._entries[key] = (path, size)
+                self._total_bytes += size
+            
+            self._loaded = True
+            logger.info(
+                "Caché de derivados cargada",
+                path=str(self.cache_path),
+                entries=len(self._entries),
+                size_mb=round(self._total_bytes / (1024 * 1024), 2)
+            )
+            await self._evict()
+    
+    async def get_or_create(
+        self,
+        source: Path,
+        source_stat: os.stat_result,
+        width: Optional[int],
+        height: Optional[int],
+        fmt: str,
+        quality: int
+    ) -> Tuple[Path, bool]:
+        """
+        Devuelve la ruta de la variante, generándola si no está en caché
+        
+        Returns:
+            Tupla (ruta_variante, hit) donde hit indica si ya estaba en caché
+        """
+        await self._ensure_loaded()
+        
+        key = self.build_key(source, source_stat, (width, height, fmt, quality))
+        
+        entry = self._entries.get(key)
+        if entry is not None:
+            path, _ = entry
+            self._entries.move_to_end(key)
+            try:
+                # Persistir el orden LRU para el próximo arranque
+                await asyncio.to_thread(os.utime, path)
+                self.stats["hits"] += 1
+                return path, True
+            except FileNotFoundError:
+                # Borrada por otro proceso que comparte la caché: se regenera
+                self.discard(key)
+        
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            # La codificación corre en su propia tarea: si el cliente que la inició
+            # se desconecta, el resto de peticiones coalescidas sigue esperándola
+            self.stats["misses"] += 1
+            task = asyncio.ensure_future(self._render(key, source, width, height, fmt, quality))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._on_render_done(key, t))
+        
+        return await asyncio.shield(task), False
+    
+    def _on_render_done(self, key: str, task: asyncio.Task) -> None:
+        """Libera la entrada en vuelo cuando termina una codificación"""
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Error generando variante", key=key, error=str(task.exception()))
+    
+    async def _render(
+        self,
+        key: str,
+        source: Path,
+        width: Optional[int],
+        height: Optional[int],
+        fmt: str,
+        quality: int
+    ) -> Path:
+        """Codifica la variante en el pool de procesos y la registra en el índice"""
+        target = self._path_for(key, fmt)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(
+                get_process_pool(),
+                render_variant,
+                str(source),
+                str(target),
+                width,
+                height,
+                fmt,
+                quality
+            )
+        except Exception as e:
+            raise ProcessingException(f"Error generando variante: {str(e)}", image_path=str(source))
+        
+        self._entries[key] = (target, result["size_bytes"])
+        self._total_bytes += result["size_bytes"]
+        await self._evict()
+        
+        return target
+    
+    def pin(self, key: str) -> None:
+        """Impide expulsar una variante mientras se sirve"""
+        pin = self._pinned.setdefault(key, [0, 0.0])
+        pin[0] += 1
+        pin[1] = time.monotonic() + PIN_TTL_SECONDS
+    
+    def unpin(self, key: str) -> None:
+        """Libera una variante fijada con pin()"""
+        pin = self._pinned.get(key)
+        if pin is None:
+            return
+        pin[0] -= 1
+        if pin[0] <= 0:
+            del self._pinned[key]
+    
+    def _is_pinned(self, key: str) -> bool:
+        pin = self._pinned.get(key)
+        if pin is None:
+            return False
+        if pin[1] < time.monotonic():
+            # Respuestas que no llegaron a liberarla (cliente desconectado)
+            del self._pinned[key]
+            return False
+        return True
+    
+    def discard(self, key: str) -> None:
+        """Olvida una entrada cuyo archivo ya no existe"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry[1]
+    
+    async def _evict(self) -> None:
+        """Expulsa las entradas menos usadas (y no fijadas) hasta respetar el tamaño máximo"""
+        to_delete = []
+        for key in list(self._entries):
+            if self._total_bytes <= self.max_bytes or len(self._entries) <= 1:
+                break
+            if self._is_pinned(key):
+                continue
+            path, size = self._entries.pop(key)
+            self._total_bytes -= size
+            self.stats["evictions"] += 1
+            to_delete.append(path)
+        
+        if to_delete:
+            await asyncio.to_thread(lambda: [p.unlink(missing_ok=True) for p in to_delete])
+            logger.debug("Variantes expulsadas de la caché", count=len(to_delete))
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtiene estadísticas de la caché"""
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "pinned": len(self._pinned),
+            "size_mb": round(self._total_bytes / (1024 * 1024), 2),
+            "max_size_mb": round(self.max_bytes / (1024 * 1024), 2)
+        }
+
+
+# Instancia global por proceso
+derivative_cache = DerivativeCache()
@@ -0,0 +1,178 @@
+"""
+Generación de derivados de imágenes (funciones CPU que se ejecutan en un pool de procesos)
+
+Este módulo solo depende de Pillow para que los procesos del pool arranquen
+rápido y las funciones sean serializables con pickle.
+"""
+from typing import List, Dict, Any, Optional, Tuple
+from pathlib import PurePosixPath
+from PIL import Image, ImageOps
+import hashlib
+import io
+import os
+
+try:
+    # Registra AVIF en versiones de Pillow sin soporte nativo
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+
+# Especificación de un derivado: (categoría, formato, lado máximo en px o None para tamaño original)
+DerivativeSpec = Tuple[str, str, Optional[int]]
+
+FORMAT_EXTENSIONS = {
+    "jpeg": ".jpg",
+    "webp": ".webp",
+    "avif": ".avif",
+    "png": ".png",
+}
+
+FORMAT_MIME_TYPES = {
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+    "avif": "image/avif",
+    "png": "image/png",
+}
+
+
+def is_format_supported(fmt: str) -> bool:
+    """Verifica si Pillow puede codificar el formato indicado"""
+    Image.init()
+    return fmt.upper() in Image.SAVE
+
+
+def _prepare_mode(img: Image.Image, fmt: str) -> Image.Image:
+    """Convierte la imagen a un modo compatible con el formato de salida"""
+    if fmt == "jpeg":
+        if img.mode in ("RGBA", "LA", "P"):
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            rgba = img.convert("RGBA")
+            background.paste(rgba, mask=rgba.split()[-1])
+            return background
+        if img.mode != "RGB":
+            return img.convert("RGB")
+        return img
+    
+    if img.mode not in ("RGB", "RGBA"):
+        return img.convert("RGBA" if "A" in img.getbands() or img.mode == "P" else "RGB")
+    return img
+
+
+def encode_image(img: Image.Image, fmt: str, quality: int) -> bytes:
+    """Codifica una imagen PIL en el formato indicado"""
+    img = _prepare_mode(img, fmt)
+    buffer = io.BytesIO()
+    
+    if fmt == "jpeg":
+        img.save(buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+    elif fmt == "webp":
+        img.save(buffer, "WEBP", quality=quality, method=4)
+    elif fmt == "avif":
+        img.save(buffer, "AVIF", quality=quality, speed=8)
+    else:
+        img.save(buffer, fmt.upper())
+    
+    return buffer.getvalue()
+
+
+def generate_derivatives(
+    content: bytes,
+    filename: str,
+    specs: List[DerivativeSpec],
+    qualities: Dict[str, int]
+) -> List[Dict[str, Any]]:
+    """
+    Genera todos los derivados de una imagen
+    
+    Args:
+        content: Bytes de la imagen original
+        filename: Nombre del archivo original (se conserva el nombre base)
+        specs: Lista de derivados a generar
+        qualities: Calidad por formato ({"jpeg": 85, "webp": 85, "avif": 60})
+    
+    Returns:
+        Lista de diccionarios con la categoría, la ruta relativa, los bytes y
+        la información de cada derivado generado
+    """
+    stem = PurePosixPath(filename).stem
+    results = []
+    
+    with Image.open(io.BytesIO(content)) as source:
+        # Respetar la orientación EXIF antes de redimensionar
+        img = ImageOps.exif_transpose(source)
+        img.load()
+        
+        resized_cache: Dict[int, Image.Image] = {}
+        
+        for category, fmt, max_side in specs:
+            if max_side:
+                if max_side not in resized_cache:
+                    variant = img.copy()
+                    # thumbnail() mantiene el aspecto y nunca amplía la imagen
+                    variant.thumbnail((max_side, max_side), Image.LANCZOS)
+                    resized_cache[max_side] = variant
+                variant = resized_cache[max_side]
+            else:
+                variant = img
+            
+            data = encode_image(variant, fmt, qualities.get(fmt, 85))
+            
+            results.append({
+                "category": category,
+                "path": f"{category}/{stem}{FORMAT_EXTENSIONS.get(fmt, '.' + fmt)}",
+                "content": data,
+                "size_bytes": len(data),
+                "mime_type": FORMAT_MIME_TYPES.get(fmt, f"image/{fmt}"),
+                "width": variant.width,
+                "height": variant.height,
+                "hash": hashlib.md5(data).hexdigest()
+            })
+    
+    return results
+
+
+def render_variant(
+    source_path: str,
+    target_path: str,
+    width: Optional[int],
+    height: Optional[int],
+    fmt: str,
+    quality: int
+) -> Dict[str, Any]:
+    """
+    Genera una variante redimensionada/recodificada de una imagen y la escribe en disco
+    
+    La imagen se ajusta dentro de la caja width x height manteniendo el aspecto
+    y sin ampliarla. El archivo se escribe de forma atómica (temporal + rename).
+    
+    Args:
+        source_path: Ruta de la imagen original
+        target_path: Ruta donde guardar la variante
+        width: Ancho máximo (None = sin límite)
+        height: Alto máximo (None = sin límite)
+        fmt: Formato de salida (jpeg, webp, avif, png)
+        quality: Calidad de codificación
+    
+    Returns:
+        Diccionario con tamaño en bytes y dimensiones de la variante
+    """
+    with Image.open(source_path) as source:
+        img = ImageOps.exif_transpose(source)
+        img.load()
+        
+        if width or height:
+            box = (width or img.width, height or img.height)
+            if box[0] < img.width or box[1] < img.height:
+                img = img.copy()
+                img.thumbnail(box, Image.LANCZOS)
+        
+        data = encode_image(img, fmt, quality)
+        size = img.size
+    
+    tmp_path = f"{target_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, target_path)
+    
+    return {"size_bytes": len(data), "width": size[0], "height": size[1]}
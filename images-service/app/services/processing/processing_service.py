@@ -0,0 +1,181 @@
+"""
+Servicio de procesamiento que genera derivados responsive tras la descarga
+"""
+from typing import Optional, List, Dict, Any
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from datetime import datetime
+import multiprocessing
+import asyncio
+import os
+
+from app.core import logger, settings
+from app.core.exceptions import ProcessingException
+from app.models.domain import ImageMetadata, ImageInfo, ProcessedImages
+from app.services.storage.factory import get_storage_service
+from app.services.storage.base import StorageService
+from .image_processor import generate_derivatives, is_format_supported, DerivativeSpec
+
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Obtiene el pool de procesos CPU del proceso actual, creándolo si no existe"""
+    global _process_pool
+    
+    if _process_pool is None:
+        workers = settings.processing_workers or os.cpu_count() or 1
+        # spawn evita heredar el event loop y los hilos de Motor del proceso padre
+        _process_pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        logger.info("Pool de procesamiento creado", workers=workers)
+    
+    return _process_pool
+
+
+def shutdown_process_pool() -> None:
+    """Cierra el pool de procesos si existe"""
+    global _process_pool
+    
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=True, cancel_futures=True)
+        _process_pool = None
+
+
+def build_derivative_specs() -> List[DerivativeSpec]:
+    """
+    Construye la lista de derivados a partir de la configuración
+    
+    Cada tamaño configurado (thumbnail, medium...) se genera en JPEG y en cada
+    formato moderno; cada formato moderno se genera además a tamaño original.
+    Los formatos que Pillow no puede codificar se omiten.
+    """
+    formats = []
+    for fmt in settings.derivative_formats:
+        if is_format_supported(fmt):
+            formats.append(fmt)
+        else:
+            logger.warning("Formato de derivado no soportado por Pillow, se omite", format=fmt)
+    
+    specs: List[DerivativeSpec] = []
+    for name, max_side in settings.derivative_size_map.items():
+        for fmt in ["jpeg", *formats]:
+            specs.append((name, fmt, max_side))
+    
+    for fmt in formats:
+        specs.append((fmt, fmt, None))
+    
+    return specs
+
+
+class ProcessingService:
+    """Genera derivados de las imágenes originales de un documento"""
+    
+    def __init__(
+        self,
+        storage_service: Optional[StorageService] = None,
+        executor: Optional[ProcessPoolExecutor] = None
+    ):
+        self.storage = storage_service or get_storage_service()
+        self.executor = executor
+        self.qualities = {
+            "jpeg": settings.jpeg_quality,
+            "webp": settings.webp_quality,
+            "avif": settings.avif_quality
+        }
+    
+    async def process_document(self, base_path: Path) -> Dict[str, Any]:
+        """
+        Genera los derivados de todas las imágenes originales de un documento
+        
+        Args:
+            base_path: Directorio del documento (contiene metadata.json y original/)
+        
+        Returns:
+            Resumen del procesamiento
+        """
+        metadata = await self.storage.read_metadata(base_path)
+        if metadata is None:
+            raise ProcessingException("Metadata no encontrada", image_path=str(base_path))
+        
+        specs = build_derivative_specs()
+        executor = self.executor or get_process_pool()
+        
+        # Regenerar desde cero para que reprocesar sea idempotente
+        metadata.processed_images = ProcessedImages()
+        # Los casi duplicados de otra imagen no necesitan derivados propios
+        originals = [img for img in metadata.original_images if not img.error and not img.duplicate_of]
+        
+        # Limitar imágenes en vuelo para no acumular originales en memoria
+        semaphore = asyncio.Semaphore((settings.processing_workers or os.cpu_count() or 1) * 2)
+        started = datetime.utcnow()
+        
+        async def process_one(image_info: ImageInfo) -> int:
+            async with semaphore:
+                try:
+                    return await self._process_image(base_path, image_info, metadata, specs, executor)
+                except Exception as e:
+                    logger.warning(
+                        "Error generando derivados",
+                        filename=image_info.filename,
+                        path=str(base_path),
+                        error=str(e)
+                    )
+                    return 0
+        
+        generated = await asyncio.gather(*(process_one(img) for img in originals))
+        
+        await self.storage.save_metadata(metadata, base_path)
+        
+        duration = (datetime.utcnow() - started).total_seconds()
+        summary = {
+            "path": str(base_path),
+            "originals": len(originals),
+            "derivatives": sum(generated),
+            "duration": round(duration, 3)
+        }
+        logger.info("Derivados generados", **summary)
+        return summary
+    
+    async def _process_image(
+        self,
+        base_path: Path,
+        image_info: ImageInfo,
+        metadata: ImageMetadata,
+        specs: List[DerivativeSpec],
+        executor: ProcessPoolExecutor
+    ) -> int:
+        """Genera y guarda los derivados de una imagen"""
+        content = await self.storage.read_file(base_path / "original" / image_info.filename)
+        
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(
+            executor,
+            generate_derivatives,
+            content,
+            image_info.filename,
+            specs,
+            self.qualities
+        )
+        
+        for result in results:
+            await self.storage.save_file(base_path / result["path"], result["content"])
+            
+            metadata.add_processed_image(
+                ImageInfo(
+                    filename=result["path"],
+                    url=image_info.url,
+                    size_bytes=result["size_bytes"],
+                    mime_type=result["mime_type"],
+                    width=result["width"],
+                    height=result["height"],
+                    hash=result["hash"],
+                    downloaded_at=datetime.utcnow()
+                ),
+                result["category"]
+            )
+        
+        return len(results)
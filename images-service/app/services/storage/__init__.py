@@ -3,5 +3,7 @@ Servicios de almacenamiento
 """
 from .base import StorageService
 from .local_storage import LocalStorageService
+from .manifest_index import ManifestIndex, manifest_index
+from .factory import get_storage_service
 
-__all__ = ["StorageService", "LocalStorageService"]
+__all__ = ["StorageService", "LocalStorageService", "ManifestIndex", "manifest_index", "get_storage_service"]
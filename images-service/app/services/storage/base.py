@@ -44,10 +44,19 @@ class StorageService(ABC):
         """Obtiene información de un archivo"""
         pass
     
+    async def _update_index(self, operation, full_path: Path, *args) -> None:
+        """Aplica una operación al índice sin que un fallo afecte al almacenamiento"""
+        try:
+            await operation(full_path, *args)
+        except Exception as e:
+            # El índice se puede reconstruir; el archivo ya está guardado/borrado
+            logger.warning("Error actualizando índice de imágenes", path=str(full_path), error=str(e))
+    
     async def save_metadata(self, metadata: ImageMetadata, base_path: Path) -> None:
         """Guarda metadata en formato JSON"""
         metadata_path = base_path / "metadata.json"
-        content = json.dumps(metadata.to_dict(), indent=2, ensure_ascii=False)
+        # JSON compacto: se lee por programa y se reescribe en cada documento/derivado
+        content = json.dumps(metadata.to_dict(), separators=(",", ":"), ensure_ascii=False)
         await self.save_file(metadata_path, content.encode('utf-8'))
         logger.info("Metadata guardada", path=str(metadata_path))
     
@@ -0,0 +1,28 @@
+"""
+Selección del backend de almacenamiento según la configuración
+"""
+from app.core import settings
+from app.core.exceptions import StorageException
+from .base import StorageService
+from .local_storage import LocalStorageService
+
+
+def get_storage_service() -> StorageService:
+    """
+    Crea el servicio de almacenamiento configurado en STORAGE_TYPE
+    
+    Returns:
+        LocalStorageService (local) o S3StorageService (s3)
+    """
+    # Settings ya lo normaliza a minúsculas
+    storage_type = settings.storage_type
+    
+    if storage_type == "local":
+        return LocalStorageService()
+    
+    if storage_type == "s3":
+        # Import diferido: boto3 solo es necesario con este backend
+        from .s3_storage import S3StorageService
+        return S3StorageService()
+    
+    raise StorageException(f"Tipo de almacenamiento no soportado: {settings.storage_type}")
@@ -0,0 +1,344 @@
+"""
+Recolector de basura del almacenamiento local
+
+Reconcilia STORAGE_PATH con MongoDB y con el metadata.json de cada documento y
+borra lo que ya no pertenece a nada:
+
+- orphan: directorios de documentos que ya no existen en su colección
+- superseded: directorios antiguos de un documento que cambió de nombre
+  (la ruta incluye el campo de búsqueda) y tiene otro más reciente
+- partial: directorios sin metadata.json (jobs que fallaron a medias)
+- stale_file: archivos que el metadata.json ya no referencia (la lista de
+  imágenes del documento se redujo o cambiaron los derivados)
+- temp_file: restos *.tmp de escrituras interrumpidas
+
+Los directorios con un metadata.json que no es de ImageMetadata (descarga
+simple) o cuyo job_id no está en MongoDB no se tocan nunca.
+
+Solo toca lo que lleva más de STORAGE_GC_GRACE_PERIOD segundos sin
+modificarse y se salta las colecciones con jobs en curso. Los recorridos y
+borrados se hacen en hilos y por lotes con pausa, sin bloquear el event loop
+ni saturar el disco.
+
+Uso:
+    python -m app.services.storage.garbage_collector [--dry-run] [--loop]
+"""
+from typing import Dict, Any, List
+from dataclasses import dataclass
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import os
+import signal
+import time
+
+from app.core import logger, settings, setup_logging
+from app.core.metrics import storage_gc_removed, storage_gc_reclaimed_bytes
+from app.services.database import mongo_repository
+from .base import StorageService
+from .local_storage import LocalStorageService
+
+
+# Los documentos de estos jobs no existen en MongoDB (vienen de una API externa)
+EXTERNAL_JOB_TYPES = {"download_api_url"}
+
+# IDs por consulta al comprobar qué documentos siguen existiendo
+ID_BATCH_SIZE = 1000
+
+
+@dataclass
+class GCCandidate:
+    """Algo que el recolector va a borrar"""
+    path: Path
+    kind: str
+    size: int
+    is_dir: bool
+
+
+class StorageGarbageCollector:
+    """Encuentra y borra los restos que quedan en el almacenamiento local"""
+    
+    def __init__(
+        self,
+        storage: StorageService = None,
+        grace_period: int = None,
+        batch_size: int = None,
+        batch_pause: float = None
+    ):
+        if storage is None:
+            from .factory import get_storage_service
+            storage = get_storage_service()
+        self.storage = storage
+        self.grace_period = settings.storage_gc_grace_period if grace_period is None else grace_period
+        self.batch_size = batch_size or settings.storage_gc_batch_size
+        self.batch_pause = settings.storage_gc_batch_pause if batch_pause is None else batch_pause
+    
+    async def run(self, dry_run: bool = False) -> Dict[str, Any]:
+        """
+        Ejecuta una pasada completa
+        
+        Args:
+            dry_run: Solo informa de lo que se borraría
+        
+        Returns:
+            Resumen con lo borrado por tipo y los bytes recuperados
+        """
+        started = time.monotonic()
+        report: Dict[str, Any] = {
+            "dry_run": dry_run,
+            "collections": 0,
+            "documents": 0,
+            "skipped_collections": [],
+            "removed": {},
+            "reclaimed_bytes": 0
+        }
+        
+        if not isinstance(self.storage, LocalStorageService):
+            # En S3 los restos se gestionan con reglas de ciclo de vida del bucket
+            logger.info("Recolector de basura solo disponible para almacenamiento local", storage_type=settings.storage_type)
+            return report
+        
+        cutoff = time.time() - self.grace_period
+        
+        for database, collection in await asyncio.to_thread(self._list_collections):
+            report["collections"] += 1
+            
+            try:
+                if await mongo_repository.has_active_jobs(database, collection):
+                    report["skipped_collections"].append(f"{database}/{collection}")
+                    continue
+                
+                candidates, documents = await self._collect(database, collection, cutoff)
+                report["documents"] += documents
+                await self._remove(candidates, report, dry_run)
+                
+            except Exception as e:
+                logger.error("Error en la recolección de basura", database=database, collection=collection, error=str(e))
+                report["skipped_collections"].append(f"{database}/{collection}")
+        
+        report["reclaimed_mb"] = round(report["reclaimed_bytes"] / (1024 * 1024), 2)
+        report["duration"] = round(time.monotonic() - started, 2)
+        logger.info("Recolección de basura completada", **report)
+        return report
+    
+    def _list_collections(self) -> List[tuple]:
+        """Pares (database, collection) presentes en disco"""
+        pairs = []
+        for database in self._subdirectories(self.storage.base_path):
+            for collection in self._subdirectories(database):
+                pairs.append((database.name, collection.name))
+        return pairs
+    
+    @staticmethod
+    def _subdirectories(path: Path) -> List[Path]:
+        """Subdirectorios visibles (se ignoran .manifest y similares)"""
+        try:
+            with os.scandir(path) as iterator:
+                return sorted(
+                    Path(entry.path) for entry in iterator
+                    if entry.is_dir(follow_symlinks=False) and not entry.name.startswith(".")
+                )
+        except FileNotFoundError:
+            return []
+    
+    def _scan_collection(self, collection_path: Path) -> List[Dict[str, Any]]:
+        """
+        Recorre los directorios de documentos de una colección (en un hilo)
+        
+        Returns:
+            Por documento: ruta, metadata.json, archivos (ruta relativa, tamaño, mtime),
+            tamaño total y última modificación
+        """
+        documents = []
+        
+        for document_path in self._subdirectories(collection_path):
+            files = []
+            newest = document_path.stat().st_mtime
+            
+            for root, dirs, names in os.walk(document_path):
+                dirs[:] = [name for name in dirs if not name.startswith(".")]
+                for name in names:
+                    full_path = Path(root) / name
+                    try:
+                        stat = full_path.stat()
+                    except FileNotFoundError:
+                        continue
+                    files.append((full_path.relative_to(document_path).as_posix(), stat.st_size, stat.st_mtime))
+                    newest = max(newest, stat.st_mtime)
+            
+            metadata = None
+            try:
+                with open(document_path / "metadata.json", "rb") as f:
+                    metadata = json.load(f)
+            except (FileNotFoundError, ValueError):
+                pass
+            
+            documents.append({
+                "path": document_path,
+                "metadata": metadata,
+                "files": files,
+                "size": sum(size for _, size, _ in files),
+                "mtime": newest
+            })
+        
+        return documents
+    
+    async def _collect(self, database: str, collection: str, cutoff: float) -> tuple:
+        """
+        Decide qué borrar de una colección
+        
+        Returns:
+            (candidatos, documentos revisados)
+        """
+        collection_path = self.storage.base_path / database / collection
+        documents = await asyncio.to_thread(self._scan_collection, collection_path)
+        candidates: List[GCCandidate] = []
+        
+        # Directorios sin metadata.json: descargas que no llegaron a terminar
+        complete = []
+        for document in documents:
+            if document["metadata"] is None:
+                if document["mtime"] < cutoff:
+                    candidates.append(GCCandidate(document["path"], "partial", document["size"], True))
+            elif self._is_managed(document["metadata"]):
+                complete.append(document)
+        
+        # Solo se reconcilian documentos de jobs que existen en MongoDB
+        job_types = await mongo_repository.get_job_types(
+            list({document["metadata"].get("job_id") for document in complete if document["metadata"].get("job_id")})
+        )
+        complete = [document for document in complete if document["metadata"].get("job_id") in job_types]
+        
+        # Documentos que ya no existen en MongoDB (salvo los de APIs externas)
+        internal = [
+            document for document in complete
+            if job_types[document["metadata"]["job_id"]] not in EXTERNAL_JOB_TYPES
+        ]
+        
+        if internal and await mongo_repository.collection_exists(database, collection):
+            document_ids = [document["metadata"]["document_id"] for document in internal]
+            existing = set()
+            for i in range(0, len(document_ids), ID_BATCH_SIZE):
+                existing |= await mongo_repository.existing_document_ids(
+                    database, collection, document_ids[i:i + ID_BATCH_SIZE]
+                )
+            
+            for document in internal:
+                if document["metadata"]["document_id"] not in existing and document["mtime"] < cutoff:
+                    candidates.append(GCCandidate(document["path"], "orphan", document["size"], True))
+                    complete.remove(document)
+        
+        # Un documento con varios directorios (cambió su nombre): se conserva el más reciente
+        by_document: Dict[str, List[Dict[str, Any]]] = {}
+        for document in complete:
+            by_document.setdefault(document["metadata"]["document_id"], []).append(document)
+        
+        for versions in by_document.values():
+            versions.sort(key=lambda document: document["metadata"].get("updated_at", ""), reverse=True)
+            for document in versions[1:]:
+                if document["mtime"] < cutoff:
+                    candidates.append(GCCandidate(document["path"], "superseded", document["size"], True))
+                    complete.remove(document)
+        
+        # Archivos que el metadata.json ya no referencia
+        for document in complete:
+            candidates.extend(self._stale_files(document, cutoff))
+        
+        return candidates, len(documents)
+    
+    @staticmethod
+    def _is_managed(metadata: Dict[str, Any]) -> bool:
+        """
+        Indica si el metadata.json tiene el formato de ImageMetadata
+        
+        Los de la descarga simple (download_simple) son planos, sin "images":
+        no dicen qué archivos son del documento, así que no se tocan.
+        """
+        return (
+            isinstance(metadata, dict)
+            and isinstance(metadata.get("images"), dict)
+            and bool(metadata.get("document_id"))
+        )
+    
+    def _stale_files(self, document: Dict[str, Any], cutoff: float) -> List[GCCandidate]:
+        """Temporales y archivos no referenciados de un documento"""
+        images = document["metadata"].get("images", {})
+        referenced = {"metadata.json"}
+        referenced.update(f"original/{image['filename']}" for image in images.get("original", []))
+        for category in images.get("processed", {}).values():
+            referenced.update(image["filename"] for image in category)
+        
+        stale = []
+        for relative_path, size, mtime in document["files"]:
+            if mtime >= cutoff:
+                continue
+            if relative_path.endswith(".tmp"):
+                stale.append(GCCandidate(document["path"] / relative_path, "temp_file", size, False))
+            elif relative_path not in referenced:
+                stale.append(GCCandidate(document["path"] / relative_path, "stale_file", size, False))
+        
+        return stale
+    
+    async def _remove(self, candidates: List[GCCandidate], report: Dict[str, Any], dry_run: bool) -> None:
+        """Borra los candidatos en lotes con pausa entre ellos"""
+        for i, candidate in enumerate(candidates):
+            if i and i % self.batch_size == 0 and not dry_run:
+                await asyncio.sleep(self.batch_pause)
+            
+            if not dry_run:
+                try:
+                    if candidate.is_dir:
+                        await self.storage.delete_directory(candidate.path, recursive=True)
+                    else:
+                        await self.storage.delete_file(candidate.path)
+                except Exception as e:
+                    logger.warning("No se pudo borrar", path=str(candidate.path), error=str(e))
+                    continue
+                
+                storage_gc_removed.labels(kind=candidate.kind).inc()
+                storage_gc_reclaimed_bytes.inc(candidate.size)
+            
+            logger.debug("Resto eliminado" if not dry_run else "Resto detectado", path=str(candidate.path), kind=candidate.kind, size=candidate.size)
+            report["removed"][candidate.kind] = report["removed"].get(candidate.kind, 0) + 1
+            report["reclaimed_bytes"] += candidate.size
+
+
+def main() -> None:
+    """Punto de entrada de línea de comandos"""
+    parser = argparse.ArgumentParser(description="Recolector de basura del almacenamiento")
+    parser.add_argument("--dry-run", action="store_true", help="Solo informar de lo que se borraría")
+    parser.add_argument("--loop", action="store_true", help="Repetir cada STORAGE_GC_INTERVAL segundos")
+    args = parser.parse_args()
+    
+    setup_logging(log_level="INFO" if settings.is_production else "DEBUG")
+    
+    async def _run() -> None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
+        
+        collector = StorageGarbageCollector()
+        await mongo_repository.connect()
+        try:
+            while not stop.is_set():
+                try:
+                    await collector.run(dry_run=args.dry_run)
+                except Exception as e:
+                    logger.error("Error en la recolección de basura", error=str(e))
+                
+                if not args.loop:
+                    break
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=settings.storage_gc_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            await mongo_repository.disconnect()
+    
+    asyncio.run(_run())
+
+
+if __name__ == "__main__":
+    main()
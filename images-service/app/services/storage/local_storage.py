@@ -5,20 +5,27 @@ from typing import Dict, Any, List
 from pathlib import Path
 import aiofiles
 import aiofiles.os
+import asyncio
 import os
 import shutil
 
 from app.core import logger, settings
 from app.core.exceptions import StorageException
 from .base import StorageService
+from .manifest_index import ManifestIndex, manifest_index
 
 
 class LocalStorageService(StorageService):
     """Servicio de almacenamiento en sistema de archivos local"""
     
-    def __init__(self, base_path: Path = None):
+    def __init__(self, base_path: Path = None, index: ManifestIndex = None):
         self.base_path = base_path or settings.storage_path
         self._ensure_base_path()
+        
+        # Índice de imágenes que se mantiene en cada guardado/borrado
+        if index is None:
+            index = manifest_index if self.base_path == settings.storage_path else ManifestIndex(self.base_path)
+        self.index = index
     
     def _ensure_base_path(self):
         """Asegura que el directorio base existe"""
@@ -46,6 +53,8 @@ class LocalStorageService(StorageService):
             async with aiofiles.open(full_path, 'wb') as f:
                 await f.write(content)
             
+            await self._update_index(self.index.add, full_path, len(content))
+            
             logger.debug("Archivo guardado", path=str(full_path), size=len(content))
             
         except Exception as e:
@@ -78,6 +87,8 @@ class LocalStorageService(StorageService):
                 await aiofiles.os.remove(full_path)
                 logger.debug("Archivo eliminado", path=str(full_path))
             
+            await self._update_index(self.index.remove, full_path)
+            
         except Exception as e:
             logger.error("Error eliminando archivo", path=str(full_path), error=str(e))
             raise StorageException(f"Error eliminando archivo: {str(e)}", path=str(full_path))
@@ -153,10 +164,13 @@ class LocalStorageService(StorageService):
             if not full_path.exists():
                 return
             
+            # En un hilo: un árbol con miles de imágenes bloquearía el event loop
             if recursive:
-                shutil.rmtree(full_path)
+                await asyncio.to_thread(shutil.rmtree, full_path)
             else:
-                full_path.rmdir()
+                await aiofiles.os.rmdir(full_path)
+            
+            await self._update_index(self.index.remove_tree, full_path)
             
             logger.debug("Directorio eliminado", path=str(full_path), recursive=recursive)
             
@@ -164,6 +178,10 @@ class LocalStorageService(StorageService):
             logger.error("Error eliminando directorio", path=str(full_path), error=str(e))
             raise StorageException(f"Error eliminando directorio: {str(e)}", path=str(full_path))
     
+    def scan_index_entries(self, root: Path) -> list:
+        """Imágenes bajo un directorio para reconstruir el índice"""
+        return self.index.scan_tree(root)
+    
     async def get_storage_stats(self) -> Dict[str, Any]:
         """Obtiene estadísticas del almacenamiento"""
         try:
@@ -198,6 +216,9 @@ class LocalStorageService(StorageService):
             # Mover archivo
             shutil.move(str(source_path), str(dest_path))
             
+            await self._update_index(self.index.remove, source_path)
+            await self._update_index(self.index.add, dest_path, dest_path.stat().st_size)
+            
             logger.debug("Archivo movido", source=str(source_path), destination=str(dest_path))
             
         except Exception as e:
@@ -216,6 +237,8 @@ class LocalStorageService(StorageService):
             # Copiar archivo
             shutil.copy2(str(source_path), str(dest_path))
             
+            await self._update_index(self.index.add, dest_path, dest_path.stat().st_size)
+            
             logger.debug("Archivo copiado", source=str(source_path), destination=str(dest_path))
             
         except Exception as e:
@@ -0,0 +1,443 @@
+"""
+Índice (manifest) de las imágenes almacenadas en disco
+
+Mantiene en SQLite una fila por imagen (base de datos, colección, documento,
+archivo) para que los listados de /images sean consultas paginadas sobre el
+índice en lugar de recorridos recursivos del sistema de archivos.
+
+LocalStorageService lo actualiza en cada guardado/borrado. Para indexar un
+almacenamiento existente:
+
+    python -m app.services.storage.manifest_index rebuild [--database DB] [--collection COL]
+"""
+from typing import Optional, Dict, Any, List, Tuple, Callable
+from pathlib import Path
+import argparse
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+from app.core import logger, settings
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp", ".avif")
+
+# Clave de una imagen en el índice: (database, collection, document_id, filename)
+ImageKey = Tuple[str, str, str, str]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    database TEXT NOT NULL,
+    collection TEXT NOT NULL,
+    document_id TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    PRIMARY KEY (database, collection, document_id, filename)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS documents (
+    database TEXT NOT NULL,
+    collection TEXT NOT NULL,
+    document_id TEXT NOT NULL,
+    image_count INTEGER NOT NULL,
+    total_size INTEGER NOT NULL,
+    PRIMARY KEY (database, collection, document_id)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS images_after_insert AFTER INSERT ON images BEGIN
+    INSERT INTO documents (database, collection, document_id, image_count, total_size)
+    VALUES (new.database, new.collection, new.document_id, 1, new.size)
+    ON CONFLICT (database, collection, document_id) DO UPDATE SET
+        image_count = image_count + 1,
+        total_size = total_size + new.size;
+END;
+
+CREATE TRIGGER IF NOT EXISTS images_after_update AFTER UPDATE OF size ON images BEGIN
+    UPDATE documents SET total_size = total_size - old.size + new.size
+    WHERE database = new.database AND collection = new.collection AND document_id = new.document_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS images_after_delete AFTER DELETE ON images BEGIN
+    UPDATE documents SET image_count = image_count - 1, total_size = total_size - old.size
+    WHERE database = old.database AND collection = old.collection AND document_id = old.document_id;
+    DELETE FROM documents
+    WHERE database = old.database AND collection = old.collection AND document_id = old.document_id
+    AND image_count <= 0;
+END;
+"""
+
+
+class ManifestIndex:
+    """
+    Índice SQLite de las imágenes de un directorio de almacenamiento
+    
+    Usa una conexión por hilo en modo WAL, de modo que la API y los workers de
+    Celery pueden leer y escribir el mismo archivo a la vez. Los métodos async
+    ejecutan las consultas en un hilo para no bloquear el event loop.
+    """
+    
+    def __init__(self, base_path: Path = None, index_path: Path = None):
+        self.base_path = base_path or settings.storage_path
+        self.index_path = index_path or (
+            settings.manifest_index_file if base_path is None else self.base_path / ".manifest.sqlite"
+        )
+        self._local = threading.local()
+    
+    def _connection(self) -> sqlite3.Connection:
+        """Obtiene la conexión del hilo actual, creándola si no existe"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.index_path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+    
+    def parse_path(self, full_path: Path) -> Optional[ImageKey]:
+        """
+        Traduce una ruta de archivo a su clave en el índice
+        
+        Returns:
+            (database, collection, document_id, filename) o None si la ruta no
+            corresponde a una imagen de un documento
+        """
+        try:
+            parts = full_path.relative_to(self.base_path).parts
+        except ValueError:
+            return None
+        
+        if len(parts) < 4 or any(part.startswith(".") for part in parts):
+            return None
+        if full_path.suffix.lower() not in IMAGE_EXTENSIONS:
+            return None
+        
+        return parts[0], parts[1], parts[2], "/".join(parts[3:])
+    
+    def _prefix_clause(self, full_path: Path) -> Optional[Tuple[str, list]]:
+        """Construye el WHERE que selecciona todo lo que cuelga de un directorio"""
+        try:
+            parts = full_path.relative_to(self.base_path).parts
+        except ValueError:
+            return None
+        
+        if not parts:
+            return "1 = 1", []
+        
+        columns = ["database", "collection", "document_id"]
+        conditions = [f"{column} = ?" for column in columns[:len(parts)]]
+        params = list(parts[:3])
+        
+        if len(parts) > 3:
+            # Subdirectorio de un documento: rango de filenames con ese prefijo
+            prefix = "/".join(parts[3:]) + "/"
+            conditions.append("filename >= ? AND filename < ?")
+            params.extend([prefix, prefix[:-1] + "0"])
+        
+        return " AND ".join(conditions), params
+    
+    # Escritura (síncrona, para ejecutar en un hilo)
+    
+    def upsert_sync(self, entries: List[Tuple[ImageKey, int, float]]) -> None:
+        """Inserta o actualiza imágenes en el índice"""
+        if not entries:
+            return
+        
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                """
+                INSERT INTO images (database, collection, document_id, filename, size, mtime)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (database, collection, document_id, filename)
+                DO UPDATE SET size = excluded.size, mtime = excluded.mtime
+                """,
+                [(*key, size, mtime) for key, size, mtime in entries]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    
+    def remove_sync(self, full_path: Path) -> None:
+        """Elimina una imagen del índice"""
+        key = self.parse_path(full_path)
+        if key is None:
+            return
+        
+        self._connection().execute(
+            "DELETE FROM images WHERE database = ? AND collection = ? AND document_id = ? AND filename = ?",
+            key
+        )
+    
+    def remove_tree_sync(self, full_path: Path) -> None:
+        """Elimina del índice todas las imágenes bajo un directorio"""
+        clause = self._prefix_clause(full_path)
+        if clause is None:
+            return
+        
+        where, params = clause
+        self._connection().execute(f"DELETE FROM images WHERE {where}", params)
+    
+    def scan_tree(self, root: Path) -> List[Tuple[ImageKey, int, float]]:
+        """Recorre un directorio y devuelve las imágenes que contiene"""
+        entries = []
+        stack = [root]
+        
+        while stack:
+            current = stack.pop()
+            try:
+                iterator = os.scandir(current)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            
+            with iterator:
+                for entry in iterator:
+                    if entry.name.startswith("."):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(Path(entry.path))
+                        continue
+                    
+                    key = self.parse_path(Path(entry.path))
+                    if key is None:
+                        continue
+                    stat = entry.stat()
+                    entries.append((key, stat.st_size, stat.st_mtime))
+        
+        return entries
+    
+    def rebuild_sync(
+        self,
+        database: Optional[str] = None,
+        collection: Optional[str] = None,
+        scanner: Optional[Callable[[Path], List[Tuple[ImageKey, int, float]]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Reconstruye el índice a partir del sistema de archivos
+        
+        Se hace en una única transacción: los lectores siguen viendo el índice
+        anterior hasta que termina.
+        
+        Args:
+            database: Limitar la reconstrucción a una base de datos
+            collection: Limitar a una colección (requiere database)
+            scanner: Función que lista las imágenes bajo una ruta (por defecto
+                recorre el sistema de archivos; S3 lista el bucket)
+        
+        Returns:
+            Resumen con el número de imágenes indexadas y la duración
+        """
+        if collection and not database:
+            raise ValueError("collection requiere database")
+        
+        started = time.monotonic()
+        root = self.base_path
+        for part in (database, collection):
+            if part:
+                root = root / part
+        
+        entries = (scanner or self.scan_tree)(root)
+        where, params = self._prefix_clause(root)
+        
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(f"DELETE FROM images WHERE {where}", params)
+            conn.executemany(
+                """
+                INSERT INTO images (database, collection, document_id, filename, size, mtime)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                [(*key, size, mtime) for key, size, mtime in entries]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        
+        summary = {
+            "path": str(root),
+            "images": len(entries),
+            "duration": round(time.monotonic() - started, 3)
+        }
+        logger.info("Índice de imágenes reconstruido", **summary)
+        return summary
+    
+    # Lectura (síncrona, para ejecutar en un hilo)
+    
+    def is_empty_sync(self) -> bool:
+        """Verifica si el índice no tiene ninguna imagen"""
+        return self._connection().execute("SELECT 1 FROM images LIMIT 1").fetchone() is None
+    
+    def list_document_sync(
+        self,
+        database: str,
+        collection: str,
+        document_id: str,
+        limit: int,
+        offset: int
+    ) -> Tuple[int, List[Dict[str, Any]]]:
+        """Imágenes de un documento ordenadas por nombre: (total, página)"""
+        conn = self._connection()
+        
+        row = conn.execute(
+            "SELECT image_count FROM documents WHERE database = ? AND collection = ? AND document_id = ?",
+            (database, collection, document_id)
+        ).fetchone()
+        total = row[0] if row else 0
+        
+        rows = conn.execute(
+            """
+            SELECT filename, size, mtime FROM images
+            WHERE database = ? AND collection = ? AND document_id = ?
+            ORDER BY filename LIMIT ? OFFSET ?
+            """,
+            (database, collection, document_id, limit, offset)
+        ).fetchall()
+        
+        return total, [{"filename": f, "size": s, "mtime": m} for f, s, m in rows]
+    
+    def list_collection_sync(
+        self,
+        database: str,
+        collection: str,
+        limit: int,
+        offset: int
+    ) -> Tuple[int, Dict[str, List[Dict[str, Any]]]]:
+        """Documentos de una colección con sus imágenes: (total_documentos, página)"""
+        conn = self._connection()
+        
+        total = conn.execute(
+            "SELECT COUNT(*) FROM documents WHERE database = ? AND collection = ?",
+            (database, collection)
+        ).fetchone()[0]
+        
+        document_ids = [
+            row[0] for row in conn.execute(
+                """
+                SELECT document_id FROM documents
+                WHERE database = ? AND collection = ?
+                ORDER BY document_id LIMIT ? OFFSET ?
+                """,
+                (database, collection, limit, offset)
+            )
+        ]
+        
+        documents: Dict[str, List[Dict[str, Any]]] = {doc_id: [] for doc_id in document_ids}
+        if document_ids:
+            rows = conn.execute(
+                """
+                SELECT document_id, filename, size FROM images
+                WHERE database = ? AND collection = ? AND document_id BETWEEN ? AND ?
+                ORDER BY document_id, filename
+                """,
+                (database, collection, document_ids[0], document_ids[-1])
+            )
+            for doc_id, filename, size in rows:
+                if doc_id in documents:
+                    documents[doc_id].append({"filename": filename, "size": size})
+        
+        return total, documents
+    
+    def list_collections_sync(self) -> List[Dict[str, Any]]:
+        """Colecciones indexadas con su número de documentos e imágenes"""
+        rows = self._connection().execute(
+            """
+            SELECT database, collection, COUNT(*), SUM(image_count) FROM documents
+            GROUP BY database, collection
+            ORDER BY database, collection
+            """
+        ).fetchall()
+        
+        return [
+            {"database": db, "collection": coll, "documents": docs, "images": images}
+            for db, coll, docs, images in rows
+        ]
+    
+    # API async
+    
+    async def add(self, full_path: Path, size: int) -> None:
+        """Registra (o actualiza) una imagen guardada"""
+        key = self.parse_path(full_path)
+        if key is not None:
+            await asyncio.to_thread(self.upsert_sync, [(key, size, time.time())])
+    
+    async def remove(self, full_path: Path) -> None:
+        """Elimina una imagen del índice"""
+        if self.parse_path(full_path) is not None:
+            await asyncio.to_thread(self.remove_sync, full_path)
+    
+    async def remove_tree(self, full_path: Path) -> None:
+        """Elimina del índice un directorio completo"""
+        await asyncio.to_thread(self.remove_tree_sync, full_path)
+    
+    async def rebuild(
+        self,
+        database: Optional[str] = None,
+        collection: Optional[str] = None,
+        scanner: Optional[Callable[[Path], List[Tuple[ImageKey, int, float]]]] = None
+    ) -> Dict[str, Any]:
+        """Reconstruye el índice en un hilo"""
+        return await asyncio.to_thread(self.rebuild_sync, database, collection, scanner)
+    
+    async def is_empty(self) -> bool:
+        """Verifica si el índice está vacío"""
+        return await asyncio.to_thread(self.is_empty_sync)
+    
+    async def list_document(
+        self,
+        database: str,
+        collection: str,
+        document_id: str,
+        limit: int,
+        offset: int
+    ) -> Tuple[int, List[Dict[str, Any]]]:
+        """Lista paginada de las imágenes de un documento"""
+        return await asyncio.to_thread(self.list_document_sync, database, collection, document_id, limit, offset)
+    
+    async def list_collection(
+        self,
+        database: str,
+        collection: str,
+        limit: int,
+        offset: int
+    ) -> Tuple[int, Dict[str, List[Dict[str, Any]]]]:
+        """Lista paginada de los documentos de una colección"""
+        return await asyncio.to_thread(self.list_collection_sync, database, collection, limit, offset)
+    
+    async def list_collections(self) -> List[Dict[str, Any]]:
+        """Lista de colecciones indexadas"""
+        return await asyncio.to_thread(self.list_collections_sync)
+
+
+# Instancia global por proceso (índice de settings.storage_path)
+manifest_index = ManifestIndex()
+
+
+def main() -> None:
+    """Punto de entrada de línea de comandos"""
+    parser = argparse.ArgumentParser(description="Gestión del índice de imágenes")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    rebuild_parser = subparsers.add_parser("rebuild", help="Reconstruye el índice desde disco")
+    rebuild_parser.add_argument("--database", help="Limitar a una base de datos")
+    rebuild_parser.add_argument("--collection", help="Limitar a una colección (requiere --database)")
+    
+    args = parser.parse_args()
+    
+    if args.command == "rebuild":
+        from .factory import get_storage_service
+        
+        storage = get_storage_service()
+        summary = storage.index.rebuild_sync(args.database, args.collection, storage.scan_index_entries)
+        print(f"{summary['images']} imágenes indexadas en {summary['duration']}s ({summary['path']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+"""
+Implementación de almacenamiento en object storage compatible con S3 (AWS, MinIO, R2...)
+"""
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator
+from email.utils import formatdate
+from pathlib import Path
+import mimetypes
+import asyncio
+import io
+
+from app.core import logger, settings
+from app.core.exceptions import StorageException
+from .base import StorageService
+from .manifest_index import ManifestIndex, ImageKey, manifest_index
+
+
+# Clientes boto3 por proceso (son thread-safe y caros de crear)
+_clients: Dict[Optional[str], Any] = {}
+
+
+def _get_client(endpoint_url: Optional[str]):
+    """Obtiene (o crea) el cliente S3 para un endpoint"""
+    if endpoint_url not in _clients:
+        try:
+            import boto3
+            from botocore.config import Config
+        except ImportError:
+            raise StorageException("boto3 no está instalado (necesario para STORAGE_TYPE=s3)")
+        
+        config = Config(
+            signature_version="s3v4",
+            max_pool_connections=max(10, settings.s3_max_concurrency * 2),
+            retries={"mode": "adaptive", "max_attempts": 5},
+            # MinIO y la mayoría de servicios compatibles requieren path-style
+            s3={"addressing_style": "path" if settings.s3_endpoint_url else "auto"}
+        )
+        _clients[endpoint_url] = boto3.session.Session().client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=settings.s3_region,
+            aws_access_key_id=settings.s3_access_key,
+            aws_secret_access_key=settings.s3_secret_key,
+            config=config
+        )
+    
+    return _clients[endpoint_url]
+
+
+def _error_code(error: Exception) -> str:
+    """Código de error de una ClientError de botocore ("" si no lo es)"""
+    response = getattr(error, "response", None) or {}
+    return str(response.get("Error", {}).get("Code", ""))
+
+
+class S3StorageService(StorageService):
+    """
+    Servicio de almacenamiento en un bucket S3 compatible
+    
+    Las rutas del servicio (relativas o bajo STORAGE_PATH) se traducen a claves
+    del bucket con el mismo layout: {S3_PREFIX}/{database}/{collection}/{documento}/...
+    Las llamadas de boto3 se ejecutan en hilos; los archivos grandes se suben
+    en multipart con partes concurrentes.
+    """
+    
+    def __init__(self, bucket: str = None, prefix: str = None, index: ManifestIndex = None):
+        self.bucket = bucket or settings.s3_bucket
+        if not self.bucket:
+            raise StorageException("S3_BUCKET es obligatorio con STORAGE_TYPE=s3")
+        
+        prefix = settings.s3_prefix if prefix is None else prefix
+        self.prefix = f"{prefix.strip('/')}/" if prefix.strip("/") else ""
+        
+        # Raíz lógica: las rutas absolutas que usan los servicios cuelgan de STORAGE_PATH
+        self.base_path = settings.storage_path
+        self.index = index or manifest_index
+        
+        self.client = _get_client(settings.s3_endpoint_url)
+        self._transfer_config = None
+    
+    @property
+    def transfer_config(self):
+        """Configuración de transferencias multipart (lazy para no importar boto3 antes de tiempo)"""
+        if self._transfer_config is None:
+            from boto3.s3.transfer import TransferConfig
+            
+            self._transfer_config = TransferConfig(
+                multipart_threshold=settings.s3_multipart_threshold_mb * 1024 * 1024,
+                multipart_chunksize=settings.s3_multipart_chunk_mb * 1024 * 1024,
+                max_concurrency=settings.s3_max_concurrency,
+                use_threads=True
+            )
+        return self._transfer_config
+    
+    def _get_full_path(self, file_path: Path) -> Path:
+        """Ruta lógica completa (bajo STORAGE_PATH)"""
+        if file_path.is_absolute():
+            return file_path
+        return self.base_path / file_path
+    
+    def _key(self, file_path: Path) -> str:
+        """Traduce una ruta del servicio a clave del bucket"""
+        full_path = self._get_full_path(file_path)
+        try:
+            relative = full_path.relative_to(self.base_path).as_posix()
+        except ValueError:
+            relative = full_path.as_posix().lstrip("/")
+        
+        if relative == ".":
+            relative = ""
+        return f"{self.prefix}{relative}"
+    
+    def _path_from_key(self, key: str) -> Path:
+        """Ruta relativa (respecto a STORAGE_PATH) de una clave del bucket"""
+        return Path(key[len(self.prefix):])
+    
+    def _list_keys(self, prefix: str, delimiter: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Lista todos los objetos bajo un prefijo (síncrono, paginado)"""
+        params = {"Bucket": self.bucket, "Prefix": prefix}
+        if delimiter:
+            params["Delimiter"] = delimiter
+        
+        objects = []
+        for page in self.client.get_paginator("list_objects_v2").paginate(**params):
+            objects.extend(page.get("Contents", []))
+        return objects
+    
+    async def save_file(self, file_path: Path, content: bytes) -> None:
+        """Sube un archivo al bucket (multipart si supera el umbral)"""
+        key = self._key(file_path)
+        content_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+        
+        try:
+            if len(content) >= self.transfer_config.multipart_threshold:
+                # upload_fileobj trocea en partes y las sube en paralelo
+                await asyncio.to_thread(
+                    self.client.upload_fileobj,
+                    io.BytesIO(content),
+                    self.bucket,
+                    key,
+                    ExtraArgs={"ContentType": content_type},
+                    Config=self.transfer_config
+                )
+            else:
+                await asyncio.to_thread(
+                    self.client.put_object,
+                    Bucket=self.bucket,
+                    Key=key,
+                    Body=content,
+                    ContentType=content_type
+                )
+            
+            await self._update_index(self.index.add, self._get_full_path(file_path), len(content))
+            
+            logger.debug("Archivo subido a S3", bucket=self.bucket, key=key, size=len(content))
+            
+        except Exception as e:
+            logger.error("Error subiendo archivo a S3", bucket=self.bucket, key=key, error=str(e))
+            raise StorageException(f"Error guardando archivo: {str(e)}", path=key)
+    
+    async def upload_path(self, local_path: Path, file_path: Path) -> None:
+        """Sube un archivo local sin cargarlo entero en memoria (multipart concurrente)"""
+        key = self._key(file_path)
+        
+        try:
+            await asyncio.to_thread(
+                self.client.upload_file,
+                str(local_path),
+                self.bucket,
+                key,
+                ExtraArgs={"ContentType": mimetypes.guess_type(key)[0] or "application/octet-stream"},
+                Config=self.transfer_config
+            )
+            await self._update_index(self.index.add, self._get_full_path(file_path), local_path.stat().st_size)
+            
+        except Exception as e:
+            logger.error("Error subiendo archivo a S3", bucket=self.bucket, key=key, error=str(e))
+            raise StorageException(f"Error guardando archivo: {str(e)}", path=key)
+    
+    async def read_file(self, file_path: Path) -> bytes:
+        """Descarga un archivo del bucket"""
+        key = self._key(file_path)
+        
+        def _read() -> bytes:
+            body = self.client.get_object(Bucket=self.bucket, Key=key)["Body"]
+            try:
+                return body.read()
+            finally:
+                body.close()
+        
+        try:
+            content = await asyncio.to_thread(_read)
+            logger.debug("Archivo leído de S3", key=key, size=len(content))
+            return content
+            
+        except Exception as e:
+            if _error_code(e) in ("NoSuchKey", "404"):
+                raise StorageException("Archivo no encontrado", path=key)
+            logger.error("Error leyendo archivo de S3", key=key, error=str(e))
+            raise StorageException(f"Error leyendo archivo: {str(e)}", path=key)
+    
+    async def stream_object(
+        self,
+        file_path: Path,
+        request_headers: Dict[str, str],
+        chunk_size: int = 64 * 1024
+    ) -> Tuple[int, Dict[str, str], Optional[AsyncIterator[bytes]]]:
+        """
+        Abre un objeto para servirlo en streaming
+        
+        Reenvía a S3 las cabeceras Range, If-None-Match e If-Modified-Since,
+        de modo que los 206/304/416 los resuelve el propio bucket.
+        
+        Returns:
+            Tupla (status, cabeceras de respuesta, iterador de bytes o None)
+        """
+        key = self._key(file_path)
+        params = {"Bucket": self.bucket, "Key": key}
+        
+        header_params = {
+            "range": "Range",
+            "if-none-match": "IfNoneMatch",
+            "if-modified-since": "IfModifiedSince",
+        }
+        for header, param in header_params.items():
+            if request_headers.get(header):
+                params[param] = request_headers[header]
+        
+        try:
+            response = await asyncio.to_thread(self.client.get_object, **params)
+        except Exception as e:
+            code = _error_code(e)
+            if code in ("NoSuchKey", "404"):
+                return 404, {}, None
+            if code == "304":
+                return 304, {}, None
+            if code == "InvalidRange":
+                return 416, {}, None
+            logger.error("Error abriendo objeto de S3", key=key, error=str(e))
+            raise StorageException(f"Error leyendo archivo: {str(e)}", path=key)
+        
+        metadata = response["ResponseMetadata"]
+        headers = {
+            "Content-Length": str(response["ContentLength"]),
+            "Accept-Ranges": "bytes",
+        }
+        if response.get("ETag"):
+            headers["ETag"] = response["ETag"]
+        if response.get("LastModified"):
+            headers["Last-Modified"] = formatdate(response["LastModified"].timestamp(), usegmt=True)
+        if response.get("ContentRange"):
+            headers["Content-Range"] = response["ContentRange"]
+        
+        body = response["Body"]
+        
+        async def iterate() -> AsyncIterator[bytes]:
+            try:
+                while True:
+                    chunk = await asyncio.to_thread(body.read, chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+            finally:
+                body.close()
+        
+        return metadata.get("HTTPStatusCode", 200), headers, iterate()
+    
+    def presigned_url(self, file_path: Path, expires_in: int = None) -> str:
+        """
+        URL prefirmada de descarga (no hace ninguna petición de red)
+        
+        Si S3_PUBLIC_ENDPOINT_URL está definido se firma contra ese endpoint,
+        útil cuando el servicio accede al bucket por una red interna.
+        """
+        client = _get_client(settings.s3_public_endpoint_url) if settings.s3_public_endpoint_url else self.client
+        return client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._key(file_path)},
+            ExpiresIn=expires_in or settings.s3_presign_expiration
+        )
+    
+    async def delete_file(self, file_path: Path) -> None:
+        """Elimina un objeto del bucket"""
+        key = self._key(file_path)
+        
+        try:
+            await asyncio.to_thread(self.client.delete_object, Bucket=self.bucket, Key=key)
+            await self._update_index(self.index.remove, self._get_full_path(file_path))
+            logger.debug("Archivo eliminado de S3", key=key)
+            
+        except Exception as e:
+            logger.error("Error eliminando archivo de S3", key=key, error=str(e))
+            raise StorageException(f"Error eliminando archivo: {str(e)}", path=key)
+    
+    async def exists(self, file_path: Path) -> bool:
+        """Verifica si un objeto existe"""
+        key = self._key(file_path)
+        
+        try:
+            await asyncio.to_thread(self.client.head_object, Bucket=self.bucket, Key=key)
+            return True
+        except Exception as e:
+            if _error_code(e) in ("NoSuchKey", "404", "NotFound"):
+                return False
+            raise StorageException(f"Error consultando archivo: {str(e)}", path=key)
+    
+    async def list_files(self, directory: Path) -> List[Path]:
+        """Lista los objetos directamente bajo un "directorio" (prefijo)"""
+        prefix = self._key(directory).rstrip("/") + "/"
+        
+        try:
+            objects = await asyncio.to_thread(self._list_keys, prefix, "/")
+            return [self._path_from_key(obj["Key"]) for obj in objects]
+            
+        except Exception as e:
+            logger.error("Error listando objetos de S3", prefix=prefix, error=str(e))
+            raise StorageException(f"Error listando archivos: {str(e)}", path=prefix)
+    
+    async def get_file_info(self, file_path: Path) -> Dict[str, Any]:
+        """Obtiene información de un objeto"""
+        key = self._key(file_path)
+        
+        try:
+            response = await asyncio.to_thread(self.client.head_object, Bucket=self.bucket, Key=key)
+        except Exception as e:
+            if _error_code(e) in ("NoSuchKey", "404", "NotFound"):
+                raise StorageException("Archivo no encontrado", path=key)
+            logger.error("Error obteniendo info del objeto", key=key, error=str(e))
+            raise StorageException(f"Error obteniendo info del archivo: {str(e)}", path=key)
+        
+        modified_at = response["LastModified"].timestamp()
+        return {
+            "path": str(file_path),
+            "size": response["ContentLength"],
+            "created_at": modified_at,
+            "modified_at": modified_at,
+            "etag": response.get("ETag"),
+            "is_file": True,
+            "is_dir": False
+        }
+    
+    async def create_directory(self, directory: Path) -> None:
+        """Los buckets no tienen directorios: no hace nada"""
+        return None
+    
+    async def delete_directory(self, directory: Path, recursive: bool = False) -> None:
+        """Elimina todos los objetos bajo un prefijo"""
+        prefix = self._key(directory).rstrip("/") + "/"
+        
+        def _delete() -> int:
+            keys = [obj["Key"] for obj in self._list_keys(prefix)]
+            if keys and not recursive:
+                raise StorageException("El directorio no está vacío", path=prefix)
+            
+            # delete_objects admite hasta 1000 claves por petición
+            for start in range(0, len(keys), 1000):
+                batch = keys[start:start + 1000]
+                self.client.delete_objects(
+                    Bucket=self.bucket,
+                    Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True}
+                )
+            return len(keys)
+        
+        try:
+            deleted = await asyncio.to_thread(_delete)
+            await self._update_index(self.index.remove_tree, self._get_full_path(directory))
+            logger.debug("Directorio eliminado de S3", prefix=prefix, objects=deleted)
+            
+        except StorageException:
+            raise
+        except Exception as e:
+            logger.error("Error eliminando directorio de S3", prefix=prefix, error=str(e))
+            raise StorageException(f"Error eliminando directorio: {str(e)}", path=prefix)
+    
+    async def get_storage_stats(self) -> Dict[str, Any]:
+        """Obtiene información del bucket (verifica que es accesible)"""
+        stats = {
+            "type": "s3",
+            "bucket": self.bucket,
+            "prefix": self.prefix,
+            "endpoint": settings.s3_endpoint_url or "aws"
+        }
+        
+        try:
+            await asyncio.to_thread(self.client.head_bucket, Bucket=self.bucket)
+            stats["reachable"] = True
+        except Exception as e:
+            logger.error("Error accediendo al bucket", bucket=self.bucket, error=str(e))
+            stats["reachable"] = False
+            stats["error"] = str(e)
+        
+        return stats
+    
+    async def copy_file(self, source: Path, destination: Path) -> None:
+        """Copia un objeto dentro del bucket (copia multipart del lado del servidor)"""
+        source_key = self._key(source)
+        dest_key = self._key(destination)
+        
+        try:
+            await asyncio.to_thread(
+                self.client.copy,
+                {"Bucket": self.bucket, "Key": source_key},
+                self.bucket,
+                dest_key,
+                Config=self.transfer_config
+            )
+            info = await self.get_file_info(destination)
+            await self._update_index(self.index.add, self._get_full_path(destination), info["size"])
+            
+            logger.debug("Objeto copiado", source=source_key, destination=dest_key)
+            
+        except Exception as e:
+            logger.error("Error copiando objeto", source=source_key, destination=dest_key, error=str(e))
+            raise StorageException(f"Error copiando archivo: {str(e)}", path=source_key)
+    
+    async def move_file(self, source: Path, destination: Path) -> None:
+        """Mueve un objeto (copia + borrado)"""
+        await self.copy_file(source, destination)
+        await self.delete_file(source)
+    
+    def scan_index_entries(self, root: Path) -> List[Tuple[ImageKey, int, float]]:
+        """Imágenes del bucket bajo una ruta para reconstruir el índice (síncrono)"""
+        prefix = self._key(root).rstrip("/")
+        prefix = f"{prefix}/" if prefix else ""
+        
+        entries = []
+        for obj in self._list_keys(prefix):
+            key = self.index.parse_path(self.base_path / self._path_from_key(obj["Key"]))
+            if key is not None:
+                entries.append((key, obj["Size"], obj["LastModified"].timestamp()))
+        return entries
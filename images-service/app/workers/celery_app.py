@@ -2,18 +2,21 @@
 Configuración de Celery para procesamiento asíncrono
 """
 from celery import Celery
-from celery.signals import worker_ready, worker_shutdown
+from celery.signals import worker_ready, worker_shutdown, worker_process_init, worker_process_shutdown
 import asyncio
 import sys
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional
 
 # Añadir el directorio raíz al path para importar config
 root_dir = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(root_dir))
 
 from app.core import settings, logger, setup_logging
+from app.core.metrics import mark_process_dead
 from app.services.database import mongo_repository
+from app.services.download.http_client import shared_http_client
+from app.services.processing import shutdown_process_pool
 
 
 # Crear instancia de Celery
@@ -32,8 +35,8 @@ celery_app.conf.update(
     timezone="UTC",
     enable_utc=True,
     task_track_started=True,
-    task_time_limit=3600,  # 1 hora máximo por tarea
-    task_soft_time_limit=3300,  # Warning a los 55 minutos
+    task_time_limit=settings.job_max_runtime,  # 1 hora máximo por tarea
+    task_soft_time_limit=settings.job_max_runtime - 300,  # Warning 5 minutos antes
     worker_prefetch_multiplier=1,  # Para tareas largas, mejor 1
     worker_max_tasks_per_child=50,  # Reiniciar worker después de 50 tareas
     task_acks_late=True,  # Acknowledge después de completar
@@ -42,7 +45,8 @@ celery_app.conf.update(
     result_expires=86400,  # Resultados expiran en 24 horas
 )
 
-# Configuración de rutas de tareas
+# Configuración de rutas de tareas (los jobs interactivos se envían
+# explícitamente a "downloads_interactive", ver app/workers/scheduler.py)
 celery_app.conf.task_routes = {
     "app.workers.tasks.download.*": {"queue": "downloads"},
     "app.workers.tasks.process.*": {"queue": "processing"},
@@ -55,6 +59,11 @@ celery_app.conf.task_queues = {
         "exchange_type": "direct",
         "routing_key": "download",
     },
+    "downloads_interactive": {
+        "exchange": "downloads_interactive",
+        "exchange_type": "direct",
+        "routing_key": "download_interactive",
+    },
     "processing": {
         "exchange": "processing",
         "exchange_type": "direct",
@@ -63,17 +72,65 @@ celery_app.conf.task_queues = {
 }
 
 
+# Event loop persistente del proceso worker. Motor y httpx quedan ligados al
+# loop en el que se crean, así que todas las tareas del proceso lo reutilizan.
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_worker_loop() -> asyncio.AbstractEventLoop:
+    """Obtiene el event loop del proceso worker, creándolo si no existe"""
+    global _worker_loop
+    
+    if _worker_loop is None or _worker_loop.is_closed():
+        _worker_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_worker_loop)
+    
+    return _worker_loop
+
+
 @worker_ready.connect
 def on_worker_ready(**kwargs):
     """Se ejecuta cuando el worker está listo"""
     setup_logging(log_level="INFO" if settings.is_production else "DEBUG")
     logger.info("Worker de Celery iniciado", environment=settings.environment)
+
+
+@worker_process_init.connect
+def on_worker_process_init(**kwargs):
+    """Se ejecuta en cada proceso hijo del pool: crea su loop y su conexión a MongoDB"""
+    setup_logging(log_level="INFO" if settings.is_production else "DEBUG")
     
-    # Conectar a MongoDB en el contexto del worker
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.run_until_complete(mongo_repository.connect())
-    logger.info("Conexión a MongoDB establecida en worker")
+    loop = get_worker_loop()
+    try:
+        loop.run_until_complete(mongo_repository.connect())
+        logger.info("Conexión a MongoDB establecida en proceso worker")
+    except Exception as e:
+        # Se reintentará de forma perezosa en la primera tarea
+        logger.error("Error conectando a MongoDB en proceso worker", error=str(e))
+
+
+@worker_process_shutdown.connect
+def on_worker_process_shutdown(**kwargs):
+    """Libera los recursos del proceso hijo antes de terminar"""
+    global _worker_loop
+    
+    # Sus gauges "live" dejan de contar en /metrics
+    mark_process_dead()
+    
+    if _worker_loop is None or _worker_loop.is_closed():
+        return
+    
+    loop = _worker_loop
+    try:
+        loop.run_until_complete(shared_http_client.aclose())
+        loop.run_until_complete(mongo_repository.disconnect())
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        logger.info("Recursos del proceso worker liberados")
+    except Exception as e:
+        logger.warning("Error liberando recursos del proceso worker", error=str(e))
+    finally:
+        loop.close()
+        _worker_loop = None
 
 
 @worker_shutdown.connect
@@ -81,10 +138,8 @@ def on_worker_shutdown(**kwargs):
     """Se ejecuta cuando el worker se cierra"""
     logger.info("Worker de Celery cerrándose")
     
-    # Desconectar de MongoDB
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(mongo_repository.disconnect())
-    logger.info("Conexión a MongoDB cerrada en worker")
+    # Pool CPU de la cola processing (solo existe si se generaron derivados)
+    shutdown_process_pool()
 
 
 class AsyncTask:
@@ -96,12 +151,7 @@ class AsyncTask:
     
     def __call__(self, func):
         def wrapper(*args, **kwargs):
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                return loop.run_until_complete(func(*args, **kwargs))
-            finally:
-                loop.close()
+            return run_async(func(*args, **kwargs))
         
         # Registrar la tarea en Celery
         return celery_app.task(*self.args, **self.kwargs)(wrapper)
@@ -109,10 +159,5 @@ class AsyncTask:
 
 # Función helper para ejecutar código asíncrono
 def run_async(coro):
-    """Ejecuta una corrutina en el contexto de Celery"""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        return loop.run_until_complete(coro)
-    finally:
-        loop.close()
+    """Ejecuta una corrutina en el event loop persistente del proceso worker"""
+    return get_worker_loop().run_until_complete(coro)
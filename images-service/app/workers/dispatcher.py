@@ -0,0 +1,177 @@
+"""
+Dispatcher de jobs dirigido por eventos
+
+Observa image_jobs con un change stream de MongoDB y llama a
+job_scheduler.dispatch() en cuanto se crea un job o cambia el estado de uno,
+en lugar de esperar al sondeo periódico. Si MongoDB no admite change streams
+(instancia standalone sin replica set) sondea con la consulta indexada por
+status + created_at cada JOB_DISPATCH_POLL_INTERVAL segundos.
+
+Puede haber varios dispatchers a la vez: claim_job_for_queue() usa
+find_one_and_update y solo uno de ellos encola cada job.
+
+Uso:
+    python -m app.workers.dispatcher
+"""
+from typing import Optional, Dict, Any
+import argparse
+import asyncio
+import signal
+import time
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from app.core import logger, settings, setup_logging
+from app.services.database import mongo_repository
+from app.workers.scheduler import job_scheduler
+
+
+# Error de MongoDB al abrir un change stream sin replica set
+CHANGE_STREAMS_UNSUPPORTED = 40573
+
+# Solo interesan los cambios que pueden liberar o necesitar un hueco
+WATCH_PIPELINE = [
+    {
+        "$match": {
+            "$or": [
+                {"operationType": "insert"},
+                {"updateDescription.updatedFields.status": {"$exists": True}},
+                {"updateDescription.updatedFields.queued_at": {"$exists": True}},
+            ]
+        }
+    },
+    {"$project": {"operationType": 1}},
+]
+
+
+class JobDispatcher:
+    """
+    Lanza job_scheduler.dispatch() cuando cambian los jobs
+    
+    - Los eventos que llegan juntos (p. ej. un lote de jobs creados) se agrupan
+      en un único dispatch, esperando como mucho JOB_DISPATCH_DEBOUNCE segundos.
+    - Aunque no lleguen eventos se hace un dispatch cada JOB_DISPATCH_INTERVAL
+      segundos, por si un envío a Celery se perdió o un job quedó colgado.
+    - El resume token permite reabrir el stream sin perder eventos tras un corte.
+    """
+    
+    def __init__(self):
+        self._stop = asyncio.Event()
+        self._resume_token: Optional[Dict[str, Any]] = None
+        self._last_dispatch = 0.0
+        self.dispatches = 0
+        self.mode = "starting"
+    
+    def stop(self) -> None:
+        """Pide al dispatcher que termine"""
+        self._stop.set()
+    
+    async def run(self) -> None:
+        """Bucle principal: change stream con reintentos y sondeo como alternativa"""
+        await mongo_repository.connect()
+        logger.info("Dispatcher de jobs iniciado")
+        
+        # Jobs que quedaron pendientes mientras no había dispatcher
+        await self._dispatch()
+        
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                await self._watch()
+                backoff = 1.0
+                
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAMS_UNSUPPORTED:
+                    logger.warning(
+                        "MongoDB no admite change streams, se usará sondeo",
+                        interval=settings.job_dispatch_poll_interval
+                    )
+                    await self._poll()
+                    break
+                logger.error("Error en el change stream de jobs", error=str(e), code=e.code)
+                # El token puede haber caducado del oplog: empezar de nuevo
+                self._resume_token = None
+                await self._sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+                
+            except PyMongoError as e:
+                logger.error("Conexión con MongoDB perdida en el dispatcher", error=str(e))
+                await self._sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+        
+        await mongo_repository.disconnect()
+        logger.info("Dispatcher de jobs detenido", dispatches=self.dispatches)
+    
+    async def _watch(self) -> None:
+        """Procesa eventos del change stream hasta que se pide parar"""
+        async with mongo_repository.watch_jobs(WATCH_PIPELINE, resume_after=self._resume_token) as stream:
+            self.mode = "change_stream"
+            logger.info("Observando cambios en image_jobs", resumed=self._resume_token is not None)
+            
+            # Al (re)abrir el stream pudo perderse algo
+            await self._dispatch()
+            
+            while not self._stop.is_set():
+                # try_next espera como mucho max_await_time_ms y devuelve None sin eventos
+                change = await stream.try_next()
+                self._resume_token = stream.resume_token
+                
+                if change is not None:
+                    await self._drain(stream)
+                    await self._dispatch()
+                elif time.monotonic() - self._last_dispatch >= settings.job_dispatch_interval:
+                    await self._dispatch()
+    
+    async def _drain(self, stream) -> None:
+        """Consume los eventos que llegan seguidos para agruparlos en un dispatch"""
+        deadline = time.monotonic() + settings.job_dispatch_debounce
+        while time.monotonic() < deadline:
+            change = await stream.try_next()
+            self._resume_token = stream.resume_token
+            if change is None:
+                break
+    
+    async def _poll(self) -> None:
+        """Alternativa sin change streams: dispatch periódico con la consulta indexada"""
+        self.mode = "poll"
+        while not self._stop.is_set():
+            await self._dispatch()
+            await self._sleep(settings.job_dispatch_poll_interval)
+    
+    async def _dispatch(self) -> None:
+        """Ejecuta un dispatch sin dejar que un error pare el dispatcher"""
+        self._last_dispatch = time.monotonic()
+        try:
+            await job_scheduler.dispatch()
+            self.dispatches += 1
+        except Exception as e:
+            logger.error("Error despachando jobs", error=str(e))
+    
+    async def _sleep(self, seconds: float) -> None:
+        """Espera interrumpible por stop()"""
+        try:
+            await asyncio.wait_for(self._stop.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+
+def main() -> None:
+    """Punto de entrada de línea de comandos"""
+    parser = argparse.ArgumentParser(description="Dispatcher de jobs de descarga")
+    parser.add_argument("--log-level", default="INFO" if settings.is_production else "DEBUG")
+    args = parser.parse_args()
+    
+    setup_logging(log_level=args.log_level)
+    
+    async def _run() -> None:
+        dispatcher = JobDispatcher()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, dispatcher.stop)
+        await dispatcher.run()
+    
+    asyncio.run(_run())
+
+
+if __name__ == "__main__":
+    main()
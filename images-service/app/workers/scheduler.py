@@ -0,0 +1,174 @@
+"""
+Planificador de jobs de descarga: prioridades y reparto justo entre colecciones
+"""
+from typing import Dict, List, Tuple, Optional
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+import asyncio
+import heapq
+
+from app.core import logger, settings
+from app.models.domain import Job, JobPriority
+from app.services.database import mongo_repository
+
+
+# Cola de Celery (y pool de workers) de cada clase de prioridad
+QUEUE_BY_PRIORITY = {
+    JobPriority.INTERACTIVE: "downloads_interactive",
+    JobPriority.BULK: "downloads",
+}
+
+Flow = Tuple[str, str]
+
+
+def flow_weight(flow: Flow) -> float:
+    """
+    Peso de un flujo (database, collection) según JOB_FLOW_WEIGHTS
+    
+    Se busca primero "database.collection" y después "database"; por defecto 1.
+    """
+    database, collection = flow
+    weights = settings.job_flow_weights
+    weight = weights.get(f"{database}.{collection}", weights.get(database, 1.0))
+    return weight if weight > 0 else 1.0
+
+
+def fair_order(jobs: List[Job], active: Optional[Dict[Flow, int]] = None) -> List[Job]:
+    """
+    Ordena jobs pendientes con weighted fair queuing por (database, collection)
+    
+    Cada job de un flujo avanza su tiempo virtual 1/peso y se sirve siempre el
+    flujo con menor tiempo virtual, así una colección con cientos de jobs
+    encolados no retrasa a las demás. Los jobs ya activos de un flujo cuentan
+    como servidos. Dentro de un flujo se respeta el orden de llegada.
+    
+    Args:
+        jobs: Jobs pendientes ordenados por created_at
+        active: Jobs encolados o en ejecución por flujo
+    """
+    active = active or {}
+    queues: Dict[Flow, deque] = defaultdict(deque)
+    for job in jobs:
+        queues[(job.database, job.collection)].append(job)
+    
+    heap = []
+    for flow, queue in queues.items():
+        finish = (active.get(flow, 0) + 1) / flow_weight(flow)
+        heapq.heappush(heap, (finish, queue[0].created_at, flow))
+    
+    ordered = []
+    while heap:
+        finish, _, flow = heapq.heappop(heap)
+        queue = queues[flow]
+        ordered.append(queue.popleft())
+        if queue:
+            heapq.heappush(heap, (finish + 1 / flow_weight(flow), queue[0].created_at, flow))
+    
+    return ordered
+
+
+class JobScheduler:
+    """
+    Decide cuándo y en qué cola de Celery entra cada job
+    
+    - Los jobs interactivos se encolan al momento en su propia cola, atendida
+      por un pool de workers separado.
+    - Los bulk se quedan PENDING en MongoDB y solo se encolan cuando hay un
+      hueco libre (BULK_JOB_SLOTS), eligiendo el siguiente con fair_order().
+      Así la cola de Celery nunca acumula cientos de jobs en orden FIFO.
+    
+    dispatch() se ejecuta al crear un job bulk, al terminar cualquier job y ante
+    cada cambio en image_jobs (app/workers/dispatcher.py, que además lo repite
+    de forma periódica por si algún envío se perdió).
+    """
+    
+    def __init__(self):
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    def _get_lock(self) -> asyncio.Lock:
+        """Lock por event loop (la API y cada proceso worker tienen el suyo)"""
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._loop is not loop:
+            self._lock = asyncio.Lock()
+            self._loop = loop
+        return self._lock
+    
+    async def submit(self, job: Job) -> None:
+        """Encola un job recién creado según su prioridad"""
+        if job.priority == JobPriority.INTERACTIVE:
+            await self._enqueue(job, self._stale_before())
+        else:
+            await self.dispatch()
+    
+    async def dispatch(self) -> List[str]:
+        """
+        Encola los jobs pendientes que quepan
+        
+        Returns:
+            IDs de los jobs enviados a Celery
+        """
+        async with self._get_lock():
+            now = datetime.utcnow()
+            stale_before = self._stale_before(now)
+            queued = []
+            
+            # Interactivos que no llegaron a encolarse (p. ej. Redis caído al crearlos)
+            for job in await mongo_repository.get_dispatchable_jobs(JobPriority.INTERACTIVE, stale_before):
+                if await self._enqueue(job, stale_before):
+                    queued.append(job.id)
+            
+            # Bulk: solo tantos como huecos libres, en orden justo
+            active = await mongo_repository.count_active_jobs_by_flow(
+                JobPriority.BULK,
+                stale_before,
+                running_since=now - timedelta(seconds=settings.job_max_runtime)
+            )
+            free_slots = settings.bulk_job_slots - sum(active.values())
+            
+            if free_slots > 0:
+                pending = await mongo_repository.get_dispatchable_jobs(
+                    JobPriority.BULK,
+                    stale_before,
+                    limit=settings.job_dispatch_scan_limit
+                )
+                
+                for job in fair_order(pending, active):
+                    if free_slots <= 0:
+                        break
+                    if await self._enqueue(job, stale_before):
+                        queued.append(job.id)
+                        free_slots -= 1
+            
+            if queued:
+                logger.info("Jobs encolados", count=len(queued), job_ids=queued)
+            
+            return queued
+    
+    def _stale_before(self, now: datetime = None) -> datetime:
+        """Los jobs encolados antes de este momento y aún PENDING se vuelven a encolar"""
+        return (now or datetime.utcnow()) - timedelta(seconds=settings.job_requeue_after)
+    
+    async def _enqueue(self, job: Job, stale_before: datetime) -> bool:
+        """Reclama el job en MongoDB y lo envía a la cola de su prioridad"""
+        if not await mongo_repository.claim_job_for_queue(job.id, stale_before):
+            # Otro proceso lo encoló antes
+            return False
+        
+        # Import diferido: las tareas importan este módulo
+        from app.workers.tasks.download_tasks import process_download_job
+        
+        queue = QUEUE_BY_PRIORITY[job.priority]
+        try:
+            process_download_job.apply_async(args=[job.id], queue=queue)
+        except Exception as e:
+            logger.error("Error encolando job", job_id=job.id, queue=queue, error=str(e))
+            await mongo_repository.release_job_claim(job.id)
+            return False
+        
+        logger.info("Job encolado para procesamiento", job_id=job.id, queue=queue, database=job.database, collection=job.collection)
+        return True
+
+
+# Instancia global por proceso
+job_scheduler = JobScheduler()
@@ -2,5 +2,6 @@
 Tareas de Celery
 """
 from .download_tasks import process_download_job, check_and_process_pending_jobs
+from .process_tasks import generate_document_derivatives
 
-__all__ = ["process_download_job", "check_and_process_pending_jobs"]
+__all__ = ["process_download_job", "check_and_process_pending_jobs", "generate_document_derivatives"]
@@ -2,15 +2,17 @@
 Tareas de Celery para descarga de imágenes
 """
 from typing import Dict, Any, Optional
-import httpx
+from datetime import datetime
 
 from app.workers.celery_app import celery_app, AsyncTask, run_async
-from app.core import logger
-from app.models.domain import Job, JobType, JobStatus
+from app.core import logger, settings
+from app.core.metrics import job_queue_wait
+from app.models.domain import Job, JobType
 from app.services.database import mongo_repository
 from app.services.download import DownloadService
-from app.services.storage import LocalStorageService
+from app.services.storage import get_storage_service
 from app.models.schemas import WebhookPayload
+from app.workers.scheduler import job_scheduler
 
 
 @celery_app.task(name="app.workers.tasks.download.process_download_job")
@@ -28,29 +30,36 @@ def process_download_job(job_id: str) -> Dict[str, Any]:
     
     async def _process():
         try:
-            # Obtener job
-            job = await mongo_repository.get_job(job_id)
+            # Reclamar el job (PENDING -> RUNNING): evita procesarlo dos veces
+            job = await mongo_repository.claim_job_for_processing(job_id)
             
-            if job.status != JobStatus.PENDING:
+            if job is None:
+                job = await mongo_repository.get_job(job_id)
                 logger.warning("Job no está en estado PENDING", job_id=job_id, status=job.status.value)
                 return {
                     "success": False,
                     "error": f"Job en estado {job.status.value}, se esperaba PENDING"
                 }
             
+            # Tiempo desde la creación hasta que un worker lo arranca
+            job_queue_wait.labels(priority=job.priority.value, type=job.type.value).observe(
+                max((datetime.utcnow() - job.created_at).total_seconds(), 0)
+            )
+            
             # Crear servicio de descarga
-            storage = LocalStorageService()
+            storage = get_storage_service()
             download_service = DownloadService(storage)
             
             # Procesar job
             await download_service.process_job(job)
             
-            # Enviar webhook si está configurado
-            await send_webhook_notification(job, "completed")
+            # Enviar webhook si está configurado (completed o cancelled)
+            await send_webhook_notification(job, job.status.value)
             
             return {
                 "success": True,
                 "job_id": job_id,
+                "status": job.status.value,
                 "processed_items": job.processed_items,
                 "failed_items": job.failed_items,
                 "duration": job.duration
@@ -72,6 +81,13 @@ def process_download_job(job_id: str) -> Dict[str, Any]:
                 "success": False,
                 "error": str(e)
             }
+            
+        finally:
+            # El hueco queda libre: arrancar el siguiente job bulk sin esperar al sondeo
+            try:
+                await job_scheduler.dispatch()
+            except Exception as e:
+                logger.warning("Error planificando jobs pendientes", error=str(e))
     
     return run_async(_process())
 
@@ -80,37 +96,22 @@ def process_download_job(job_id: str) -> Dict[str, Any]:
 def check_and_process_pending_jobs() -> Dict[str, Any]:
     """
     Verifica y procesa jobs pendientes
-    Esta tarea puede ser ejecutada periódicamente
+    Ya no está programada: el dispatcher (app/workers/dispatcher.py) reacciona a
+    los cambios en image_jobs. Se mantiene para lanzarla a mano si hiciera falta
     """
     logger.info("Verificando jobs pendientes")
     
     async def _check():
         try:
-            # Obtener jobs pendientes
-            pending_jobs = await mongo_repository.get_pending_jobs(limit=5)
-            
-            if not pending_jobs:
-                logger.info("No hay jobs pendientes")
-                return {
-                    "success": True,
-                    "pending_jobs": 0,
-                    "queued_jobs": []
-                }
+            # Encolar los jobs que quepan (interactivos olvidados y bulk en orden justo)
+            queued = await job_scheduler.dispatch()
             
-            # Encolar jobs para procesamiento
-            queued = []
-            for job in pending_jobs:
-                try:
-                    # Enviar a cola de Celery
-                    process_download_job.delay(job.id)
-                    queued.append(job.id)
-                    logger.info("Job encolado para procesamiento", job_id=job.id)
-                except Exception as e:
-                    logger.error("Error encolando job", job_id=job.id, error=str(e))
+            if not queued:
+                logger.info("No hay jobs pendientes que encolar")
             
             return {
                 "success": True,
-                "pending_jobs": len(pending_jobs),
+                "pending_jobs": len(queued),
                 "queued_jobs": queued
             }
             
@@ -125,9 +126,12 @@ def check_and_process_pending_jobs() -> Dict[str, Any]:
 
 
 async def send_webhook_notification(job: Job, event: str) -> None:
-    """Envía notificación webhook si está configurado"""
-    from app.core import settings
+    """
+    Guarda la notificación webhook si está configurado
     
+    La entrega (con reintentos y agrupación por endpoint) la hace el proceso
+    app/workers/webhooks.py; aquí solo se persiste el evento.
+    """
     if not settings.webhook_url:
         return
     
@@ -149,28 +153,8 @@ async def send_webhook_notification(job: Job, event: str) -> None:
             }
         )
         
-        # Enviar webhook
-        async with httpx.AsyncClient(timeout=10) as client:
-            response = await client.post(
-                settings.webhook_url,
-                json=payload.dict(),
-                headers={"Content-Type": "application/json"}
-            )
-            response.raise_for_status()
-            
-        logger.info("Webhook enviado exitosamente", event=event, job_id=job.id)
+        await mongo_repository.enqueue_webhook(settings.webhook_url, payload.model_dump(mode="json"))
+        logger.info("Webhook encolado", event=event, job_id=job.id)
         
     except Exception as e:
-        logger.error("Error enviando webhook", event=event, job_id=job.id, error=str(e))
-
-
-# Tareas periódicas (opcional)
-from celery.schedules import crontab
-
-celery_app.conf.beat_schedule = {
-    "check-pending-jobs": {
-        "task": "app.workers.tasks.download.check_and_process_pending_jobs",
-        "schedule": crontab(minute="*/5"),  # Cada 5 minutos
-        "options": {"queue": "downloads"}
-    },
-}
+        logger.error("Error encolando webhook", event=event, job_id=job.id, error=str(e))
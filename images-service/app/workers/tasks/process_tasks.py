@@ -0,0 +1,40 @@
+"""
+Tareas de Celery para procesamiento de imágenes (cola "processing")
+"""
+from typing import Dict, Any
+from pathlib import Path
+
+from app.workers.celery_app import celery_app, run_async
+from app.core import logger
+from app.services.processing import ProcessingService
+from app.services.storage import get_storage_service
+
+
+@celery_app.task(name="app.workers.tasks.process.generate_document_derivatives")
+def generate_document_derivatives(base_path: str) -> Dict[str, Any]:
+    """
+    Genera los derivados responsive (thumbnail, medium, WebP, AVIF) de un documento
+    
+    Args:
+        base_path: Directorio del documento con metadata.json y original/
+        
+    Returns:
+        Diccionario con el resultado del procesamiento
+    """
+    logger.info("Iniciando generación de derivados", path=base_path)
+    
+    async def _process():
+        try:
+            service = ProcessingService(get_storage_service())
+            summary = await service.process_document(Path(base_path))
+            return {"success": True, **summary}
+            
+        except Exception as e:
+            logger.error("Error generando derivados", path=base_path, error=str(e))
+            return {
+                "success": False,
+                "path": base_path,
+                "error": str(e)
+            }
+    
+    return run_async(_process())
@@ -0,0 +1,253 @@
+"""
+Entrega de webhooks con reintentos
+
+Los workers no envían los webhooks: guardan cada evento en la colección
+webhook_deliveries (mongo_repository.enqueue_webhook) y este proceso los
+entrega con un único cliente HTTP persistente (keep-alive entre entregas).
+
+- Cada WEBHOOK_BATCH_WINDOW segundos reclama las entregas pendientes y las
+  agrupa por endpoint; con WEBHOOK_BATCH_SIZE > 1 envía hasta ese número de
+  eventos por petición como {"events": [...]}.
+- Los fallos (red, 5xx, 408, 429) se reintentan con backoff exponencial
+  (respetando Retry-After) hasta WEBHOOK_MAX_ATTEMPTS; el estado de cada
+  reintento está en MongoDB, así que sobrevive a reinicios.
+- Los demás 4xx no se reintentan: la entrega queda como failed.
+
+Uso:
+    python -m app.workers.webhooks
+"""
+from typing import Dict, Any, List
+from datetime import datetime, timedelta
+import argparse
+import asyncio
+import math
+import random
+import signal
+import time
+
+import httpx
+
+from app.core import logger, settings, setup_logging
+from app.core.metrics import webhook_deliveries, webhook_delivery_latency, webhook_request_duration
+from app.services.database import mongo_repository
+from app.services.download.host_limiter import parse_retry_after
+
+
+# Respuestas que merece la pena reintentar
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+def retry_delay(attempts: int, retry_after: float = None) -> float:
+    """Espera antes del siguiente intento (backoff exponencial con jitter)"""
+    if retry_after is not None:
+        return retry_after
+    delay = settings.webhook_retry_base * (2 ** (attempts - 1)) * random.uniform(0.5, 1.5)
+    return min(delay, settings.webhook_retry_max)
+
+
+class WebhookDispatcher:
+    """Entrega las notificaciones de webhook guardadas en MongoDB"""
+    
+    def __init__(self, client: httpx.AsyncClient = None):
+        self._stop = asyncio.Event()
+        self._client = client
+        self._slots = asyncio.Semaphore(settings.webhook_concurrency)
+        self.delivered = 0
+    
+    def stop(self) -> None:
+        """Pide al dispatcher que termine"""
+        self._stop.set()
+    
+    async def run(self) -> None:
+        """Bucle principal: rondas de entrega cada WEBHOOK_BATCH_WINDOW segundos"""
+        await mongo_repository.connect()
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(settings.webhook_timeout),
+                limits=httpx.Limits(max_keepalive_connections=settings.webhook_concurrency, keepalive_expiry=60),
+                headers={"User-Agent": f"{settings.app_name}/{settings.app_version}"}
+            )
+        logger.info("Dispatcher de webhooks iniciado", batch_size=settings.webhook_batch_size)
+        
+        try:
+            while not self._stop.is_set():
+                try:
+                    claimed = await self.deliver_due()
+                except Exception as e:
+                    logger.error("Error entregando webhooks", error=str(e))
+                    claimed = 0
+                
+                # Con la ronda llena hay más pendientes: seguir sin esperar
+                if claimed < self._round_size:
+                    await self._sleep(settings.webhook_batch_window)
+        finally:
+            await self._client.aclose()
+            await mongo_repository.disconnect()
+            logger.info("Dispatcher de webhooks detenido", delivered=self.delivered)
+    
+    @property
+    def _round_size(self) -> int:
+        """Entregas que se reclaman por ronda"""
+        return settings.webhook_batch_size * settings.webhook_concurrency * 4
+    
+    @property
+    def _lease_seconds(self) -> float:
+        """
+        Reserva que cubre la ronda entera
+        
+        En el peor caso cada entrega va a un endpoint distinto (un lote por
+        entrega) y salen de webhook_concurrency en webhook_concurrency; cada
+        petición dura como mucho WEBHOOK_TIMEOUT. Se suma un margen para
+        guardar los resultados.
+        """
+        waves = math.ceil(self._round_size / settings.webhook_concurrency)
+        return (waves + 1) * settings.webhook_timeout
+    
+    async def deliver_due(self) -> int:
+        """
+        Entrega todo lo pendiente que toca ya
+        
+        Returns:
+            Número de entregas reclamadas
+        """
+        deliveries = await mongo_repository.claim_webhook_deliveries(
+            self._round_size,
+            lease_seconds=self._lease_seconds
+        )
+        if not deliveries:
+            return 0
+        
+        # Por endpoint, en lotes de WEBHOOK_BATCH_SIZE
+        by_url: Dict[str, List[Dict[str, Any]]] = {}
+        for delivery in deliveries:
+            by_url.setdefault(delivery["url"], []).append(delivery)
+        
+        batches = [
+            (url, pending[i:i + settings.webhook_batch_size])
+            for url, pending in by_url.items()
+            for i in range(0, len(pending), settings.webhook_batch_size)
+        ]
+        results = await asyncio.gather(*(self._deliver(url, batch) for url, batch in batches))
+        
+        updates: Dict[Any, Dict[str, Any]] = {}
+        for result in results:
+            updates.update(result)
+        
+        saved = await mongo_repository.update_webhook_deliveries(updates, claim=deliveries[0]["claim"])
+        if saved < len(updates):
+            # La reserva caducó: otro dispatcher las reclamó y su estado manda
+            logger.warning("Entregas de webhook reclamadas por otro proceso", lost=len(updates) - saved)
+        
+        return len(deliveries)
+    
+    async def _deliver(self, url: str, batch: List[Dict[str, Any]]) -> Dict[Any, Dict[str, Any]]:
+        """
+        Envía un lote a un endpoint
+        
+        Returns:
+            Campos a guardar por entrega
+        """
+        if len(batch) == 1:
+            body = batch[0]["payload"]
+        else:
+            body = {"events": [delivery["payload"] for delivery in batch]}
+        
+        error = None
+        retryable = True
+        retry_after = None
+        
+        async with self._slots:
+            started = time.perf_counter()
+            try:
+                # Tope total por petición (el timeout de httpx es por operación):
+                # la reserva de la ronda cuenta con él
+                response = await asyncio.wait_for(
+                    self._client.post(
+                        url,
+                        json=body,
+                        headers={"X-Webhook-Deliveries": str(len(batch))}
+                    ),
+                    timeout=settings.webhook_timeout
+                )
+                if response.is_success:
+                    outcome = "success"
+                else:
+                    outcome = f"http_{response.status_code // 100}xx"
+                    error = f"HTTP {response.status_code}: {response.text[:200]}"
+                    retryable = response.status_code in RETRYABLE_STATUS_CODES
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    
+            except asyncio.TimeoutError:
+                outcome = "error"
+                error = f"Timeout: sin respuesta en {settings.webhook_timeout}s"
+                
+            except httpx.HTTPError as e:
+                outcome = "error"
+                error = f"{type(e).__name__}: {e}"
+            
+            webhook_request_duration.labels(outcome=outcome).observe(time.perf_counter() - started)
+        
+        now = datetime.utcnow()
+        updates = {}
+        for delivery in batch:
+            attempts = delivery["attempts"] + 1
+            
+            if error is None:
+                webhook_deliveries.labels(result="delivered").inc()
+                webhook_delivery_latency.observe(max((now - delivery["created_at"]).total_seconds(), 0))
+                updates[delivery["_id"]] = {"status": "delivered", "attempts": attempts, "finished_at": now}
+                self.delivered += 1
+                
+            elif retryable and attempts < settings.webhook_max_attempts:
+                webhook_deliveries.labels(result="retry").inc()
+                updates[delivery["_id"]] = {
+                    "status": "pending",
+                    "attempts": attempts,
+                    "last_error": error,
+                    "next_attempt_at": now + timedelta(seconds=retry_delay(attempts, retry_after))
+                }
+                
+            else:
+                webhook_deliveries.labels(result="failed").inc()
+                updates[delivery["_id"]] = {
+                    "status": "failed",
+                    "attempts": attempts,
+                    "last_error": error,
+                    "finished_at": now
+                }
+        
+        if error is None:
+            logger.debug("Webhooks entregados", url=url, events=len(batch))
+        else:
+            logger.warning("Error entregando webhooks", url=url, events=len(batch), error=error, retryable=retryable)
+        
+        return updates
+    
+    async def _sleep(self, seconds: float) -> None:
+        """Espera interrumpible por stop()"""
+        try:
+            await asyncio.wait_for(self._stop.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+
+def main() -> None:
+    """Punto de entrada de línea de comandos"""
+    parser = argparse.ArgumentParser(description="Entrega de webhooks")
+    parser.add_argument("--log-level", default="INFO" if settings.is_production else "DEBUG")
+    args = parser.parse_args()
+    
+    setup_logging(log_level=args.log_level)
+    
+    async def _run() -> None:
+        dispatcher = WebhookDispatcher()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, dispatcher.stop)
+        await dispatcher.run()
+    
+    asyncio.run(_run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark de generación de derivados (imágenes/segundo por núcleo)
+
+Genera imágenes JPEG sintéticas y mide el throughput de generate_derivatives
+en un ProcessPoolExecutor con distinto número de procesos.
+
+Uso:
+    python benchmarks/bench_derivatives.py --images 48 --width 2048 --height 1536
+"""
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import multiprocessing
+import argparse
+import random
+import time
+import sys
+import io
+import os
+
+# Añadir el directorio raíz al path para importar app
+root_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(root_dir))
+
+from PIL import Image, ImageDraw
+
+from app.services.processing.image_processor import generate_derivatives, is_format_supported
+
+
+def make_synthetic_jpeg(width: int, height: int, seed: int) -> bytes:
+    """Crea un JPEG sintético con degradados y formas (comprime como una foto real)"""
+    rnd = random.Random(seed)
+    img = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    for _ in range(60):
+        x0, y0 = rnd.randrange(width), rnd.randrange(height)
+        x1, y1 = x0 + rnd.randrange(50, 600), y0 + rnd.randrange(50, 400)
+        draw.ellipse((x0, y0, x1, y1), fill=(rnd.randrange(256), rnd.randrange(256), rnd.randrange(256)))
+    noise = Image.effect_noise((width, height), 24).convert("RGB")
+    img = Image.blend(img, noise, 0.15)
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def build_specs(formats):
+    """Mismos derivados que la configuración por defecto del servicio"""
+    specs = []
+    for name, max_side in (("thumbnail", 320), ("medium", 1024)):
+        for fmt in ["jpeg", *formats]:
+            specs.append((name, fmt, max_side))
+    for fmt in formats:
+        specs.append((fmt, fmt, None))
+    return specs
+
+
+def run(images, specs, qualities, workers: int) -> float:
+    """Procesa todas las imágenes y devuelve imágenes/segundo"""
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        # Calentar los procesos del pool antes de medir
+        list(pool.map(generate_derivatives, images[:workers], [f"w{i}.jpg" for i in range(workers)],
+                      [specs] * workers, [qualities] * workers))
+
+        start = time.perf_counter()
+        list(pool.map(generate_derivatives, images, [f"img_{i:03d}.jpg" for i in range(len(images))],
+                      [specs] * len(images), [qualities] * len(images)))
+        elapsed = time.perf_counter() - start
+
+    return len(images) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=48)
+    parser.add_argument("--width", type=int, default=2048)
+    parser.add_argument("--height", type=int, default=1536)
+    parser.add_argument("--formats", default="webp,avif")
+    parser.add_argument("--workers", default=None, help="Lista de procesos a probar, ej: 1,2,4")
+    args = parser.parse_args()
+
+    formats = [f for f in args.formats.split(",") if f and is_format_supported(f)]
+    specs = build_specs(formats)
+    qualities = {"jpeg": 85, "webp": 85, "avif": 60}
+
+    cpu = os.cpu_count() or 1
+    workers_list = [int(w) for w in args.workers.split(",")] if args.workers else sorted({1, max(1, cpu // 2), cpu})
+
+    print(f"Generando {args.images} imágenes {args.width}x{args.height}...")
+    images = [make_synthetic_jpeg(args.width, args.height, i) for i in range(args.images)]
+    avg_mb = sum(len(i) for i in images) / len(images) / (1024 * 1024)
+    print(f"Tamaño medio original: {avg_mb:.2f} MB | derivados por imagen: {len(specs)} | formatos: jpeg,{','.join(formats)}")
+
+    for workers in workers_list:
+        rate = run(images, specs, qualities, workers)
+        print(f"procesos={workers:2d}  {rate:7.2f} imágenes/s  {rate / workers:6.2f} imágenes/s/núcleo")
+
+
+if __name__ == "__main__":
+    main()
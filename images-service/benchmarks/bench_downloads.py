@@ -0,0 +1,350 @@
+"""
+Benchmark y prueba de carga (soak) de descargas de extremo a extremo
+
+Arranca el CDN sintético (benchmarks/fake_cdn.py), siembra MongoDB con
+hoteles sintéticos que apuntan a él y ejecuta los mismos caminos que en
+producción sobre un STORAGE_PATH temporal:
+
+- collection: job DOWNLOAD_COLLECTION con DownloadService.process_job
+- batch:      job DOWNLOAD_BATCH filtrando por ciudad
+- api:        job DOWNLOAD_API_URL leyendo la API del CDN en streaming
+- simple:     descarga simple (run_download), sin jobs ni MongoDB
+
+Por escenario informa de imágenes/segundo, MB/s, pico de memoria (RSS) y
+tiempo de CPU por imagen. Con --soak-minutes repite los escenarios durante
+ese tiempo e informa de la deriva de memoria entre rondas.
+
+Tras cada escenario ejecuta el recolector de basura en dry-run sin periodo
+de gracia: justo después de una descarga no debe haber nada que borrar (en
+particular, los metadata.json planos de la descarga simple). Si encuentra
+algo lo muestra y el benchmark termina con error (--no-gc-check lo omite).
+
+Los escenarios collection, batch y api y la comprobación del recolector
+necesitan un MongoDB accesible en --mongodb-uri (usan la base de datos
+images_bench y borran sus jobs al final).
+
+Uso:
+    python benchmarks/bench_downloads.py --documents 200 --images 10
+    python benchmarks/bench_downloads.py --scenarios simple --latency-ms 80 --throttle-rate 0.02 --no-gc-check
+    python benchmarks/bench_downloads.py --soak-minutes 30 --error-rate 0.01
+"""
+from pathlib import Path
+from uuid import uuid4
+import subprocess
+import threading
+import argparse
+import tempfile
+import asyncio
+import shutil
+import socket
+import time
+import sys
+import os
+
+import httpx
+import psutil
+
+
+# Directorio raíz del servicio
+root_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(root_dir))
+
+BENCH_DATABASE = "images_bench"
+BENCH_COLLECTION = "hotels"
+SCENARIOS = ("collection", "batch", "api", "simple")
+
+
+def free_port() -> int:
+    """Obtiene un puerto TCP libre"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_cdn(port: int, args: argparse.Namespace) -> subprocess.Popen:
+    """Lanza el CDN sintético y espera a que responda"""
+    process = subprocess.Popen(
+        [
+            sys.executable, str(root_dir / "benchmarks" / "fake_cdn.py"),
+            "--port", str(port),
+            "--pool", str(args.pool),
+            "--size-mean-kb", str(args.size_mean_kb),
+            "--size-sigma", str(args.size_sigma),
+            "--latency-ms", str(args.latency_ms),
+            "--jitter-ms", str(args.jitter_ms),
+            "--error-rate", str(args.error_rate),
+            "--throttle-rate", str(args.throttle_rate),
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/stats", timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    
+    process.kill()
+    raise RuntimeError("El CDN sintético no arrancó a tiempo")
+
+
+def seed_mongo(uri: str, cdn_url: str, documents: int, images: int) -> None:
+    """Crea la colección de hoteles sintéticos apuntando al CDN"""
+    from pymongo import MongoClient
+    from fake_cdn import make_hotel
+    
+    client = MongoClient(uri, serverSelectionTimeoutMS=5000)
+    collection = client[BENCH_DATABASE][BENCH_COLLECTION]
+    collection.drop()
+    batch = []
+    for i in range(documents):
+        hotel = make_hotel(i, images, cdn_url, image_objects=True)
+        hotel.pop("id")
+        batch.append(hotel)
+        if len(batch) == 1000:
+            collection.insert_many(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch)
+    collection.create_index("city")
+    client.close()
+
+
+def cleanup_mongo(uri: str, job_ids: list) -> None:
+    """Borra la base de datos del benchmark y sus jobs"""
+    from bson import ObjectId
+    from pymongo import MongoClient
+    from app.core import settings
+    
+    client = MongoClient(uri, serverSelectionTimeoutMS=5000)
+    client.drop_database(BENCH_DATABASE)
+    if job_ids:
+        client[settings.mongodb_database]["image_jobs"].delete_many({"_id": {"$in": [ObjectId(i) for i in job_ids]}})
+    client.close()
+
+
+class ResourceSampler:
+    """Muestrea RSS y CPU del proceso en un hilo mientras dura un escenario"""
+    
+    def __init__(self, interval: float = 0.1):
+        self.process = psutil.Process()
+        self.interval = interval
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.peak_rss = max(self.peak_rss, self.process.memory_info().rss)
+            self._stop.wait(self.interval)
+    
+    def __enter__(self) -> "ResourceSampler":
+        cpu = self.process.cpu_times()
+        self._cpu_start = cpu.user + cpu.system
+        self._wall_start = time.perf_counter()
+        self._thread.start()
+        return self
+    
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        cpu = self.process.cpu_times()
+        self.cpu_seconds = cpu.user + cpu.system - self._cpu_start
+        self.wall_seconds = time.perf_counter() - self._wall_start
+        self.end_rss = self.process.memory_info().rss
+        self.peak_rss = max(self.peak_rss, self.end_rss)
+
+
+def count_downloaded(path: Path) -> tuple:
+    """Imágenes originales guardadas y sus bytes"""
+    images = 0
+    size = 0
+    for image in path.glob("**/original/*"):
+        if image.is_file():
+            images += 1
+            size += image.stat().st_size
+    return images, size
+
+
+async def run_job(job_type, cdn_url: str, args: argparse.Namespace) -> str:
+    """Crea un job en MongoDB y lo procesa en este proceso como lo haría el worker"""
+    from app.models.domain.job import Job, JobStatus
+    from app.services.database import mongo_repository
+    from app.services.download import DownloadService
+    
+    kwargs = {"database": BENCH_DATABASE, "collection": BENCH_COLLECTION, "metadata": {"source": "benchmark"}}
+    if job_type.value == "download_batch":
+        kwargs["filter_query"] = {"city": "Madrid"}
+    elif job_type.value == "download_api_url":
+        kwargs["collection"] = "hotels_api"
+        kwargs["metadata"]["api_url"] = f"{cdn_url}/api/hotels?count={args.documents}&images={args.images}"
+    
+    job = Job(id=str(uuid4()), type=job_type, status=JobStatus.PENDING, **kwargs)
+    job = await mongo_repository.create_job(job)
+    job = await mongo_repository.claim_job_for_processing(job.id)
+    await DownloadService().process_job(job)
+    return job.id
+
+
+async def run_simple(cdn_url: str, args: argparse.Namespace) -> None:
+    """Descarga simple de la API del CDN (el mismo generador que usa el endpoint)"""
+    from app.api.v1.endpoints.download_simple import run_download
+    from app.services.download import shared_http_client
+    from app.services.download.api_source import stream_api_documents
+    
+    api_url = f"{cdn_url}/api/hotels?count={args.documents}&images={args.images}"
+    documents = stream_api_documents(shared_http_client.get(), api_url)
+    async for _ in run_download(documents, api_url, BENCH_DATABASE, "hotels_simple", "bench-simple"):
+        pass
+
+
+async def run_scenario(name: str, cdn_url: str, storage: Path, args: argparse.Namespace, job_ids: list) -> dict:
+    """Ejecuta un escenario y mide su throughput y consumo"""
+    from app.models.domain.job import JobType
+    
+    shutil.rmtree(storage / BENCH_DATABASE, ignore_errors=True)
+    
+    with ResourceSampler() as sampler:
+        if name == "simple":
+            await run_simple(cdn_url, args)
+        else:
+            job_type = {
+                "collection": JobType.DOWNLOAD_COLLECTION,
+                "batch": JobType.DOWNLOAD_BATCH,
+                "api": JobType.DOWNLOAD_API_URL,
+            }[name]
+            job_ids.append(await run_job(job_type, cdn_url, args))
+    
+    images, size = count_downloaded(storage / BENCH_DATABASE)
+    return {
+        "scenario": name,
+        "gc_removed": await gc_check() if args.gc_check else {},
+        "images": images,
+        "mb": size / (1024 * 1024),
+        "seconds": sampler.wall_seconds,
+        "images_per_second": images / sampler.wall_seconds if sampler.wall_seconds else 0,
+        "mb_per_second": size / (1024 * 1024) / sampler.wall_seconds if sampler.wall_seconds else 0,
+        "cpu_ms_per_image": sampler.cpu_seconds * 1000 / images if images else 0,
+        "peak_rss_mb": sampler.peak_rss / (1024 * 1024),
+        "end_rss_mb": sampler.end_rss / (1024 * 1024),
+    }
+
+
+async def gc_check() -> dict:
+    """
+    Recolector de basura en dry-run sin periodo de gracia
+    
+    Returns:
+        Lo que borraría por tipo (vacío si todo lo descargado es reconocido)
+    """
+    from app.services.storage.garbage_collector import StorageGarbageCollector
+    
+    report = await StorageGarbageCollector(grace_period=0).run(dry_run=True)
+    return report["removed"]
+
+
+def print_result(result: dict) -> None:
+    print(
+        f"{result['scenario']:<11} {result['images']:>7} {result['mb']:>9.1f} {result['seconds']:>8.1f} "
+        f"{result['images_per_second']:>9.1f} {result['mb_per_second']:>8.2f} "
+        f"{result['cpu_ms_per_image']:>9.2f} {result['peak_rss_mb']:>9.1f}",
+        flush=True
+    )
+    if result["gc_removed"]:
+        print(f"{'':<11} ERROR: el recolector borraría {result['gc_removed']}", flush=True)
+
+
+async def run(args: argparse.Namespace, cdn_url: str, storage: Path) -> None:
+    from app.services.database import mongo_repository
+    from app.services.download import shared_http_client
+    
+    uses_mongo = args.gc_check or any(name != "simple" for name in args.scenarios)
+    job_ids = []
+    if uses_mongo:
+        await mongo_repository.connect()
+    
+    print(f"{'escenario':<11} {'imágenes':>7} {'MB':>9} {'seg':>8} {'img/s':>9} {'MB/s':>8} {'CPU ms/img':>9} {'RSS MB':>9}")
+    rounds = []
+    deadline = time.monotonic() + args.soak_minutes * 60
+    try:
+        while True:
+            for name in args.scenarios:
+                result = await run_scenario(name, cdn_url, storage, args, job_ids)
+                print_result(result)
+                rounds.append(result)
+            
+            if time.monotonic() >= deadline:
+                break
+                
+    finally:
+        await shared_http_client.aclose()
+        if uses_mongo:
+            await mongo_repository.disconnect()
+            cleanup_mongo(args.mongodb_uri, job_ids)
+    
+    if args.soak_minutes:
+        # Deriva de memoria: RSS al final de la última ronda frente a la primera
+        first = rounds[len(args.scenarios) - 1]["end_rss_mb"]
+        last = rounds[-1]["end_rss_mb"]
+        total_rounds = len(rounds) // len(args.scenarios)
+        print(f"\nSoak: {total_rounds} rondas, RSS {first:.1f} MB -> {last:.1f} MB ({last - first:+.1f} MB)")
+    
+    if any(result["gc_removed"] for result in rounds):
+        raise SystemExit("El recolector de basura borraría archivos recién descargados")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--documents", type=int, default=100)
+    parser.add_argument("--images", type=int, default=10, help="Imágenes por documento")
+    parser.add_argument("--mongodb-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--soak-minutes", type=float, default=0)
+    parser.add_argument("--no-gc-check", dest="gc_check", action="store_false", help="No comprobar el recolector de basura")
+    parser.add_argument("--pool", type=int, default=64)
+    parser.add_argument("--size-mean-kb", type=float, default=250)
+    parser.add_argument("--size-sigma", type=float, default=0.5)
+    parser.add_argument("--latency-ms", type=float, default=30)
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    
+    sys.path.insert(0, str(root_dir / "benchmarks"))
+    port = free_port()
+    cdn_url = f"http://127.0.0.1:{port}"
+    cdn = start_cdn(port, args)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = Path(tmp)
+        # Antes de importar app: la configuración se lee al importar
+        os.environ["STORAGE_PATH"] = str(storage)
+        os.environ["MONGODB_URI"] = args.mongodb_uri
+        os.environ["ENABLE_DERIVATIVES"] = "false"
+        os.environ.setdefault("LOG_LEVEL", "ERROR")
+        
+        from app.core import setup_logging
+        setup_logging(log_level=os.environ["LOG_LEVEL"])
+        
+        try:
+            if any(name != "simple" for name in args.scenarios):
+                seed_mongo(args.mongodb_uri, cdn_url, args.documents, args.images)
+            
+            print(
+                f"{args.documents} documentos x {args.images} imágenes, latencia {args.latency_ms} ms, "
+                f"errores {args.error_rate:.1%}, 429 {args.throttle_rate:.1%}\n"
+            )
+            asyncio.run(run(args, cdn_url, storage))
+            
+            stats = httpx.get(f"{cdn_url}/stats").json()
+            print(f"\nCDN: {stats['images']} imágenes servidas, {stats['errors']} errores, {stats['throttled']} 429")
+        finally:
+            cdn.terminate()
+            cdn.wait()
+
+
+if __name__ == "__main__":
+    main()
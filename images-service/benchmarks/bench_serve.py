@@ -0,0 +1,149 @@
+"""
+Benchmark del servido de imágenes (peticiones/segundo)
+
+Arranca uvicorn sobre un STORAGE_PATH temporal con una imagen pequeña y otra
+grande y mide peticiones/segundo para: descarga completa (200), revalidación
+con If-None-Match (304) y petición de rango (206).
+
+Uso:
+    python benchmarks/bench_serve.py --concurrency 32 --duration 10
+    python benchmarks/bench_serve.py --url http://localhost:8001 --small db/col/doc/original/img_001.jpg
+"""
+from pathlib import Path
+import subprocess
+import argparse
+import tempfile
+import asyncio
+import socket
+import time
+import sys
+import os
+
+import httpx
+
+
+# Directorio raíz del servicio (cwd de uvicorn)
+root_dir = Path(__file__).parent.parent
+
+SMALL_SIZE = 20 * 1024
+LARGE_SIZE = 5 * 1024 * 1024
+
+
+def free_port() -> int:
+    """Obtiene un puerto TCP libre"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def prepare_storage(storage: Path) -> dict:
+    """Crea las imágenes de prueba y devuelve sus rutas relativas"""
+    paths = {}
+    for name, size in (("small", SMALL_SIZE), ("large", LARGE_SIZE)):
+        relative = f"bench_db/bench_col/doc/original/{name}.jpg"
+        target = storage / relative
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(os.urandom(size))
+        paths[name] = relative
+    return paths
+
+
+def start_server(storage: Path, port: int) -> subprocess.Popen:
+    """Lanza uvicorn con el servicio apuntando al almacenamiento temporal"""
+    env = {
+        **os.environ,
+        "STORAGE_PATH": str(storage),
+        "DERIVATIVE_CACHE_PATH": str(storage / ".variants"),
+        "ENVIRONMENT": "production",
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=str(root_dir),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/v1/images/", timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+
+    process.kill()
+    raise RuntimeError("El servidor no arrancó a tiempo")
+
+
+async def load(client: httpx.AsyncClient, url: str, headers: dict, concurrency: int, duration: float) -> tuple:
+    """Lanza peticiones en bucle durante `duration` segundos"""
+    deadline = time.perf_counter() + duration
+    counts = {"requests": 0, "bytes": 0, "errors": 0}
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            try:
+                response = await client.get(url, headers=headers)
+                counts["requests"] += 1
+                counts["bytes"] += len(response.content)
+            except httpx.HTTPError:
+                counts["errors"] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return counts["requests"] / elapsed, counts["bytes"] / elapsed, counts["errors"]
+
+
+async def run(base_url: str, paths: dict, concurrency: int, duration: float) -> None:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        for name, relative in paths.items():
+            url = f"{base_url}/api/v1/images/{relative}"
+            first = await client.get(url)
+            first.raise_for_status()
+            etag = first.headers.get("etag", "")
+
+            scenarios = [
+                ("200 completo", {}),
+                ("304 If-None-Match", {"If-None-Match": etag}),
+                ("206 Range 64KB", {"Range": "bytes=0-65535"}),
+            ]
+            for label, headers in scenarios:
+                rate, throughput, errors = await load(client, url, headers, concurrency, duration)
+                print(
+                    f"{name:5s} ({len(first.content) / 1024:8.1f} KB)  {label:18s}"
+                    f"  {rate:8.1f} req/s  {throughput / (1024 * 1024):8.1f} MB/s  errores={errors}"
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--url", default=None, help="Servidor ya arrancado (si no, se lanza uno local)")
+    parser.add_argument("--small", default=None, help="Ruta relativa de una imagen pequeña (con --url)")
+    parser.add_argument("--large", default=None, help="Ruta relativa de una imagen grande (con --url)")
+    args = parser.parse_args()
+
+    if args.url:
+        paths = {name: path for name, path in (("small", args.small), ("large", args.large)) if path}
+        asyncio.run(run(args.url.rstrip("/"), paths, args.concurrency, args.duration))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = Path(tmp)
+        paths = prepare_storage(storage)
+        port = free_port()
+        process = start_server(storage, port)
+        try:
+            print(f"concurrencia={args.concurrency} duración={args.duration}s por escenario")
+            asyncio.run(run(f"http://127.0.0.1:{port}", paths, args.concurrency, args.duration))
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+CDN local de imágenes sintéticas para benchmarks y pruebas de carga
+
+Sirve JPEGs generados al arrancar con latencia, tamaños, errores y 429
+configurables, para medir el servicio sin depender del CDN de Booking.
+
+Rutas:
+    GET /images/{nombre}.jpg     Imagen (el nombre elige una del pool de forma estable)
+    GET /api/hotels?count=N&images=M&offset=K
+                                 Documentos de hoteles sintéticos (como la API externa)
+    GET /stats                   Peticiones, bytes, errores y 429 servidos
+
+Uso:
+    python benchmarks/fake_cdn.py --port 8900 --latency-ms 50 --error-rate 0.01 --throttle-rate 0.02
+"""
+from urllib.parse import parse_qs
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import io
+
+from PIL import Image, ImageDraw
+
+
+def make_jpeg(width: int, height: int, seed: int, quality: int = 85) -> bytes:
+    """JPEG sintético con formas y ruido (comprime como una foto real)"""
+    rnd = random.Random(seed)
+    img = Image.new("RGB", (width, height), tuple(rnd.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(40):
+        x0, y0 = rnd.randrange(width), rnd.randrange(height)
+        x1, y1 = x0 + rnd.randrange(width // 8 + 1, width // 2 + 2), y0 + rnd.randrange(height // 8 + 1, height // 2 + 2)
+        draw.ellipse((x0, y0, x1, y1), fill=tuple(rnd.randrange(256) for _ in range(3)))
+    noise = Image.effect_noise((width, height), 32).convert("RGB")
+    img = Image.blend(img, noise, 0.2)
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def build_pool(count: int, size_mean_kb: float, size_sigma: float, seed: int = 0) -> list:
+    """
+    Genera el pool de imágenes con tamaños de distribución log-normal
+    
+    La resolución de cada imagen se elige a partir de los bytes por píxel de
+    una imagen de calibración, así que los tamaños reales se aproximan a la
+    distribución pedida.
+    """
+    rnd = random.Random(seed)
+    calibration = make_jpeg(800, 600, seed)
+    bytes_per_pixel = len(calibration) / (800 * 600)
+    
+    # Media de la log-normal = exp(mu + sigma^2 / 2)
+    mu = math.log(size_mean_kb * 1024) - size_sigma ** 2 / 2
+    pool = []
+    for i in range(count):
+        target = rnd.lognormvariate(mu, size_sigma)
+        pixels = max(target / bytes_per_pixel, 64 * 48)
+        width = max(64, min(4096, int(math.sqrt(pixels * 4 / 3))))
+        height = max(48, min(3072, int(width * 3 / 4)))
+        pool.append(make_jpeg(width, height, seed + i + 1))
+    return pool
+
+
+class FakeCDN:
+    """Aplicación ASGI del CDN sintético"""
+    
+    def __init__(
+        self,
+        pool: list,
+        latency_ms: float = 0,
+        jitter_ms: float = 0,
+        error_rate: float = 0,
+        throttle_rate: float = 0,
+        retry_after: int = 1,
+        seed: int = 0
+    ):
+        self.pool = pool
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.stats = {"requests": 0, "images": 0, "bytes": 0, "errors": 0, "throttled": 0, "api_documents": 0}
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        
+        path = scope["path"]
+        query = parse_qs(scope.get("query_string", b"").decode())
+        self.stats["requests"] += 1
+        
+        if path.startswith("/images/"):
+            await self._image(path, send)
+        elif path == "/api/hotels":
+            await self._hotels(scope, query, send)
+        elif path == "/stats":
+            await self._respond(send, 200, json.dumps(self.stats).encode(), "application/json")
+        else:
+            await self._respond(send, 404, b"not found", "text/plain")
+    
+    async def _image(self, path: str, send) -> None:
+        delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        
+        roll = self.random.random()
+        if roll < self.throttle_rate:
+            self.stats["throttled"] += 1
+            await self._respond(send, 429, b"slow down", "text/plain", [(b"retry-after", str(self.retry_after).encode())])
+            return
+        if roll < self.throttle_rate + self.error_rate:
+            self.stats["errors"] += 1
+            await self._respond(send, 503, b"unavailable", "text/plain")
+            return
+        
+        # Misma imagen para el mismo nombre en todas las peticiones
+        index = int(hashlib.md5(path.encode()).hexdigest(), 16) % len(self.pool)
+        body = self.pool[index]
+        self.stats["images"] += 1
+        self.stats["bytes"] += len(body)
+        await self._respond(send, 200, body, "image/jpeg", [(b"cache-control", b"max-age=31536000")])
+    
+    async def _hotels(self, scope, query: dict, send) -> None:
+        count = int(query.get("count", ["100"])[0])
+        images = int(query.get("images", ["10"])[0])
+        offset = int(query.get("offset", ["0"])[0])
+        base_url = hotel_base_url(scope)
+        
+        # Respuesta en trozos: el servicio la parsea en streaming
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/json")]
+        })
+        await send({"type": "http.response.body", "body": b"[", "more_body": True})
+        for i in range(offset, offset + count):
+            document = make_hotel(i, images, base_url)
+            chunk = (b"," if i > offset else b"") + json.dumps(document).encode()
+            self.stats["api_documents"] += 1
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b"]"})
+    
+    async def _respond(self, send, status: int, body: bytes, content_type: str, headers: list = None) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", content_type.encode()),
+                (b"content-length", str(len(body)).encode()),
+                *(headers or [])
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def hotel_base_url(scope) -> str:
+    """URL base del CDN tal y como la ve el cliente"""
+    host, port = scope.get("server") or ("127.0.0.1", 80)
+    return f"http://{host}:{port}"
+
+
+CITIES = ("Madrid", "Sevilla", "Valencia", "Barcelona")
+
+
+def make_hotel(index: int, images: int, base_url: str, image_objects: bool = False) -> dict:
+    """
+    Documento de hotel sintético
+    
+    Con image_objects las imágenes van como [{"image_url": ...}] (documentos
+    del scraper en MongoDB); si no, como lista de URLs (API externa).
+    """
+    urls = [f"{base_url}/images/h{index:06d}_{n:02d}.jpg" for n in range(images)]
+    return {
+        "id": f"bench-{index:06d}",
+        "nombre_alojamiento": f"Hotel Benchmark {index:06d}",
+        "city": CITIES[index % len(CITIES)],
+        "images": [{"image_url": url} for url in urls] if image_objects else urls
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--pool", type=int, default=64, help="Imágenes distintas a generar")
+    parser.add_argument("--size-mean-kb", type=float, default=250)
+    parser.add_argument("--size-sigma", type=float, default=0.5, help="Dispersión log-normal de los tamaños")
+    parser.add_argument("--latency-ms", type=float, default=30)
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fracción de respuestas 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fracción de respuestas 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+    
+    import uvicorn
+    
+    pool = build_pool(args.pool, args.size_mean_kb, args.size_sigma)
+    mean_kb = sum(len(image) for image in pool) / len(pool) / 1024
+    print(f"Pool de {len(pool)} imágenes, tamaño medio {mean_kb:.1f} KB", flush=True)
+    
+    app = FakeCDN(
+        pool,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,18 @@ Configuración centralizada del microservicio de imágenes
 """
 from pydantic_settings import BaseSettings
 from pydantic import Field, validator
-from typing import List, Optional
+from typing import List, Optional, Dict, Literal
 import os
 import re
 from pathlib import Path
 
 
+# Derivados que ImageMetadata puede registrar (campos de ProcessedImages en
+# app/models/domain/image.py): tamaños redimensionados y formatos a tamaño completo
+DERIVATIVE_SIZE_NAMES = ("thumbnail", "optimized", "medium")
+DERIVATIVE_FORMAT_NAMES = ("webp", "avif")
+
+
 def normalize_project_name(project_name: str) -> str:
     """
     Normaliza el nombre del proyecto para usar como prefijo de colecciones
@@ -74,23 +80,127 @@ class Settings(BaseSettings):
     
     # Storage
     storage_path: Path = Field(default=Path("/images"), env="STORAGE_PATH")
-    storage_type: str = Field(default="local", env="STORAGE_TYPE")  # local o s3
+    storage_type: Literal["local", "s3"] = Field(default="local", env="STORAGE_TYPE")
+    manifest_index_path: Optional[Path] = Field(default=None, env="MANIFEST_INDEX_PATH")  # None = STORAGE_PATH/.manifest.sqlite
+    listing_page_size: int = Field(default=100, env="LISTING_PAGE_SIZE")
+    listing_max_page_size: int = Field(default=1000, env="LISTING_MAX_PAGE_SIZE")
+    # Recolector de basura (python -m app.services.storage.garbage_collector): solo
+    # borra lo que lleva más de STORAGE_GC_GRACE_PERIOD segundos sin modificarse
+    storage_gc_interval: int = Field(default=21600, env="STORAGE_GC_INTERVAL")  # segundos entre pasadas
+    storage_gc_grace_period: int = Field(default=86400, env="STORAGE_GC_GRACE_PERIOD")
+    storage_gc_batch_size: int = Field(default=200, env="STORAGE_GC_BATCH_SIZE")  # borrados por lote
+    storage_gc_batch_pause: float = Field(default=1.0, env="STORAGE_GC_BATCH_PAUSE")  # pausa entre lotes
+    
+    # Almacenamiento S3 compatible (STORAGE_TYPE=s3: AWS, MinIO, R2...)
+    s3_bucket: Optional[str] = Field(default=None, env="S3_BUCKET")
+    s3_prefix: str = Field(default="", env="S3_PREFIX")
+    s3_endpoint_url: Optional[str] = Field(default=None, env="S3_ENDPOINT_URL")
+    s3_public_endpoint_url: Optional[str] = Field(default=None, env="S3_PUBLIC_ENDPOINT_URL")  # para URLs prefirmadas
+    s3_region: str = Field(default="us-east-1", env="S3_REGION")
+    s3_access_key: Optional[str] = Field(default=None, env="S3_ACCESS_KEY")
+    s3_secret_key: Optional[str] = Field(default=None, env="S3_SECRET_KEY")
+    s3_multipart_threshold_mb: int = Field(default=8, env="S3_MULTIPART_THRESHOLD_MB")
+    s3_multipart_chunk_mb: int = Field(default=8, env="S3_MULTIPART_CHUNK_MB")
+    s3_max_concurrency: int = Field(default=10, env="S3_MAX_CONCURRENCY")
+    s3_serve_mode: str = Field(default="redirect", env="S3_SERVE_MODE")  # redirect (URL prefirmada) o stream
+    s3_presign_expiration: int = Field(default=3600, env="S3_PRESIGN_EXPIRATION")
     
     # Download Limits
     max_concurrent_downloads: int = Field(default=20, env="MAX_CONCURRENT_DOWNLOADS")
     max_connections_per_host: int = Field(default=10, env="MAX_CONNECTIONS_PER_HOST")
+    simple_download_concurrent_documents: int = Field(default=8, env="SIMPLE_DOWNLOAD_CONCURRENT_DOCUMENTS")
     download_timeout: int = Field(default=30, env="DOWNLOAD_TIMEOUT")
     max_retries: int = Field(default=3, env="MAX_RETRIES")
     retry_delay: int = Field(default=1, env="RETRY_DELAY")
+    # Límite adaptativo (AIMD) por host: arranca en HOST_LIMIT_INITIAL y oscila
+    # entre HOST_LIMIT_MIN y MAX_CONNECTIONS_PER_HOST
+    host_limit_initial: int = Field(default=4, env="HOST_LIMIT_INITIAL")
+    host_limit_min: int = Field(default=1, env="HOST_LIMIT_MIN")
+    host_limit_increase: float = Field(default=1.0, env="HOST_LIMIT_INCREASE")
+    host_limit_decrease_factor: float = Field(default=0.5, env="HOST_LIMIT_DECREASE_FACTOR")
+    max_retry_after: int = Field(default=120, env="MAX_RETRY_AFTER")  # tope para Retry-After en segundos
+    download_trace_sample_rate: float = Field(default=0.01, env="DOWNLOAD_TRACE_SAMPLE_RATE")  # fracción de descargas con traza en el log
+    # Casi duplicados (dHash): distancia de Hamming máxima sobre 64 bits y qué
+    # hacer con los de un mismo documento ("flag" o "drop"); entre documentos solo se marcan
+    near_duplicate_detection: bool = Field(default=True, env="NEAR_DUPLICATE_DETECTION")
+    near_duplicate_threshold: int = Field(default=6, env="NEAR_DUPLICATE_THRESHOLD")
+    near_duplicate_action: Literal["flag", "drop"] = Field(default="flag", env="NEAR_DUPLICATE_ACTION")
+    # URLs de imágenes: deduplicar por imagen (sin tamaño ni parámetros de seguimiento) y,
+    # con IMAGE_URL_UPGRADE, pedir directamente la mayor versión que ofrece el CDN
+    image_url_canonicalize: bool = Field(default=True, env="IMAGE_URL_CANONICALIZE")
+    image_url_upgrade: bool = Field(default=False, env="IMAGE_URL_UPGRADE")
+    image_url_bstatic_rendition: str = Field(default="max1280x900", env="IMAGE_URL_BSTATIC_RENDITION")
+    
+    # Monitoring
+    metrics_cache_ttl: float = Field(default=15.0, env="METRICS_CACHE_TTL")  # segundos entre recálculos en /metrics
+    # Logging: escritura en un hilo con cola (LOG_QUEUE_SIZE=0 escribe directamente) y
+    # resúmenes cada LOG_SUMMARY_INTERVAL segundos en las rutas calientes
+    log_queue_size: int = Field(default=10000, env="LOG_QUEUE_SIZE")
+    log_summary_interval: float = Field(default=60.0, env="LOG_SUMMARY_INTERVAL")
+    log_sample_rate: float = Field(default=0.0, env="LOG_SAMPLE_RATE")  # fracción de eventos agregados que se escriben también uno a uno
+    log_rate_limit: int = Field(default=20, env="LOG_RATE_LIMIT")  # avisos iguales por intervalo antes de omitirlos
+    
+    # Jobs
+    job_cancel_check_interval: float = Field(default=2.0, env="JOB_CANCEL_CHECK_INTERVAL")
+    job_progress_flush_interval: float = Field(default=2.0, env="JOB_PROGRESS_FLUSH_INTERVAL")
+    job_max_errors: int = Field(default=100, env="JOB_MAX_ERRORS")
+    # Actualizaciones de documentos agrupadas en bulk_write (cada N documentos o T segundos)
+    document_update_batch_size: int = Field(default=100, env="DOCUMENT_UPDATE_BATCH_SIZE")
+    document_update_flush_interval: float = Field(default=5.0, env="DOCUMENT_UPDATE_FLUSH_INTERVAL")
+    
+    # Planificación de jobs: los bulk ocupan como mucho BULK_JOB_SLOTS huecos y se
+    # reparten por colección con pesos JOB_FLOW_WEIGHTS ({"db": 2, "db.coleccion": 0.5})
+    bulk_job_slots: int = Field(default=2, env="BULK_JOB_SLOTS")
+    job_flow_weights: Dict[str, float] = Field(default={}, env="JOB_FLOW_WEIGHTS")
+    job_dispatch_interval: float = Field(default=15.0, env="JOB_DISPATCH_INTERVAL")
+    job_dispatch_scan_limit: int = Field(default=500, env="JOB_DISPATCH_SCAN_LIMIT")
+    # Dispatcher (app/workers/dispatcher.py): agrupa eventos del change stream y,
+    # sin replica set, sondea cada JOB_DISPATCH_POLL_INTERVAL segundos
+    job_dispatch_debounce: float = Field(default=0.5, env="JOB_DISPATCH_DEBOUNCE")
+    job_dispatch_poll_interval: float = Field(default=2.0, env="JOB_DISPATCH_POLL_INTERVAL")
+    job_requeue_after: int = Field(default=900, env="JOB_REQUEUE_AFTER")  # segundos encolado sin arrancar
+    job_max_runtime: int = Field(default=3600, env="JOB_MAX_RUNTIME")
+    # Un job de documento pedido mientras su colección se descarga se une a ese job
+    job_coalesce_documents: bool = Field(default=True, env="JOB_COALESCE_DOCUMENTS")
     
-    # Processing (preparado para futuro)
+    # Processing
     enable_webp_conversion: bool = Field(default=False, env="ENABLE_WEBP_CONVERSION")
     enable_optimization: bool = Field(default=False, env="ENABLE_OPTIMIZATION")
     jpeg_quality: int = Field(default=85, env="JPEG_QUALITY")
     webp_quality: int = Field(default=85, env="WEBP_QUALITY")
+    avif_quality: int = Field(default=60, env="AVIF_QUALITY")
     
-    # Webhook
+    # Derivados responsive (se generan en la cola "processing" tras la descarga)
+    enable_derivatives: bool = Field(default=False, env="ENABLE_DERIVATIVES")
+    derivative_sizes: List[str] = Field(
+        default=["thumbnail:320", "medium:1024"],
+        env="DERIVATIVE_SIZES"
+    )
+    derivative_formats: List[str] = Field(default=["webp", "avif"], env="DERIVATIVE_FORMATS")
+    processing_workers: int = Field(default=0, env="PROCESSING_WORKERS")  # 0 = un proceso por CPU
+    
+    # Variantes al vuelo (?w=&h=&fmt=&q= en /images)
+    derivative_cache_path: Path = Field(default=Path("/var/cache/images-service"), env="DERIVATIVE_CACHE_PATH")
+    derivative_cache_max_mb: int = Field(default=1024, env="DERIVATIVE_CACHE_MAX_MB")
+    resize_max_dimension: int = Field(default=4096, env="RESIZE_MAX_DIMENSION")
+    
+    # Servido de imágenes
+    serve_max_age: int = Field(default=86400, env="SERVE_MAX_AGE")
+    serve_immutable_max_age: int = Field(default=31536000, env="SERVE_IMMUTABLE_MAX_AGE")  # nombres con hash de contenido
+    accel_redirect_prefix: Optional[str] = Field(default=None, env="ACCEL_REDIRECT_PREFIX")  # location internal de nginx para STORAGE_PATH
+    accel_redirect_cache_prefix: Optional[str] = Field(default=None, env="ACCEL_REDIRECT_CACHE_PREFIX")  # ídem para DERIVATIVE_CACHE_PATH
+    
+    # Webhook: los eventos se guardan en MongoDB y los entrega app/workers/webhooks.py
+    # (WEBHOOK_BATCH_SIZE > 1 agrupa los eventos de un endpoint en {"events": [...]})
     webhook_url: Optional[str] = Field(default=None, env="WEBHOOK_URL")
+    webhook_timeout: float = Field(default=10.0, env="WEBHOOK_TIMEOUT")
+    webhook_batch_size: int = Field(default=1, env="WEBHOOK_BATCH_SIZE")
+    webhook_batch_window: float = Field(default=1.0, env="WEBHOOK_BATCH_WINDOW")  # segundos entre rondas de entrega
+    webhook_concurrency: int = Field(default=4, env="WEBHOOK_CONCURRENCY")  # peticiones simultáneas
+    webhook_max_attempts: int = Field(default=8, env="WEBHOOK_MAX_ATTEMPTS")
+    webhook_retry_base: float = Field(default=5.0, env="WEBHOOK_RETRY_BASE")  # backoff exponencial desde este valor
+    webhook_retry_max: float = Field(default=3600.0, env="WEBHOOK_RETRY_MAX")
+    webhook_retention_days: int = Field(default=7, env="WEBHOOK_RETENTION_DAYS")  # entregas terminadas que se conservan
     
     @validator("storage_path", pre=True)
     def validate_storage_path(cls, v):
@@ -99,6 +209,13 @@ class Settings(BaseSettings):
             return Path(v)
         return v
     
+    @validator("storage_type", pre=True)
+    def validate_storage_type(cls, v):
+        """Normaliza STORAGE_TYPE (S3, Local...) para compararlo en minúsculas"""
+        if isinstance(v, str):
+            return v.strip().lower()
+        return v
+    
     @validator("cors_origins", pre=True)
     def validate_cors_origins(cls, v):
         """Parsea CORS origins desde string si viene de env"""
@@ -106,6 +223,49 @@ class Settings(BaseSettings):
             return [origin.strip() for origin in v.split(",")]
         return v
     
+    @validator("derivative_sizes", "derivative_formats", pre=True)
+    def validate_derivative_lists(cls, v):
+        """Parsea listas separadas por comas si vienen de env"""
+        if isinstance(v, str):
+            return [item.strip().lower() for item in v.split(",") if item.strip()]
+        return v
+    
+    @validator("derivative_sizes")
+    def validate_derivative_sizes(cls, v):
+        """Solo tamaños con formato nombre:px y nombre conocido por ProcessedImages"""
+        for item in v:
+            name, _, max_side = item.partition(":")
+            if name not in DERIVATIVE_SIZE_NAMES or not max_side.isdigit():
+                raise ValueError(
+                    f"DERIVATIVE_SIZES: '{item}' no es válido "
+                    f"(nombre:px con nombre en {', '.join(DERIVATIVE_SIZE_NAMES)})"
+                )
+        return v
+    
+    @validator("derivative_formats")
+    def validate_derivative_formats(cls, v):
+        """Solo formatos que ProcessedImages puede registrar"""
+        for fmt in v:
+            if fmt not in DERIVATIVE_FORMAT_NAMES:
+                raise ValueError(
+                    f"DERIVATIVE_FORMATS: '{fmt}' no es válido (usar {', '.join(DERIVATIVE_FORMAT_NAMES)})"
+                )
+        return v
+    
+    @property
+    def derivative_size_map(self) -> Dict[str, int]:
+        """Tamaños de derivados como {nombre: lado_máximo_px}"""
+        sizes = {}
+        for item in self.derivative_sizes:
+            name, _, max_side = item.partition(":")
+            sizes[name] = int(max_side)
+        return sizes
+    
+    @property
+    def manifest_index_file(self) -> Path:
+        """Ruta de la base SQLite del índice de imágenes"""
+        return self.manifest_index_path or self.storage_path / ".manifest.sqlite"
+    
     @property
     def is_production(self) -> bool:
         """Verifica si está en producción"""
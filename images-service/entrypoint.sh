@@ -10,6 +10,12 @@ export MONGODB_URI=${MONGODB_URI:-mongodb://host.docker.internal:27017}
 export REDIS_URL=${REDIS_URL:-redis://redis:6379/0}
 export CELERY_BROKER_URL=${CELERY_BROKER_URL:-redis://redis:6379/0}
 export CELERY_RESULT_BACKEND=${CELERY_RESULT_BACKEND:-redis://redis:6379/0}
+export BULK_JOB_SLOTS=${BULK_JOB_SLOTS:-2}  # también es la concurrencia del worker de la cola "downloads"
+
+# Métricas de Prometheus compartidas entre la API y los workers de Celery
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus-multiproc}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
 
 echo "📋 Configuración:"
 echo "   API_PORT: $API_PORT"
@@ -0,0 +1,189 @@
+"""
+Micro-benchmark de HttpxService: cliente por petición frente a cliente compartido
+
+Levanta un servidor HTTP local (HTTP/1.1 con keep-alive, o HTTPS si se pasan
+--tls-cert/--tls-key) que sirve una página con H2 válidos y mide:
+
+- per_request: un httpx.AsyncClient nuevo por URL (comportamiento anterior)
+- shared: HttpxService.get_html con el cliente compartido del event loop
+- sync_per_request / sync_shared: lo mismo con get_html_sync
+
+Para cada escenario muestra peticiones por segundo, latencias p50/p95 y las
+conexiones TCP que ha tenido que abrir el servidor.
+
+Uso (desde scraper/):
+    python benchmarks/bench_httpx_service.py --requests 500 --concurrency 10 --latency-ms 5
+    
+    # Con TLS (el ahorro de handshakes es mayor):
+    openssl req -x509 -newkey rsa:2048 -nodes -days 1 -subj /CN=127.0.0.1 -keyout /tmp/key.pem -out /tmp/cert.pem
+    python benchmarks/bench_httpx_service.py --tls-cert /tmp/cert.pem --tls-key /tmp/key.pem
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List
+import argparse
+import asyncio
+import ssl
+import sys
+import threading
+import time
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.utils.httpx_service import HttpxConfig, HttpxService  # noqa: E402
+
+
+PAGE = (
+    "<html><head><title>Benchmark</title>"
+    "<meta name=\"description\" content=\"Página de prueba\"></head><body>"
+    "<h1>Hotel Benchmark</h1>"
+    + "".join(f"<h2>Sección {i}</h2><p>{'Lorem ipsum dolor sit amet. ' * 20}</p>" for i in range(20))
+    + "</body></html>"
+).encode()
+
+
+class PageServer(ThreadingHTTPServer):
+    """Servidor local que cuenta las conexiones abiertas"""
+    
+    daemon_threads = True
+    
+    def __init__(self, address, latency: float):
+        super().__init__(address, PageHandler)
+        self.latency = latency
+        self.connections = 0
+        self._lock = threading.Lock()
+    
+    def process_request(self, request, client_address):
+        with self._lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Cabeceras y cuerpo van en escrituras separadas: sin esto Nagle añade ~40 ms
+    disable_nagle_algorithm = True
+    
+    def do_GET(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(PAGE)))
+        self.end_headers()
+        self.wfile.write(PAGE)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(latency_ms: float, cert: str = None, key: str = None) -> PageServer:
+    """Arranca el servidor en un hilo y devuelve la instancia"""
+    server = PageServer(("127.0.0.1", 0), latency_ms / 1000)
+    if cert:
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(cert, key)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def run_async(fetch: Callable, urls: List[str], concurrency: int) -> List[float]:
+    """Lanza las peticiones con concurrencia limitada y devuelve las latencias"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    
+    async def one(url: str) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            result, _ = await fetch(url)
+            if not result.get("success"):
+                raise RuntimeError(f"Petición fallida: {result}")
+            latencies.append(time.perf_counter() - started)
+    
+    await asyncio.gather(*(one(url) for url in urls))
+    return latencies
+
+
+def run_sync(fetch: Callable, urls: List[str]) -> List[float]:
+    """Peticiones secuenciales (como los usos síncronos del scraper)"""
+    latencies = []
+    for url in urls:
+        started = time.perf_counter()
+        result, _ = fetch(url)
+        if not result.get("success"):
+            raise RuntimeError(f"Petición fallida: {result}")
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=5, help="Latencia simulada del servidor")
+    parser.add_argument("--tls-cert", help="Certificado para servir HTTPS")
+    parser.add_argument("--tls-key", help="Clave privada del certificado")
+    args = parser.parse_args()
+    
+    server = start_server(args.latency_ms, args.tls_cert, args.tls_key)
+    scheme = "https" if args.tls_cert else "http"
+    base_url = f"{scheme}://127.0.0.1:{server.server_address[1]}"
+    urls = [f"{base_url}/page/{i}" for i in range(args.requests)]
+    
+    # Certificado autofirmado: sin verificación en ambos escenarios
+    verify = not args.tls_cert
+    config = HttpxConfig(timeout=30, max_keepalive_connections=args.concurrency, verify=verify)
+    service = HttpxService(config)
+    
+    async def per_request(url: str):
+        async with httpx.AsyncClient(timeout=config.timeout, verify=verify) as client:
+            response = await client.get(url)
+            blocked, reason = service._check_if_blocked(response.text, response.status_code, url)
+            return {"success": not blocked, "error": reason}, response.text
+    
+    def sync_per_request(url: str):
+        with httpx.Client(timeout=config.timeout, verify=verify) as client:
+            response = client.get(url)
+            blocked, reason = service._check_if_blocked(response.text, response.status_code, url)
+            return {"success": not blocked, "error": reason}, response.text
+    
+    async def shared_scenario() -> List[float]:
+        try:
+            return await run_async(service.get_html, urls, args.concurrency)
+        finally:
+            await service.aclose()
+    
+    scenarios: Dict[str, Callable[[], List[float]]] = {
+        "per_request": lambda: asyncio.run(run_async(per_request, urls, args.concurrency)),
+        "shared": lambda: asyncio.run(shared_scenario()),
+        "sync_per_request": lambda: run_sync(sync_per_request, urls),
+        "sync_shared": lambda: run_sync(service.get_html_sync, urls)
+    }
+    
+    print(f"{args.requests} peticiones a {base_url}, concurrencia {args.concurrency} (las síncronas en serie)")
+    print(f"{'escenario':<18} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'conexiones':>11}")
+    for name, scenario in scenarios.items():
+        connections_before = server.connections
+        started = time.perf_counter()
+        latencies = scenario()
+        elapsed = time.perf_counter() - started
+        print(
+            f"{name:<18} {len(latencies) / elapsed:>9.1f} "
+            f"{percentile(latencies, 0.5) * 1000:>9.2f} {percentile(latencies, 0.95) * 1000:>9.2f} "
+            f"{server.connections - connections_before:>11}"
+        )
+    
+    service.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,9 @@
 import logging
 from typing import List, Dict, Any, Optional, Callable
 import asyncio
-from rebrowser_playwright.async_api import async_playwright
 from bs4 import BeautifulSoup
 from services.utils.httpx_service import HttpxService, create_stealth_httpx_config
+from services.utils.browser_pool import get_browser_pool
 
 logger = logging.getLogger(__name__)
 
@@ -23,21 +23,26 @@ class GoogleExtraerDatosService:
         data_list = json_data if isinstance(json_data, list) else [json_data]
         all_results = []
 
-        for item in data_list:
-            if not isinstance(item, dict):
-                continue
+        try:
+            for item in data_list:
+                if not isinstance(item, dict):
+                    continue
 
-            context = {
-                "busqueda": item.get("busqueda", ""),
-                "idioma": item.get("idioma", ""),
-                "region": item.get("region", ""),
-                "dominio": item.get("dominio", ""),
-                "url_busqueda": item.get("url_busqueda", "")
-            }
+                context = {
+                    "busqueda": item.get("busqueda", ""),
+                    "idioma": item.get("idioma", ""),
+                    "region": item.get("region", ""),
+                    "dominio": item.get("dominio", ""),
+                    "url_busqueda": item.get("url_busqueda", "")
+                }
 
-            urls = self._extract_urls_from_item(item)
-            resultados = await self._scrape_urls_with_fallback(urls, max_concurrent, progress_callback)
-            all_results.append({**context, "resultados": resultados})
+                urls = self._extract_urls_from_item(item)
+                resultados = await self._scrape_urls_with_fallback(urls, max_concurrent, progress_callback)
+                all_results.append({**context, "resultados": resultados})
+        finally:
+            # Todas las búsquedas comparten conexiones y navegadores; se cierran
+            # al terminar porque la interfaz crea un event loop nuevo en cada ejecución
+            await self.httpx_service.aclose()
 
         return all_results
 
@@ -97,12 +102,9 @@ class GoogleExtraerDatosService:
 
                 # 2. Si httpx falla, usar rebrowser-playwright
                 try:
-                    async with async_playwright() as p:
-                        browser = await p.chromium.launch()
-                        page = await browser.new_page()
+                    async with get_browser_pool().page() as page:
                         await page.goto(url)
                         html = await page.content()
-                        await browser.close()
                     soup = BeautifulSoup(html, "html.parser")
                     title = soup.title.string.strip() if soup.title else ""
                     meta = soup.find("meta", attrs={"name": "description"})
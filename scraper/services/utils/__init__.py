@@ -17,6 +17,13 @@ from .httpx_service import (
     create_aggressive_httpx_config
 )
 
+from .browser_pool import (
+    BrowserPool,
+    BrowserPoolConfig,
+    get_browser_pool,
+    close_browser_pool
+)
+
 __all__ = [
     # 'PlaywrightService',
     # 'PlaywrightConfig',
@@ -27,5 +34,9 @@ __all__ = [
     'HttpxConfig',
     'create_fast_httpx_config',
     'create_stealth_httpx_config',
-    'create_aggressive_httpx_config'
+    'create_aggressive_httpx_config',
+    'BrowserPool',
+    'BrowserPoolConfig',
+    'get_browser_pool',
+    'close_browser_pool'
 ]
@@ -0,0 +1,307 @@
+"""
+Pool de navegadores rebrowser-playwright para el fallback de httpx
+
+Arrancar Chromium cuesta segundos y cientos de MB; con el pool cada fallback
+cuesta un contexto nuevo y una navegación:
+
+- Hasta `size` navegadores de larga duración, que se lanzan bajo demanda
+- Cada navegador atiende como mucho `max_concurrent_pages` páginas a la vez
+- Solo se reutiliza el navegador: cada préstamo abre un contexto nuevo y lo
+  cierra al devolverlo, así cookies, localStorage/sessionStorage, caché,
+  service workers y permisos de una URL no llegan a la siguiente
+- Tras `max_pages_per_browser` páginas el navegador se recicla (se cierra
+  cuando termina su última página y se lanza otro), para acotar la memoria
+- Los navegadores desconectados (crash) se detectan y se sustituyen
+
+Los objetos de Playwright pertenecen a un event loop: hay un pool por loop
+(get_browser_pool) y hay que cerrarlo al terminar (close_browser_pool o
+HttpxService.aclose).
+
+Uso:
+    pool = get_browser_pool()
+    async with pool.page() as page:
+        await page.goto(url)
+        html = await page.content()
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BrowserPoolConfig:
+    """Configuración del pool de navegadores"""
+    def __init__(
+        self,
+        size: int = 2,
+        max_concurrent_pages: int = 4,
+        max_pages_per_browser: int = 100,
+        headless: bool = True,
+        browser_args: Optional[List[str]] = None,
+        context_options: Optional[Dict[str, Any]] = None,
+        launch_timeout: int = 30000
+    ):
+        self.size = size
+        self.max_concurrent_pages = max_concurrent_pages
+        self.max_pages_per_browser = max_pages_per_browser
+        self.headless = headless
+        self.browser_args = browser_args if browser_args is not None else ["--no-sandbox"]
+        self.context_options = context_options or {}
+        self.launch_timeout = launch_timeout
+
+
+class _BrowserSlot:
+    """Un navegador del pool y su estado"""
+    
+    def __init__(self, index: int):
+        self.index = index
+        self.browser = None
+        self.started = False  # Lanzado o lanzándose
+        self.active = 0
+        self.served = 0
+        self.draining = False  # Reciclando: no acepta más páginas
+        self.launch_lock = asyncio.Lock()
+    
+    def reset(self) -> Any:
+        """Deja el hueco libre y devuelve el navegador a cerrar"""
+        browser = self.browser
+        self.browser = None
+        self.started = False
+        self.served = 0
+        self.draining = False
+        return browser
+
+
+class BrowserPool:
+    """Navegadores Chromium reutilizables con préstamo de páginas"""
+    
+    def __init__(self, config: Optional[BrowserPoolConfig] = None):
+        self.config = config or BrowserPoolConfig()
+        self._playwright = None
+        self._slots = [_BrowserSlot(i) for i in range(max(1, self.config.size))]
+        self._condition = asyncio.Condition()
+        self._closed = False
+        self.stats = {"leases": 0, "launches": 0, "recycled": 0, "crashed": 0}
+    
+    @asynccontextmanager
+    async def page(self) -> AsyncIterator[Any]:
+        """
+        Presta una página lista para navegar
+        
+        La página vive en un contexto propio que se cierra al salir del bloque.
+        """
+        slot = await self._acquire_slot()
+        context = None
+        try:
+            context, page = await self._open_page(slot)
+            yield page
+        finally:
+            await self._release(slot, context)
+
+    @asynccontextmanager
+    async def browser(self) -> AsyncIterator[Any]:
+        """
+        Presta un navegador del pool para quien abre sus propias páginas
+
+        Cuenta como una página para la concurrencia y el reciclado; las
+        páginas abiertas en el bloque deben cerrarse antes de salir.
+        """
+        slot = await self._acquire_slot()
+        try:
+            yield await self._ensure_browser(slot)
+        finally:
+            await self._release(slot, None)
+
+    async def get_html(
+        self,
+        url: str,
+        wait_until: str = "domcontentloaded",
+        timeout: int = 30000
+    ) -> Tuple[Dict[str, Any], str]:
+        """
+        Obtiene el HTML de una URL con un navegador del pool
+        
+        Returns:
+            Tupla con (resultado_dict, html_content), como HttpxService.get_html
+        """
+        try:
+            async with self.page() as page:
+                response = await page.goto(url, wait_until=wait_until, timeout=timeout)
+                html = await page.content()
+                status_code = response.status if response else 200
+            
+            return {
+                "success": True,
+                "url": url,
+                "status_code": status_code,
+                "html_length": len(html),
+                "method": "playwright"
+            }, html
+            
+        except Exception as e:
+            logger.warning(f"Error con Playwright para {url}: {e}")
+            return {
+                "error": f"Error_Playwright_{type(e).__name__}",
+                "url": url,
+                "details": str(e),
+                "method": "playwright"
+            }, ""
+    
+    async def close(self) -> None:
+        """Cierra todos los navegadores y Playwright"""
+        self._closed = True
+        async with self._condition:
+            detached = [slot.reset() for slot in self._slots]
+            self._condition.notify_all()
+        
+        for browser in detached:
+            await self._close_browser(browser)
+        
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+        
+        logger.info(f"🎭 Pool de navegadores cerrado: {self.stats}")
+    
+    async def __aenter__(self) -> "BrowserPool":
+        return self
+    
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+    
+    def _available_slot(self) -> Optional[_BrowserSlot]:
+        """
+        Hueco donde abrir la siguiente página
+        
+        Se prefieren navegadores ya lanzados con menos páginas activas; uno
+        nuevo solo se lanza cuando los demás están llenos.
+        """
+        candidates = [
+            slot for slot in self._slots
+            if not slot.draining and slot.active < self.config.max_concurrent_pages
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda slot: (not slot.started, slot.active))
+    
+    async def _acquire_slot(self) -> _BrowserSlot:
+        """Reserva sitio para una página (espera si el pool está lleno)"""
+        async with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("El pool de navegadores está cerrado")
+                slot = self._available_slot()
+                if slot is not None:
+                    break
+                await self._condition.wait()
+            
+            slot.started = True
+            slot.active += 1
+            slot.served += 1
+            if slot.served >= self.config.max_pages_per_browser:
+                slot.draining = True
+            self.stats["leases"] += 1
+            return slot
+    
+    async def _open_page(self, slot: _BrowserSlot) -> Tuple[Any, Any]:
+        """Página nueva en un contexto nuevo del navegador del hueco"""
+        browser = await self._ensure_browser(slot)
+        
+        context = await browser.new_context(**self.config.context_options)
+        try:
+            page = await context.new_page()
+        except Exception:
+            await self._close_context(context)
+            raise
+        return context, page
+    
+    async def _ensure_browser(self, slot: _BrowserSlot):
+        """Lanza el navegador del hueco si no está en marcha"""
+        async with slot.launch_lock:
+            if slot.browser is not None and slot.browser.is_connected():
+                return slot.browser
+            
+            if self._playwright is None:
+                from rebrowser_playwright.async_api import async_playwright
+                self._playwright = await async_playwright().start()
+            
+            browser = await self._playwright.chromium.launch(
+                headless=self.config.headless,
+                args=self.config.browser_args,
+                timeout=self.config.launch_timeout
+            )
+            browser.on("disconnected", lambda _: self._on_disconnected(slot, browser))
+            slot.browser = browser
+            self.stats["launches"] += 1
+            logger.info(f"🎭 Navegador {slot.index} lanzado para el pool")
+            return browser
+    
+    def _on_disconnected(self, slot: _BrowserSlot, browser) -> None:
+        """El navegador se cerró o se cayó: el hueco se relanza en el siguiente préstamo"""
+        if slot.browser is browser and not self._closed:
+            logger.warning(f"🎭 Navegador {slot.index} desconectado, se relanzará")
+            self.stats["crashed"] += 1
+            slot.browser = None
+    
+    async def _release(self, slot: _BrowserSlot, context) -> None:
+        """Cierra el contexto prestado y recicla el navegador si le toca"""
+        if context is not None:
+            await self._close_context(context)
+        
+        to_close = None
+        async with self._condition:
+            slot.active -= 1
+            if slot.draining and slot.active == 0:
+                to_close = slot.reset()
+                self.stats["recycled"] += 1
+                logger.info(f"♻️ Navegador {slot.index} reciclado tras {self.config.max_pages_per_browser} páginas")
+            self._condition.notify_all()
+        
+        if to_close is not None:
+            await self._close_browser(to_close)
+    
+    @staticmethod
+    async def _close_context(context) -> None:
+        try:
+            await context.close()
+        except Exception:
+            pass
+    
+    async def _close_browser(self, browser) -> None:
+        """Cierra un navegador sacado del pool"""
+        if browser is not None:
+            try:
+                await browser.close()
+            except Exception as e:
+                logger.debug(f"Error cerrando navegador del pool: {e}")
+
+
+# Un pool por event loop (los objetos de Playwright no pasan de un loop a otro)
+_pools: Dict[asyncio.AbstractEventLoop, BrowserPool] = {}
+
+
+def get_browser_pool(config: Optional[BrowserPoolConfig] = None) -> BrowserPool:
+    """
+    Pool de navegadores del event loop actual
+    
+    Args:
+        config: Configuración si el pool todavía no existe (se ignora si ya existe)
+    """
+    loop = asyncio.get_running_loop()
+    for closed in [other for other in _pools if other.is_closed()]:
+        del _pools[closed]
+    
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = BrowserPool(config)
+        _pools[loop] = pool
+    return pool
+
+
+async def close_browser_pool() -> None:
+    """Cierra el pool del event loop actual, si se llegó a crear"""
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.close()
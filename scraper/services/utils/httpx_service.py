@@ -2,9 +2,19 @@
 Servicio de HTTPX para scraping rápido con fallback a Playwright
 Intenta primero con httpx (más rápido) y usa Playwright solo cuando es necesario
 rebrowser-playwright maneja automáticamente todas las medidas anti-bot
+
+Las peticiones comparten clientes httpx (SharedHttpxClients): uno asíncrono
+por event loop y uno síncrono por proceso, así las conexiones TCP/TLS se
+reutilizan entre URLs (keep-alive y, si está instalado h2, HTTP/2). Las
+cookies no se comparten: cada petición lleva su propio tarro, que vive lo
+que duran sus redirecciones (send_with_cookies).
 """
 import httpx
 import asyncio
+import atexit
+import importlib.util
+import threading
+from http.cookiejar import DefaultCookiePolicy
 from typing import List, Dict, Optional, Tuple, Any, Callable
 from bs4 import BeautifulSoup
 import logging
@@ -12,6 +22,10 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+# HTTP/2 necesita el paquete h2 (httpx[http2]); sin él se usa HTTP/1.1
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
 class HttpxConfig:
     """Configuración básica para las solicitudes HTTPX"""
     def __init__(
@@ -19,12 +33,193 @@ class HttpxConfig:
         timeout: int = 30,
         follow_redirects: bool = True,
         max_redirects: int = 10,
-        extra_headers: Optional[Dict[str, str]] = None
+        extra_headers: Optional[Dict[str, str]] = None,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = True,
+        verify: bool = True
     ):
         self.timeout = timeout
         self.follow_redirects = follow_redirects
         self.max_redirects = max_redirects
         self.extra_headers = extra_headers or {}
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2
+        self.verify = verify
+    
+    def pool_key(self) -> Tuple:
+        """
+        Parámetros que definen el cliente compartido
+        
+        Timeout, cabeceras y redirecciones se pasan en cada petición, así que
+        configuraciones que solo se diferencian en eso comparten conexiones.
+        """
+        return (
+            self.max_connections,
+            self.max_keepalive_connections,
+            self.keepalive_expiry,
+            self.http2 and HTTP2_AVAILABLE,
+            self.max_redirects,
+            self.verify
+        )
+    
+    def client_options(self) -> Dict[str, Any]:
+        """Argumentos para crear el cliente httpx"""
+        return {
+            "limits": httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry
+            ),
+            "http2": self.http2 and HTTP2_AVAILABLE,
+            "max_redirects": self.max_redirects,
+            "verify": self.verify,
+            "timeout": self.timeout
+        }
+
+
+def _disable_cookies(client) -> None:
+    """
+    Evita que el tarro del cliente compartido guarde cookies
+    
+    Lo usan a la vez peticiones a URLs distintas: las cookies de cada una van
+    en su propio tarro (send_with_cookies) y no pasan a las demás.
+    """
+    client.cookies.jar.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+
+def _next_request(
+    response: httpx.Response,
+    cookies: httpx.Cookies,
+    history: List[httpx.Response],
+    max_redirects: int
+) -> Optional[httpx.Request]:
+    """Siguiente salto de la redirección con las cookies recibidas hasta ahora"""
+    cookies.extract_cookies(response)
+    request = response.next_request
+    if request is None:
+        return None
+    
+    if len(history) >= max_redirects:
+        raise httpx.TooManyRedirects("Exceeded maximum allowed redirects.", request=request)
+    history.append(response)
+    cookies.set_cookie_header(request)
+    return request
+
+
+async def send_with_cookies(
+    client: httpx.AsyncClient,
+    request: httpx.Request,
+    follow_redirects: bool = True
+) -> httpx.Response:
+    """
+    Envía una petición con un tarro de cookies propio
+    
+    Las redirecciones se siguen aquí y no en httpx: así las cookies que pone
+    un salto (p. ej. una página de consentimiento) llegan a los siguientes,
+    como con un cliente por petición, sin guardarse en el cliente compartido.
+    """
+    cookies = httpx.Cookies()
+    history: List[httpx.Response] = []
+    while True:
+        response = await client.send(request, follow_redirects=False)
+        if not follow_redirects:
+            return response
+        request = _next_request(response, cookies, history, client.max_redirects)
+        if request is None:
+            response.history = history
+            return response
+        await response.aclose()
+
+
+def send_with_cookies_sync(
+    client: httpx.Client,
+    request: httpx.Request,
+    follow_redirects: bool = True
+) -> httpx.Response:
+    """Versión síncrona de send_with_cookies"""
+    cookies = httpx.Cookies()
+    history: List[httpx.Response] = []
+    while True:
+        response = client.send(request, follow_redirects=False)
+        if not follow_redirects:
+            return response
+        request = _next_request(response, cookies, history, client.max_redirects)
+        if request is None:
+            response.history = history
+            return response
+        response.close()
+
+
+class SharedHttpxClients:
+    """
+    Clientes httpx compartidos entre todas las instancias de HttpxService
+    
+    - Asíncronos: uno por event loop y pool_key (un AsyncClient no se puede
+      usar desde otro loop). Los de loops ya cerrados se descartan.
+    - Síncronos: uno por pool_key para todo el proceso (httpx.Client es
+      seguro entre hilos).
+    """
+    
+    def __init__(self):
+        self._async_clients: Dict[asyncio.AbstractEventLoop, Dict[Tuple, httpx.AsyncClient]] = {}
+        self._sync_clients: Dict[Tuple, httpx.Client] = {}
+        self._lock = threading.Lock()
+    
+    def get_async(self, config: HttpxConfig) -> httpx.AsyncClient:
+        """Cliente asíncrono del event loop actual"""
+        loop = asyncio.get_running_loop()
+        key = config.pool_key()
+        
+        with self._lock:
+            # Los loops cerrados ya no pueden usar (ni cerrar) sus clientes
+            for closed in [other for other in self._async_clients if other.is_closed()]:
+                del self._async_clients[closed]
+            
+            clients = self._async_clients.setdefault(loop, {})
+            client = clients.get(key)
+            if client is None or client.is_closed:
+                client = httpx.AsyncClient(**config.client_options())
+                _disable_cookies(client)
+                clients[key] = client
+                logger.debug(f"Cliente httpx asíncrono creado (http2={config.http2 and HTTP2_AVAILABLE})")
+            return client
+    
+    def get_sync(self, config: HttpxConfig) -> httpx.Client:
+        """Cliente síncrono compartido por el proceso"""
+        key = config.pool_key()
+        
+        with self._lock:
+            client = self._sync_clients.get(key)
+            if client is None or client.is_closed:
+                client = httpx.Client(**config.client_options())
+                _disable_cookies(client)
+                self._sync_clients[key] = client
+                logger.debug(f"Cliente httpx síncrono creado (http2={config.http2 and HTTP2_AVAILABLE})")
+            return client
+    
+    async def aclose(self) -> None:
+        """Cierra los clientes asíncronos del event loop actual"""
+        with self._lock:
+            clients = self._async_clients.pop(asyncio.get_running_loop(), {})
+        for client in clients.values():
+            await client.aclose()
+    
+    def close(self) -> None:
+        """Cierra los clientes síncronos"""
+        with self._lock:
+            clients = list(self._sync_clients.values())
+            self._sync_clients.clear()
+        for client in clients:
+            client.close()
+
+
+# Instancia global: las conexiones se comparten entre servicios
+shared_clients = SharedHttpxClients()
+atexit.register(shared_clients.close)
 
 
 class HttpxService:
@@ -33,6 +228,22 @@ class HttpxService:
     def __init__(self, config: Optional[HttpxConfig] = None):
         self.config = config or HttpxConfig()
     
+    async def aclose(self) -> None:
+        """
+        Cierra las conexiones y el pool de navegadores del event loop actual
+        
+        Llamar al terminar el trabajo de un loop que no se va a reutilizar
+        (por ejemplo, el loop creado para una acción de la interfaz).
+        """
+        await shared_clients.aclose()
+        
+        from services.utils.browser_pool import close_browser_pool
+        await close_browser_pool()
+    
+    def close(self) -> None:
+        """Cierra las conexiones síncronas (también se hace al salir del proceso)"""
+        shared_clients.close()
+    
     def _check_if_blocked(self, html: str, status_code: int, url: str) -> Tuple[bool, str]:
         """
         Verifica si la respuesta necesita Playwright
@@ -103,38 +314,34 @@ class HttpxService:
         config = config or self.config
         
         try:
-            # Cliente HTTPX básico sin medidas anti-bot
-            async with httpx.AsyncClient(
-                timeout=config.timeout,
-                follow_redirects=config.follow_redirects,
-                max_redirects=config.max_redirects,
-                headers=config.extra_headers
-            ) as client:
-                response = await client.get(url)
-                html = response.text
-                
-                # Verificar si necesita Playwright
-                needs_playwright, reason = self._check_if_blocked(html, response.status_code, url)
-                
-                if not needs_playwright and response.status_code == 200:
-                    # Éxito con httpx
-                    return {
-                        "success": True,
-                        "url": url,
-                        "status_code": response.status_code,
-                        "html_length": len(html),
-                        "method": "httpx"
-                    }, html
-                else:
-                    # Necesita Playwright
-                    return {
-                        "error": reason or f"Status_{response.status_code}",
-                        "url": url,
-                        "status_code": response.status_code,
-                        "details": f"Necesita Playwright: {reason}",
-                        "method": "httpx",
-                        "needs_playwright": True
-                    }, ""
+            # Cliente HTTPX compartido, sin medidas anti-bot
+            client = shared_clients.get_async(config)
+            request = client.build_request("GET", url, headers=config.extra_headers, timeout=config.timeout)
+            response = await send_with_cookies(client, request, config.follow_redirects)
+            html = response.text
+            
+            # Verificar si necesita Playwright
+            needs_playwright, reason = self._check_if_blocked(html, response.status_code, url)
+            
+            if not needs_playwright and response.status_code == 200:
+                # Éxito con httpx
+                return {
+                    "success": True,
+                    "url": url,
+                    "status_code": response.status_code,
+                    "html_length": len(html),
+                    "method": "httpx"
+                }, html
+            else:
+                # Necesita Playwright
+                return {
+                    "error": reason or f"Status_{response.status_code}",
+                    "url": url,
+                    "status_code": response.status_code,
+                    "details": f"Necesita Playwright: {reason}",
+                    "method": "httpx",
+                    "needs_playwright": True
+                }, ""
                     
         except httpx.TimeoutException as e:
             logger.warning(f"Timeout con httpx para {url}: {e}")
@@ -174,40 +381,34 @@ class HttpxService:
             Tupla con (resultado_dict, html_content)
         """
         config = config or self.config
-        if timeout:
-            config.timeout = timeout
         
         try:
-            # Cliente HTTPX básico sin medidas anti-bot
-            with httpx.Client(
-                timeout=config.timeout,
-                follow_redirects=config.follow_redirects,
-                max_redirects=config.max_redirects,
-                headers=config.extra_headers
-            ) as client:
-                response = client.get(url)
-                html = response.text
-                
-                # Verificar si necesita Playwright
-                needs_playwright, reason = self._check_if_blocked(html, response.status_code, url)
-                
-                if not needs_playwright and response.status_code == 200:
-                    return {
-                        "success": True,
-                        "url": url,
-                        "status_code": response.status_code,
-                        "html_length": len(html),
-                        "method": "httpx_sync"
-                    }, html
-                else:
-                    return {
-                        "error": reason or f"Status_{response.status_code}",
-                        "url": url,
-                        "status_code": response.status_code,
-                        "details": f"Necesita Playwright: {reason}",
-                        "method": "httpx_sync",
-                        "needs_playwright": True
-                    }, ""
+            # Cliente HTTPX compartido, sin medidas anti-bot
+            client = shared_clients.get_sync(config)
+            request = client.build_request("GET", url, headers=config.extra_headers, timeout=timeout or config.timeout)
+            response = send_with_cookies_sync(client, request, config.follow_redirects)
+            html = response.text
+            
+            # Verificar si necesita Playwright
+            needs_playwright, reason = self._check_if_blocked(html, response.status_code, url)
+            
+            if not needs_playwright and response.status_code == 200:
+                return {
+                    "success": True,
+                    "url": url,
+                    "status_code": response.status_code,
+                    "html_length": len(html),
+                    "method": "httpx_sync"
+                }, html
+            else:
+                return {
+                    "error": reason or f"Status_{response.status_code}",
+                    "url": url,
+                    "status_code": response.status_code,
+                    "details": f"Necesita Playwright: {reason}",
+                    "method": "httpx_sync",
+                    "needs_playwright": True
+                }, ""
                     
         except httpx.TimeoutException as e:
             logger.warning(f"Timeout con httpx para {url}: {e}")
@@ -251,8 +452,6 @@ class HttpxService:
             httpx.Response object
         """
         config = self.config
-        if timeout:
-            config.timeout = timeout
         
         # Combinar headers
         request_headers = config.extra_headers.copy()
@@ -260,13 +459,16 @@ class HttpxService:
             request_headers.update(headers)
         
         try:
-            with httpx.Client(
-                timeout=config.timeout,
-                follow_redirects=config.follow_redirects,
-                headers=request_headers
-            ) as client:
-                response = client.post(url, data=data, json=json)
-                return response
+            client = shared_clients.get_sync(config)
+            request = client.build_request(
+                "POST",
+                url,
+                data=data,
+                json=json,
+                headers=request_headers,
+                timeout=timeout or config.timeout
+            )
+            return send_with_cookies_sync(client, request, config.follow_redirects)
         except Exception as e:
             logger.error(f"Error en POST a {url}: {e}")
             raise
@@ -275,7 +477,7 @@ class HttpxService:
         self,
         urls: List[str],
         process_func: Callable,
-        playwright_service: Any,  # PlaywrightService instance
+        playwright_service: Any = None,  # PlaywrightService instance
         config: Optional[HttpxConfig] = None,
         playwright_config: Optional[Any] = None,
         max_concurrent: int = 5,
@@ -285,12 +487,18 @@ class HttpxService:
         Procesa múltiples URLs primero con HTTPX, con fallback a Playwright.
         Mantiene el orden original de las URLs.
         
+        Las peticiones httpx reutilizan las conexiones del event loop actual y
+        el fallback usa el pool de navegadores del loop (get_browser_pool);
+        quien crea el loop debe llamar a aclose() cuando ya no lo vaya a usar.
+        
         Args:
             urls: Lista de URLs a procesar
             process_func: Función para procesar cada resultado (url, html, method) -> result
-            playwright_service: Instancia del servicio Playwright para fallback
+            playwright_service: Servicio Playwright opcional para el fallback; recibe
+                un navegador del pool. Sin él se usa BrowserPool.get_html
             config: Configuración opcional de HTTPX
-            playwright_config: Configuración opcional de Playwright
+            playwright_config: Configuración opcional de Playwright (headless y
+                browser_args del pool si todavía no existe)
             max_concurrent: Número máximo de requests concurrentes
             progress_callback: Callback para reportar progreso
             
@@ -308,6 +516,19 @@ class HttpxService:
         semaphore = asyncio.Semaphore(max_concurrent)
         
         import random
+        from services.utils.browser_pool import BrowserPoolConfig, get_browser_pool
+        
+        browser_pool = get_browser_pool(BrowserPoolConfig(
+            headless=playwright_config.headless,
+            browser_args=playwright_config.browser_args
+        ) if playwright_config else None)
+        
+        async def fetch_with_playwright(url: str) -> Tuple[Dict[str, Any], str]:
+            """HTML con un navegador del pool (sin lanzar uno por URL)"""
+            if playwright_service is None:
+                return await browser_pool.get_html(url)
+            async with browser_pool.browser() as browser:
+                return await playwright_service.get_html(url, browser, playwright_config)
 
         async def process_single_url(index: int, url: str):
             nonlocal completed_count
@@ -340,48 +561,26 @@ class HttpxService:
                         processed_result = await process_func(url, html, "httpx")
                         if processed_result.get("needs_playwright"):
                             logger.info(f"🔁 Reintentando con Playwright tras resultado sin headers: {url}")
-                            from rebrowser_playwright.async_api import async_playwright
-                            async with async_playwright() as p:
-                                browser = await p.chromium.launch(
-                                    headless=playwright_config.headless if playwright_config else True,
-                                    args=playwright_config.browser_args if playwright_config else ["--no-sandbox"]
-                                )
-                                try:
-                                    pw_result, pw_html = await playwright_service.get_html(
-                                        url, browser, playwright_config
-                                    )
-                                    if pw_result.get("success") and pw_html:
-                                        processed_result = await process_func(url, pw_html, "playwright")
-                                        results_dict[index] = processed_result
-                                    else:
-                                        results_dict[index] = pw_result
-                                finally:
-                                    await browser.close()
+                            pw_result, pw_html = await fetch_with_playwright(url)
+                            if pw_result.get("success") and pw_html:
+                                processed_result = await process_func(url, pw_html, "playwright")
+                                results_dict[index] = processed_result
+                            else:
+                                results_dict[index] = pw_result
                         else:
                             results_dict[index] = processed_result
                     elif result_dict.get("needs_playwright"):
                         # Necesita Playwright, usar el servicio de fallback
                         logger.info(f"🎭 Usando Playwright para {url} debido a: {result_dict.get('error')}")
                         
-                        # Obtener HTML con Playwright
-                        from rebrowser_playwright.async_api import async_playwright
-                        async with async_playwright() as p:
-                            browser = await p.chromium.launch(
-                                headless=playwright_config.headless if playwright_config else True,
-                                args=playwright_config.browser_args if playwright_config else ["--no-sandbox"]
-                            )
-                            try:
-                                pw_result, pw_html = await playwright_service.get_html(
-                                    url, browser, playwright_config
-                                )
-                                
-                                if pw_result.get("success") and pw_html:
-                                    processed_result = await process_func(url, pw_html, "playwright")
-                                    results_dict[index] = processed_result
-                                else:
-                                    results_dict[index] = pw_result
-                            finally:
-                                await browser.close()
+                        # Obtener HTML con un navegador del pool
+                        pw_result, pw_html = await fetch_with_playwright(url)
+                        
+                        if pw_result.get("success") and pw_html:
+                            processed_result = await process_func(url, pw_html, "playwright")
+                            results_dict[index] = processed_result
+                        else:
+                            results_dict[index] = pw_result
                     else:
                         # Error sin necesidad de Playwright
                         results_dict[index] = result_dict